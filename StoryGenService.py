@@ -1,6 +1,5 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-import anthropic
 import json
 import logging
 import os
@@ -8,7 +7,20 @@ from dotenv import load_dotenv
 from typing import Dict, Any
 import math
 import time
+import threading
+import hashlib
 import requests
+from llm_backends import create_anthropic_client
+from story_schema import normalize_story, normalize_character, log_issues
+from story_model import Story, StoryCache
+from json_responses import install_json_responses
+from story_compact import encode_compact, story_response
+from story_store import StoryStore
+from deadlines import Deadline, DeadlineExceeded, GenerationCancelled
+from job_scheduler import FairScheduler, PRIORITIES
+from story_estimator import ObservedRates, RequestLimits, CONTINUITY_CONTEXT_TOKENS, estimate_cost
+from provider_limits import estimate_request_tokens
+from message_batches import BATCH_MAX_ATTEMPTS, BATCH_MAX_REQUESTS, BATCH_POLL_INTERVAL, batch_results, submit_batch
 
 # Set up logging first
 logging.basicConfig(
@@ -841,11 +853,38 @@ Music Score Guidelines:
 """
 
 app = Flask(__name__)
+install_json_responses(app)
 
-# Initialize Anthropic client
-client = anthropic.Anthropic(
-    api_key=os.getenv('ANTHROPIC_API_KEY')
-)
+# Initialize Anthropic client (LLM_BACKEND=fake swaps in the offline stand-in)
+client = create_anthropic_client()
+
+# Result cache of compact stories keyed by prompt/genre/num_sequences (0 disables it)
+story_cache = StoryCache(int(os.getenv('STORY_CACHE_SIZE', '0')))
+
+# Durable job store with per-chunk checkpoints
+story_store = StoryStore(os.getenv('STORY_DB_PATH', 'stories.db'))
+
+# Output budget for one chunk call
+CHUNK_MAX_TOKENS = 4000
+
+# Observed chunk size/latency (for estimates) and per-request limits checked before any provider call
+story_rates = ObservedRates()
+request_limits = RequestLimits.from_env()
+
+# Output budget for /preview-story (movie_info and character only)
+PREVIEW_MAX_TOKENS = int(os.getenv('PREVIEW_MAX_TOKENS', '600'))
+
+# Jobs generating in this process
+active_jobs = set()
+active_jobs_lock = threading.Lock()
+
+# Worker slots shared by all story jobs: priority lanes, fair queuing per tenant
+job_scheduler = FairScheduler.from_env()
+
+# Provider Message Batches bypass the client-side limiter, which paces synchronous calls
+batch_client = create_anthropic_client(limited=False)
+provider_batch_worker = None
+provider_batch_lock = threading.Lock()
 
 def parse_json_response(response_text: str) -> Dict:
     """Parse JSON response using json module."""
@@ -863,8 +902,17 @@ def parse_json_response(response_text: str) -> Dict:
         logger.error(f"Error occurred at position: {e.pos if hasattr(e, 'pos') else 'unknown'}")
         raise
 
-def generate_story_chunk(client, prompt, chunk_number, total_chunks, previous_character=None, previous_sequence=None, genre=None):
-    """Generate a chunk of the story with continuity from previous chunks."""
+def create_message(client, deadline=None, **kwargs):
+    """client.messages.create, bounded by the request's deadline and cancelled with it."""
+    if deadline is None:
+        return client.messages.create(**kwargs)
+    timeout = deadline.timeout()
+    if timeout is not None:
+        kwargs['timeout'] = timeout
+    return deadline.call(client.messages.create, **kwargs)
+
+def build_chunk_prompt(prompt, chunk_number, total_chunks, previous_character=None, previous_sequence=None, genre=None, fixed_story=None):
+    """Build the user prompt for one chunk of the story."""
     
     # Define which part of the story this chunk represents based on 3-act structure
     story_progress = ""
@@ -1155,21 +1203,498 @@ VISUAL STORYTELLING REQUIREMENTS:
     if previous_sequence:
         chunk_prompt += f"\nLast sequence: {json.dumps(previous_sequence)}\n"
         chunk_prompt += f"\nContinue the visual style established in previous sequences while evolving it to match this part of the story."
+    if fixed_story:
+        chunk_prompt += f"\nThe {' and '.join(fixed_story)} are already written; build the sequences around them: {json.dumps(fixed_story)}"
+        chunk_prompt += f"\nDo not output {' or '.join(fixed_story)} again. Return only the remaining fields of the JSON structure.\n"
+    return chunk_prompt
+
+def chunk_message_params(prompt, chunk_number, total_chunks, previous_character=None, previous_sequence=None, genre=None, fixed_story=None):
+    """messages.create arguments for one chunk (shared by direct calls and provider batches)."""
+    chunk_prompt = build_chunk_prompt(prompt, chunk_number, total_chunks, previous_character,
+                                      previous_sequence, genre, fixed_story)
+    return {
+        'model': "claude-3-7-sonnet-20250219",
+        'max_tokens': CHUNK_MAX_TOKENS,
+        'temperature': 0.7,
+        'system': system_prompt,
+        'messages': [
+            {
+                "role": "user",
+                "content": chunk_prompt
+            }
+        ]
+    }
+
+def parse_story_chunk(message, chunk_number, fixed_story=None):
+    """Parse and normalize a chunk response, putting a preview's movie_info/character back in."""
+    parsed = parse_json_response(message.content[0].text)
+    if fixed_story and isinstance(parsed, dict):
+        parsed.update(fixed_story)
+    story, issues = normalize_story(parsed)
+    log_issues(issues, f"chunk {chunk_number}")
+    return story
+
+def generate_story_chunk(client, prompt, chunk_number, total_chunks, previous_character=None, previous_sequence=None, genre=None, fixed_story=None, deadline=None):
+    """Generate a chunk of the story with continuity from previous chunks.
     
-    message = client.messages.create(
+    fixed_story holds an already generated movie_info/character (from a
+    preview); the model is told to reuse it instead of writing its own.
+    """
+    start = time.perf_counter()
+    message = create_message(
+        client,
+        deadline,
+        **chunk_message_params(prompt, chunk_number, total_chunks, previous_character,
+                               previous_sequence, genre, fixed_story)
+    )
+    
+    story_rates.observe(message, time.perf_counter() - start)
+    return parse_story_chunk(message, chunk_number, fixed_story)
+
+def generate_story_preview(client, prompt, genre=None, deadline=None):
+    """Generate only movie_info and character, with a small token budget, for a first card."""
+    preview_prompt = f"""Create the movie_info and character for a story about: {prompt}
+"""
+    if genre:
+        preview_prompt += f"Genre: {genre.lower()}\n"
+    preview_prompt += """
+Write the synopsis only: return the JSON structure with movie_info and character and an empty "sequence" array.
+Do not write music_score or any sequences; they are generated later from this character."""
+    
+    message = create_message(
+        client,
+        deadline,
         model="claude-3-7-sonnet-20250219",
-        max_tokens=4000,
+        max_tokens=PREVIEW_MAX_TOKENS,
         temperature=0.7,
         system=system_prompt,
         messages=[
             {
                 "role": "user",
-                "content": chunk_prompt
+                "content": preview_prompt
+            }
+        ]
+    )
+    
+    parsed = parse_json_response(message.content[0].text)
+    if not isinstance(parsed, dict):
+        raise ValueError("Preview response is not a JSON object")
+    character, issues = normalize_character(parsed.get('character'))
+    log_issues(issues, "preview")
+    movie_info = parsed.get('movie_info')
+    return {
+        'movie_info': movie_info if isinstance(movie_info, dict) else {},
+        'character': character
+    }
+
+def generate_replacement_sequences(client, prompt, character, start, count, before=None, after=None, genre=None, act=None, deadline=None):
+    """Regenerate `count` sequences of a stored story, starting at sequence `start`.
+    
+    The character and the sequences on either side of the range are sent as
+    context so the replacement fits into the story without re-reading all of it.
+    """
+    end = start + count - 1
+    regen_prompt = f"""Rewrite part of an existing story about: {prompt}
+
+Replace sequences {start} to {end} with {count} new sequence(s), numbered {start} to {end}.
+"""
+    if act:
+        regen_prompt += f"These sequences are part of ACT {act} of a 3-act structure.\n"
+    if genre:
+        regen_prompt += f"Genre: {genre}\n"
+    regen_prompt += f"""
+Keep the character exactly as described; do not change any trait.
+Character details: {json.dumps(character)}
+"""
+    if before:
+        regen_prompt += f"\nSequence before the range: {json.dumps(before)}"
+    if after:
+        regen_prompt += f"\nSequence after the range: {json.dumps(after)}"
+    regen_prompt += """
+
+The new sequences must continue naturally from the sequence before and lead into the sequence after.
+Every clip_action must reference elements in the scene and match the emotional context.
+Return the character block unchanged and exactly the requested sequences in the "sequence" array."""
+    
+    message = create_message(
+        client,
+        deadline,
+        model="claude-3-7-sonnet-20250219",
+        # Budget scales with the range instead of a full chunk
+        max_tokens=min(4000, 600 + 350 * count),
+        temperature=0.7,
+        system=system_prompt,
+        messages=[
+            {
+                "role": "user",
+                "content": regen_prompt
             }
         ]
     )
     
-    return parse_json_response(message.content[0].text)
+    story, issues = normalize_story(parse_json_response(message.content[0].text))
+    log_issues(issues, f"sequences {start}-{end}")
+    return story['sequence'][:count]
+
+def act_range(job_id, act, num_sequences):
+    """First and last sequence number of an act (1: first chunk, 3: last chunk, 2: the rest)."""
+    ranges = story_store.chunk_ranges(job_id)
+    if not ranges:
+        return None
+    if act == 1:
+        first, last = ranges[0]['first'], ranges[0]['last']
+    elif act == 3:
+        first, last = ranges[-1]['first'], ranges[-1]['last']
+    else:
+        middle = ranges[1:-1]
+        if not middle:
+            return None
+        first, last = middle[0]['first'], middle[-1]['last']
+    last = min(last, num_sequences)
+    return (first, last) if first <= last else None
+
+def sequence_act(job_id, sequence_number):
+    """The act a sequence belongs to, from the chunk that produced it."""
+    ranges = story_store.chunk_ranges(job_id)
+    for i, chunk_range in enumerate(ranges):
+        if chunk_range['first'] <= sequence_number <= chunk_range['last']:
+            return 1 if i == 0 else 3 if i == len(ranges) - 1 else 2
+    return None
+
+def merge_chunk(final_story, chunk):
+    """Append a chunk's sequences to the story, renumbering them for continuity."""
+    start_seq_num = len(final_story['sequence']) + 1
+    for i, seq in enumerate(chunk['sequence']):
+        seq['sequence_number'] = start_seq_num + i
+    final_story['sequence'].extend(chunk['sequence'])
+
+def calculate_total_chunks(num_sequences):
+    """Number of chunks for a story (at least 3 for a proper 3-act structure)."""
+    # Each chunk will generate ~8-10 sequences
+    sequences_per_chunk = 8
+    return max(3, math.ceil(num_sequences / sequences_per_chunk))
+
+def estimate_story_request(prompt, genre, num_sequences):
+    """Predict chunks, tokens (system prompt included), latency and cost of a story request."""
+    total_chunks = calculate_total_chunks(num_sequences)
+    rates = story_rates.snapshot()
+    output_per_chunk = min(CHUNK_MAX_TOKENS, rates['output_tokens_per_chunk'])
+    
+    input_tokens = 0
+    for chunk_number in range(1, total_chunks + 1):
+        chunk_prompt = build_chunk_prompt(prompt, chunk_number, total_chunks, genre=genre)
+        input_tokens += estimate_request_tokens({
+            'system': system_prompt,
+            'messages': [{'role': 'user', 'content': chunk_prompt}]
+        })
+        if chunk_number > 1:
+            input_tokens += CONTINUITY_CONTEXT_TOKENS
+    output_tokens = output_per_chunk * total_chunks
+    
+    return {
+        'num_sequences': num_sequences,
+        'chunks': total_chunks,
+        'input_tokens': input_tokens,
+        'output_tokens': output_tokens,
+        'max_output_tokens': CHUNK_MAX_TOKENS * total_chunks,
+        'expected_seconds': round(rates['seconds_per_chunk'] * total_chunks, 1),
+        'estimated_cost_usd': estimate_cost(input_tokens, output_tokens),
+        'rates': rates
+    }
+
+def check_story_request(data):
+    """Estimate a request and check it against the per-request limits.
+    
+    Returns (estimate, violations); estimate is None when num_sequences is invalid.
+    """
+    num_sequences = data.get('num_sequences', 25)
+    if isinstance(num_sequences, bool) or not isinstance(num_sequences, int) or num_sequences < 1:
+        return None, ['num_sequences must be a positive integer']
+    estimate = estimate_story_request(data.get('prompt'), data.get('genre'), num_sequences)
+    return estimate, request_limits.check(estimate)
+
+def estimate_response(data):
+    """Dry-run answer: the estimate, the limits and whether the request would be admitted."""
+    estimate, violations = check_story_request(data)
+    return jsonify({
+        'estimate': estimate,
+        'limits': request_limits.to_dict(),
+        'allowed': not violations,
+        'violations': violations
+    })
+
+def chunk_context(final_story, chunk_number):
+    """Continuity arguments for a chunk: the preview for Act 1, else the character and last sequence."""
+    if chunk_number == 1:
+        # Act 1 is built around the preview's character if there is one
+        fixed_story = {k: v for k, v in final_story.items() if k != 'sequence'} if final_story else None
+        return {'fixed_story': fixed_story}
+    return {
+        'previous_character': final_story['character'],
+        'previous_sequence': final_story['sequence'][-1] if final_story['sequence'] else None
+    }
+
+def store_chunk(job_id, chunk_number, chunk, final_story):
+    """Stitch a generated chunk onto the running story and checkpoint it; returns the story."""
+    if chunk_number == 1:
+        # Numbered from 1 like every later chunk, so duplicate numbers from the model cannot collide
+        final_story = dict(chunk, sequence=[])
+    # Append new sequences while maintaining character consistency
+    merge_chunk(final_story, chunk)
+    
+    # Checkpoint the chunk so a restart resumes from here
+    story_store.save_chunk(job_id, chunk_number, chunk, final_story)
+    logger.debug(f"Generated chunk {chunk_number} with {len(chunk['sequence'])} sequences")
+    return final_story
+
+def finish_story_job(job, final_story):
+    """Trim the story to the requested length, mark the job completed and cache it."""
+    # Ensure we have exactly the requested number of sequences
+    if len(final_story['sequence']) > job['num_sequences']:
+        final_story['sequence'] = final_story['sequence'][:job['num_sequences']]
+    
+    # Log final story length
+    logger.debug(f"Final story contains {len(final_story['sequence'])} sequences")
+    
+    story_store.complete_job(job['id'], job['num_sequences'])
+    story_cache.put(job['cache_key'], Story.from_dict(final_story))
+    return final_story
+
+def run_story_job(job_id, deadline=None):
+    """Generate a stored job's remaining chunks, resuming after its last checkpoint.
+    
+    With a deadline, the budget is checked before every chunk; a cancelled or
+    expired job keeps its checkpoints and can be resumed later.
+    """
+    job = story_store.get_job(job_id)
+    total_chunks = job['total_chunks']
+    
+    # Rebuild the running story from completed chunks (None for a new job)
+    final_story = story_store.load_story(job_id)
+    if job['chunks_completed']:
+        logger.info(f"Resuming story {job_id} at chunk {job['chunks_completed'] + 1} of {total_chunks}")
+    
+    for chunk_num in range(job['chunks_completed'] + 1, total_chunks + 1):
+        if deadline is not None:
+            deadline.check()
+        
+        chunk = generate_story_chunk(
+            client,
+            job['prompt'],
+            chunk_num,
+            total_chunks,
+            genre=job['genre'],
+            deadline=deadline,
+            **chunk_context(final_story, chunk_num)
+        )
+        final_story = store_chunk(job_id, chunk_num, chunk, final_story)
+    
+    return finish_story_job(job, final_story)
+
+def claim_story_job(job_id):
+    """Mark a job as being generated by the caller; False if it already is (checked and set atomically)."""
+    with active_jobs_lock:
+        job = story_store.get_job(job_id)
+        if job_id in active_jobs or job_scheduler.queue_info(job_id) or (job and job['status'] == 'batch'):
+            return False
+        active_jobs.add(job_id)
+        return True
+
+def release_story_job(job_id):
+    with active_jobs_lock:
+        active_jobs.discard(job_id)
+
+def execute_story_job(job_id, deadline=None, claimed=False):
+    """Run a job in this process, recording failures in the store.
+    
+    claimed: the caller already holds the job through claim_story_job.
+    """
+    if not claimed:
+        with active_jobs_lock:
+            if job_id in active_jobs:
+                raise RuntimeError(f"Story {job_id} is already being generated")
+            active_jobs.add(job_id)
+    try:
+        return run_story_job(job_id, deadline)
+    except Exception as e:
+        story_store.fail_job(job_id, str(e))
+        raise
+    finally:
+        with active_jobs_lock:
+            active_jobs.discard(job_id)
+
+def queue_story_job(job_id, tenant, priority='interactive'):
+    """Queue a job for a worker slot; its cost is the number of chunks left."""
+    job = story_store.get_job(job_id)
+    return job_scheduler.submit(job_id, tenant, priority, cost=job['total_chunks'] - job['chunks_completed'])
+
+def run_queued_job(ticket, deadline=None, claimed=False):
+    """Wait for the ticket's worker slot, then run the job (claimed as in execute_story_job)."""
+    try:
+        job_scheduler.wait(ticket, deadline)
+        return execute_story_job(ticket.job_id, deadline, claimed)
+    except Exception as e:
+        if not ticket.started:
+            # Gave up while queued; a retry with the same story_id queues it again
+            story_store.fail_job(ticket.job_id, str(e))
+            if claimed:
+                release_story_job(ticket.job_id)
+        raise
+    finally:
+        job_scheduler.done(ticket)
+
+def submit_batch_round():
+    """Submit the next chunk of every batch job without one in flight as a single provider batch."""
+    in_flight = story_store.jobs_in_batches()
+    batch_requests, entries = [], []
+    for job_id in story_store.running_jobs(status='batch'):
+        if job_id in in_flight:
+            continue
+        job = story_store.get_job(job_id)
+        chunk_num = job['chunks_completed'] + 1
+        final_story = story_store.load_story(job_id)
+        custom_id = f"chunk-{len(batch_requests)}"
+        batch_requests.append({
+            'custom_id': custom_id,
+            'params': chunk_message_params(job['prompt'], chunk_num, job['total_chunks'], genre=job['genre'],
+                                           **chunk_context(final_story, chunk_num))
+        })
+        entries.append((custom_id, job_id, chunk_num))
+        if len(batch_requests) >= BATCH_MAX_REQUESTS:
+            break
+    if not batch_requests:
+        return None
+    batch_id = submit_batch(batch_client, batch_requests)
+    story_store.add_batch(batch_id, entries)
+    return batch_id
+
+def collect_provider_batch(batch_id):
+    """Stitch the chunks of an ended batch into their stories; False while it is still processing."""
+    results = batch_results(batch_client, batch_id)
+    if results is None:
+        return False
+    for entry in story_store.batch_entries(batch_id):
+        job_id, chunk_num = entry['job_id'], entry['chunk_number']
+        result = results.get(entry['custom_id'])
+        job = story_store.get_job(job_id)
+        if job['status'] != 'batch' or job['chunks_completed'] != chunk_num - 1:
+            # Cancelled or taken over by a direct request meanwhile
+            story_store.finish_batch_entry(batch_id, entry['custom_id'], 'stale')
+            continue
+        try:
+            if result is None or result.error:
+                raise RuntimeError(result.error if result else 'missing from batch results')
+            final_story = story_store.load_story(job_id)
+            chunk = parse_story_chunk(result.message, chunk_num, chunk_context(final_story, chunk_num).get('fixed_story'))
+            final_story = store_chunk(job_id, chunk_num, chunk, final_story)
+            if chunk_num == job['total_chunks']:
+                finish_story_job(job, final_story)
+                logger.info(f"Story {job_id} completed through message batches")
+            story_store.finish_batch_entry(batch_id, entry['custom_id'], 'succeeded')
+        except Exception as e:
+            story_store.finish_batch_entry(batch_id, entry['custom_id'], 'errored')
+            attempts = story_store.batch_attempts(job_id, chunk_num)
+            logger.warning(f"Batch chunk {chunk_num} of story {job_id} failed (attempt {attempts}): {str(e)}")
+            if attempts >= BATCH_MAX_ATTEMPTS:
+                story_store.fail_job(job_id, f"Chunk {chunk_num} failed in {attempts} batches: {str(e)}")
+    return True
+
+def process_provider_batches():
+    """One polling round: collect ended batches, then submit chunks for the stories they advanced."""
+    for batch_id in story_store.open_batches():
+        collect_provider_batch(batch_id)
+    submit_batch_round()
+
+def start_provider_batches():
+    """Start the background loop that drives batch jobs, unless it is already running.
+    
+    The loop stops once no batch job is left; the next batch request starts it again.
+    """
+    global provider_batch_worker
+    
+    def run():
+        global provider_batch_worker
+        while True:
+            try:
+                process_provider_batches()
+            except Exception as e:
+                logger.error(f"Error processing message batches: {str(e)}")
+            with provider_batch_lock:
+                if not story_store.open_batches() and not story_store.running_jobs(status='batch'):
+                    provider_batch_worker = None
+                    return
+            time.sleep(BATCH_POLL_INTERVAL)
+    
+    with provider_batch_lock:
+        if provider_batch_worker is None:
+            provider_batch_worker = threading.Thread(target=run, daemon=True)
+            provider_batch_worker.start()
+
+def request_tenant(data):
+    """Tenant for fair queuing: X-Tenant-Id, the body's "tenant", or a hash of X-API-Key."""
+    tenant = request.headers.get('X-Tenant-Id') or data.get('tenant')
+    if tenant:
+        return str(tenant)
+    api_key = request.headers.get('X-API-Key')
+    if api_key:
+        # Never expose the key itself in queue information
+        return 'key-' + hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:12]
+    return 'anonymous'
+
+def resume_interrupted_jobs():
+    """Continue jobs a previous process left running, one at a time in the background."""
+    job_ids = story_store.running_jobs()
+    if not job_ids:
+        return
+    logger.info(f"Resuming {len(job_ids)} interrupted story job(s)")
+    
+    def resume_all():
+        for job_id in job_ids:
+            try:
+                run_queued_job(queue_story_job(job_id, 'system', 'batch'))
+            except Exception as e:
+                logger.error(f"Error resuming story {job_id}: {str(e)}")
+    
+    threading.Thread(target=resume_all, daemon=True).start()
+
+background_work_lock = threading.Lock()
+background_work_started = False
+
+def start_background_work():
+    """Resume interrupted jobs and pending provider batches, once per process."""
+    global background_work_started
+    # Held while the interrupted jobs are listed, so no request can add a running job to that list
+    with background_work_lock:
+        if background_work_started:
+            return
+        resume_interrupted_jobs()
+        if story_store.running_jobs(status='batch') or story_store.open_batches():
+            start_provider_batches()
+        background_work_started = True
+
+@app.before_request
+def ensure_background_work():
+    # WSGI servers import the app without running __main__; the first request starts the work
+    if not background_work_started:
+        start_background_work()
+
+def stopped_story_response(story_id, error, allow_partial=False):
+    """Response for a job stopped by its deadline or a disconnect: the checkpointed part, or an error."""
+    partial = story_store.load_story(story_id) if allow_partial else None
+    if partial is not None:
+        response = story_response(partial)
+        response.headers['X-Story-Partial'] = 'true'
+    else:
+        response = jsonify({
+            'error': str(error),
+            'story_id': story_id,
+            'status': 'error'
+        })
+        # 499: client closed request
+        response.status_code = 499 if isinstance(error, GenerationCancelled) else 504
+    response.headers['X-Story-Id'] = story_id
+    return response
+
 CORS(app)
 @app.route('/generate-cinematic-story', methods=['POST'])
 def generate_cinematic_story():
@@ -1185,58 +1710,134 @@ def generate_cinematic_story():
         prompt = data.get('prompt')
         genre = data.get('genre')
         num_sequences = data.get('num_sequences', 25)  # Default to 25 sequences
+        story_id = data.get('story_id')  # Optional client-chosen id; retrying with it resumes the job
+        priority = data.get('priority') or request.headers.get('X-Priority', 'interactive')
+        if priority not in PRIORITIES:
+            return jsonify({'error': f"priority must be one of {', '.join(PRIORITIES)}", 'status': 'error'}), 400
+        tenant = request_tenant(data)
+        try:
+            deadline = Deadline.from_request(data, request.headers)
+        except ValueError as e:
+            return jsonify({'error': str(e), 'status': 'error'}), 400
         
-        # Calculate number of chunks needed based on requested sequence count
-        # Each chunk will generate ~8-10 sequences
-        sequences_per_chunk = 8
-        total_chunks = max(3, math.ceil(num_sequences / sequences_per_chunk))
+        if data.get('dry_run'):
+            return estimate_response(data)
         
-        # Ensure we have at least 3 chunks for proper 3-act structure
-        if total_chunks < 3:
-            total_chunks = 3
+        # Serve repeated requests from the result cache unless the caller opts out
+        cache_key = StoryCache.key(prompt, genre, num_sequences)
+        if data.get('use_cache', True):
+            cached_story = story_cache.get(cache_key)
+            if cached_story is not None:
+                logger.debug("Serving story from result cache")
+                return story_response(cached_story.to_dict())
         
-        # Generate first chunk (Act 1)
-        first_chunk = generate_story_chunk(
-            client, 
-            prompt, 
-            1, 
-            total_chunks,
-            genre=genre
-        )
-        final_story = first_chunk
+        job = story_store.get_job(story_id) if story_id else None
+        if not job or job['status'] == 'preview':
+            # Reject oversized requests before any provider call is made
+            estimate, violations = check_story_request(data)
+            if violations:
+                return jsonify({
+                    'error': '; '.join(violations),
+                    'estimate': estimate,
+                    'limits': request_limits.to_dict(),
+                    'status': 'error'
+                }), 400 if estimate is None else 422
+        if job and job['status'] == 'completed':
+            response = story_response(story_store.load_story(story_id))
+            response.headers['X-Story-Id'] = story_id
+            return response
+        # Checked and claimed under one lock, so concurrent requests for one story_id cannot both generate it
+        if story_id and not claim_story_job(story_id):
+            return jsonify({
+                'error': 'Story is already being generated',
+                'story_id': story_id,
+                'status': 'error'
+            }), 409
         
-        # Generate subsequent chunks with continuity
-        for chunk_num in range(2, total_chunks + 1):
-            previous_sequence = final_story['sequence'][-1]
-            chunk = generate_story_chunk(
-                client, 
-                prompt, 
-                chunk_num, 
-                total_chunks,
-                previous_character=final_story['character'],
-                previous_sequence=previous_sequence,
-                genre=genre
-            )
+        handed_off = False
+        try:
+            # Read again under the claim: a request that held it may have finished the story
+            job = story_store.get_job(story_id) if story_id else None
+            if job and job['status'] == 'completed':
+                response = story_response(story_store.load_story(story_id))
+                response.headers['X-Story-Id'] = story_id
+                return response
+            if job and job['status'] == 'preview':
+                # Continue from a preview: its movie_info and character become Act 1's
+                story_store.start_preview_job(
+                    story_id,
+                    num_sequences,
+                    calculate_total_chunks(num_sequences),
+                    data,
+                    cache_key=cache_key
+                )
+            elif job:
+                # Resume an interrupted or failed job from its last checkpoint
+                story_store.mark_running(story_id)
+            else:
+                new_job = not story_id
+                story_id = story_store.create_job(
+                    prompt,
+                    genre,
+                    num_sequences,
+                    calculate_total_chunks(num_sequences),
+                    data,
+                    cache_key=cache_key,
+                    job_id=story_id
+                )
+                if new_job:
+                    claim_story_job(story_id)
             
-            # Adjust sequence numbers for continuity
-            start_seq_num = len(final_story['sequence']) + 1
-            for i, seq in enumerate(chunk['sequence']):
-                seq['sequence_number'] = start_seq_num + i
+            if data.get('provider_batch'):
+                # Generate through provider Message Batches; poll GET /stories/<id> for progress
+                # (the 'batch' status keeps other requests off it once the claim is released)
+                story_store.mark_running(story_id, status='batch')
+                start_provider_batches()
+                response = jsonify({
+                    'story_id': story_id,
+                    'status': 'batch'
+                })
+                response.status_code = 202
+                response.headers['X-Story-Id'] = story_id
+                return response
             
-            # Append new sequences while maintaining character consistency
-            final_story['sequence'].extend(chunk['sequence'])
-            
-            # Log progress
-            logger.debug(f"Generated chunk {chunk_num} with {len(chunk['sequence'])} sequences")
+            ticket = queue_story_job(story_id, tenant, priority)
+            handed_off = True
+        finally:
+            if not handed_off:
+                release_story_job(story_id)
         
-        # Ensure we have exactly the requested number of sequences
-        if len(final_story['sequence']) > num_sequences:
-            final_story['sequence'] = final_story['sequence'][:num_sequences]
+        if data.get('wait', True) is False:
+            # Return at once; poll GET /stories/<id> for queue position and progress
+            def run_in_background():
+                try:
+                    run_queued_job(ticket, deadline, claimed=True)
+                except Exception as e:
+                    logger.error(f"Error generating story {story_id}: {str(e)}")
+            
+            threading.Thread(target=run_in_background, daemon=True).start()
+            response = jsonify({
+                'story_id': story_id,
+                'status': 'queued',
+                'queue': job_scheduler.queue_info(story_id)
+            })
+            response.status_code = 202
+            response.headers['X-Story-Id'] = story_id
+            return response
         
-        # Log final story length
-        logger.debug(f"Final story contains {len(final_story['sequence'])} sequences")
+        # Stop between chunks (and abandon the in-flight call) if the client goes away
+        stop_watching = deadline.watch_disconnect(request.environ)
+        try:
+            final_story = run_queued_job(ticket, deadline, claimed=True)
+        except (DeadlineExceeded, GenerationCancelled) as e:
+            logger.warning(f"Story {story_id} stopped: {str(e)}")
+            return stopped_story_response(story_id, e, data.get('allow_partial', False))
+        finally:
+            stop_watching()
         
-        return jsonify(final_story)
+        response = story_response(final_story)
+        response.headers['X-Story-Id'] = story_id
+        return response
             
     except Exception as e:
         logger.error(f"Error generating cinematic story: {str(e)}")
@@ -1245,6 +1846,276 @@ def generate_cinematic_story():
             'status': 'error'
         }), 500
 
+@app.route('/estimate-story', methods=['POST'])
+def estimate_story():
+    """Dry run: predicted chunks, tokens, latency and cost of a request, checked against the limits."""
+    data = request.get_json(force=True, silent=True)
+    if not data or 'prompt' not in data:
+        return jsonify({'error': 'Please provide a prompt', 'status': 'error'}), 400
+    return estimate_response(data)
+
+@app.route('/preview-story', methods=['POST'])
+def preview_story():
+    """Return movie_info and character quickly and keep them for the full generation.
+    
+    Accepts the same body as /generate-cinematic-story. Passing the returned
+    story_id to /generate-cinematic-story generates the sequences around this
+    character without writing movie_info and character again.
+    """
+    try:
+        data = request.get_json(force=True)
+        if not data or 'prompt' not in data:
+            return jsonify({'error': 'Please provide a prompt', 'status': 'error'}), 400
+        
+        prompt = data.get('prompt')
+        genre = data.get('genre')
+        num_sequences = data.get('num_sequences', 25)
+        story_id = data.get('story_id')
+        try:
+            deadline = Deadline.from_request(data, request.headers)
+        except ValueError as e:
+            return jsonify({'error': str(e), 'status': 'error'}), 400
+        
+        job = story_store.get_job(story_id) if story_id else None
+        if not job:
+            # Reject invalid or oversized requests before the provider call is paid for
+            estimate, violations = check_story_request(data)
+            if violations:
+                return jsonify({
+                    'error': '; '.join(violations),
+                    'estimate': estimate,
+                    'limits': request_limits.to_dict(),
+                    'status': 'error'
+                }), 400 if estimate is None else 422
+        if job:
+            if not job['story_meta_json']:
+                return jsonify({
+                    'error': 'Story is already being generated',
+                    'story_id': story_id,
+                    'status': 'error'
+                }), 409
+            preview = json.loads(job['story_meta_json'])
+        else:
+            preview = generate_story_preview(client, prompt, genre, deadline=deadline)
+            story_id = story_store.create_job(
+                prompt,
+                genre,
+                num_sequences,
+                calculate_total_chunks(num_sequences),
+                data,
+                cache_key=StoryCache.key(prompt, genre, num_sequences),
+                job_id=story_id,
+                status='preview',
+                story_meta=preview
+            )
+        
+        response = jsonify({
+            'story_id': story_id,
+            'movie_info': preview.get('movie_info'),
+            'character': preview.get('character')
+        })
+        response.headers['X-Story-Id'] = story_id
+        return response
+    
+    except DeadlineExceeded as e:
+        return jsonify({'error': str(e), 'status': 'error'}), 504
+    except Exception as e:
+        logger.error(f"Error generating story preview: {str(e)}")
+        return jsonify({
+            'error': f"Error: {str(e)}",
+            'status': 'error'
+        }), 500
+
+@app.route('/stories/<story_id>', methods=['GET'])
+def get_story(story_id):
+    """Return a stored story (complete or in progress), paging over its sequences."""
+    job = story_store.get_job(story_id)
+    if not job:
+        return jsonify({'error': 'Story not found', 'status': 'error'}), 404
+    
+    offset = max(0, request.args.get('offset', 0, type=int))
+    limit = min(max(1, request.args.get('limit', 50, type=int)), 500)
+    
+    story = json.loads(job['story_meta_json']) if job['story_meta_json'] else {}
+    story['sequence'] = story_store.load_sequences(story_id, offset, limit)
+    if request.args.get('format') == 'compact':
+        story = encode_compact(story)
+    
+    return jsonify({
+        'story_id': story_id,
+        'status': job['status'],
+        'num_sequences': job['num_sequences'],
+        'chunks_completed': job['chunks_completed'],
+        'total_chunks': job['total_chunks'],
+        'error': job['error'],
+        'queue': job_scheduler.queue_info(story_id),
+        'prompt_stats': story_store.prompt_stats_summary(story_id),
+        'story': story,
+        'paging': {
+            'offset': offset,
+            'limit': limit,
+            'total': story_store.count_sequences(story_id)
+        }
+    })
+
+def prompt_stats_error(data):
+    """Why a prompt-stats body is malformed, or None if it is valid."""
+    def count(value):
+        return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+    
+    if not isinstance(data, dict):
+        return 'body must be a JSON object'
+    if not count(data.get('budget')):
+        return 'budget must be a non-negative integer'
+    if not isinstance(data.get('scenes'), list):
+        return 'scenes must be a list'
+    for position, scene in enumerate(data['scenes']):
+        if not isinstance(scene, dict):
+            return f'scenes[{position}] must be an object'
+        if not count(scene.get('sequence_number')) or scene['sequence_number'] < 1:
+            return f'scenes[{position}].sequence_number must be a positive integer'
+        for field in ('tokens', 'dropped_tokens'):
+            if field in scene and not count(scene[field]):
+                return f'scenes[{position}].{field} must be a non-negative integer'
+        dropped = scene.get('dropped', [])
+        if not isinstance(dropped, list) or not all(isinstance(term, str) for term in dropped):
+            return f'scenes[{position}].dropped must be a list of strings'
+    return None
+
+@app.route('/stories/<story_id>/prompt-stats', methods=['POST'])
+def record_prompt_stats(story_id):
+    """Token-budget report from the visual generator: what it dropped from each sequence's prompt.
+    
+    Body: {"budget": N, "scenes": [{"sequence_number", "tokens", "dropped", "dropped_tokens"}]}.
+    """
+    try:
+        if not story_store.get_job(story_id):
+            return jsonify({'error': 'Story not found', 'status': 'error'}), 404
+        data = request.get_json(force=True, silent=True)
+        error = prompt_stats_error(data)
+        if error:
+            return jsonify({'error': error, 'status': 'error'}), 400
+        story_store.save_prompt_stats(story_id, data['budget'], data['scenes'])
+        return jsonify({'recorded': len(data['scenes']), 'status': 'success'})
+    
+    except Exception as e:
+        logger.error(f"Error recording prompt stats for story {story_id}: {str(e)}")
+        return jsonify({
+            'error': f"Error: {str(e)}",
+            'status': 'error'
+        }), 500
+
+@app.route('/stories/<story_id>/regenerate', methods=['POST'])
+def regenerate_sequences(story_id):
+    """Regenerate one sequence, a range or an act of a stored story and return only the changes.
+    
+    Body: {"sequence": N}, {"start": A, "end": B} or {"act": 1-3}.
+    """
+    return regenerate_story_range(story_id, request.get_json(force=True, silent=True) or {})
+
+@app.route('/stories/<story_id>/sequences/<int:sequence_number>/regenerate', methods=['POST'])
+def regenerate_sequence(story_id, sequence_number):
+    """Shorthand for regenerating a single sequence."""
+    return regenerate_story_range(story_id, {**(request.get_json(force=True, silent=True) or {}), 'sequence': sequence_number})
+
+def regenerate_story_range(story_id, data):
+    try:
+        deadline = Deadline.from_request(data, request.headers)
+    except ValueError as e:
+        return jsonify({'error': str(e), 'status': 'error'}), 400
+    try:
+        job = story_store.get_job(story_id)
+        if not job:
+            return jsonify({'error': 'Story not found', 'status': 'error'}), 404
+        if job['status'] != 'completed' or story_id in active_jobs:
+            return jsonify({
+                'error': 'Only completed stories can be regenerated',
+                'story_id': story_id,
+                'status': 'error'
+            }), 409
+        
+        total = story_store.count_sequences(story_id)
+        act = data.get('act')
+        if act is not None:
+            if act not in (1, 2, 3):
+                return jsonify({'error': 'act must be 1, 2 or 3', 'status': 'error'}), 400
+            bounds = act_range(story_id, act, total)
+            if bounds is None:
+                return jsonify({'error': f'Story has no sequences in act {act}', 'status': 'error'}), 400
+            start, end = bounds
+        elif 'sequence' in data:
+            start = end = data['sequence']
+        else:
+            start, end = data.get('start'), data.get('end', data.get('start'))
+        
+        if not isinstance(start, int) or not isinstance(end, int) or not 1 <= start <= end <= total:
+            return jsonify({
+                'error': f'Provide a sequence, start/end or act within 1-{total}',
+                'status': 'error'
+            }), 400
+        
+        story = json.loads(job['story_meta_json'])
+        context = story_store.load_sequence_range(story_id, start - 1, end + 1)
+        before = context[0] if context and context[0]['sequence_number'] == start - 1 else None
+        after = context[-1] if context and context[-1]['sequence_number'] == end + 1 else None
+        
+        sequences = generate_replacement_sequences(
+            client,
+            job['prompt'],
+            story['character'],
+            start,
+            end - start + 1,
+            before=before,
+            after=after,
+            genre=job['genre'],
+            act=act or sequence_act(story_id, start),
+            deadline=deadline
+        )
+        if not sequences:
+            raise ValueError('Model returned no sequences')
+        
+        # Renumber into the requested slots; a short answer leaves the remaining originals in place
+        for i, seq in enumerate(sequences):
+            seq['sequence_number'] = start + i
+        story_store.replace_sequences(story_id, sequences)
+        
+        # Keep the result cache consistent with the edited story
+        if job['cache_key'] and story_cache.get(job['cache_key']) is not None:
+            story_cache.put(job['cache_key'], Story.from_dict(story_store.load_story(story_id)))
+        
+        response = jsonify({
+            'story_id': story_id,
+            'range': {'start': start, 'end': end},
+            'replaced': [seq['sequence_number'] for seq in sequences],
+            'sequence': sequences
+        })
+        response.headers['X-Story-Id'] = story_id
+        return response
+    
+    except DeadlineExceeded as e:
+        return jsonify({'error': str(e), 'story_id': story_id, 'status': 'error'}), 504
+    except Exception as e:
+        logger.error(f"Error regenerating story {story_id}: {str(e)}")
+        return jsonify({
+            'error': f"Error: {str(e)}",
+            'status': 'error'
+        }), 500
+
+@app.route('/queue', methods=['GET'])
+def queue_stats():
+    """Worker slots in use and queued jobs per priority lane and tenant."""
+    return jsonify(job_scheduler.stats())
+
+@app.route('/provider-batches', methods=['GET'])
+def provider_batch_stats():
+    """Batch jobs waiting, provider batches in flight and batch request outcomes."""
+    return jsonify({
+        'jobs': len(story_store.running_jobs(status='batch')),
+        'open_batches': story_store.open_batches(),
+        'requests': story_store.batch_stats(),
+        'worker_running': provider_batch_worker is not None
+    })
+
 # Add a health check endpoint
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -1256,10 +2127,13 @@ def health_check():
             messages=[{"role": "user", "content": "test"}]
         )
         
-        return jsonify({
+        health = {
             'status': 'healthy',
             'anthropic_status': 'connected'
-        })
+        }
+        if hasattr(client, 'limiter'):
+            health['provider_limiter'] = client.limiter.stats()
+        return jsonify(health)
     except:
         return jsonify({
             'status': 'degraded',
@@ -1268,4 +2142,8 @@ def health_check():
         }), 503
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5007, debug=True) 
\ No newline at end of file
+    debug = os.getenv('FLASK_DEBUG', '1') == '1'
+    # With the debug reloader the watcher process only restarts the server; the serving child does the work
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_work()
+    app.run(host='0.0.0.0', port=5007, debug=debug) 
\ No newline at end of file
@@ -0,0 +1,277 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from latency_stats import percentile
+
+# Offline bulk story generation on top of StoryGenService (no HTTP server).
+#
+#   python batch_generate.py prompts.jsonl --output results.jsonl --concurrency 16 --rpm 400 --tpm 400000
+#
+# Each input line is {"id": ..., "prompt": ..., "genre": ..., "num_sequences": ...}
+# ("id" defaults to the line number). Every item gets a deterministic story id,
+# so chunks checkpointed by an interrupted run are resumed rather than redone,
+# and items already marked ok/cached in the output file are skipped. Stories
+# that were already generated (same prompt, genre and length) are served from
+# the story store instead of the provider. Provider quota is enforced by the
+# client-side limiter (--rpm/--tpm map to LLM_RPM/LLM_TPM). With --provider-batches
+# the chunks are submitted as provider Message Batches instead, outside those limits.
+
+DONE_STATUSES = ("ok", "cached")
+
+
+def read_items(path: str) -> List[Dict[str, Any]]:
+    """Items in file order; a malformed line becomes an item with an "invalid" reason, reported as failed."""
+    items = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError as e:
+                item = {"invalid": f"line {line_number} is not valid JSON: {e}"}
+            if not isinstance(item, dict):
+                item = {"invalid": f"line {line_number} is not a JSON object"}
+            item.setdefault("id", f"line-{line_number}")
+            item["id"] = str(item["id"])
+            if "invalid" not in item and not (isinstance(item.get("prompt"), str) and item["prompt"].strip()):
+                item["invalid"] = "prompt must be a non-empty string"
+            items.append(item)
+    return items
+
+
+def read_finished(path: str) -> set:
+    """Ids already finished according to an existing results file."""
+    finished = set()
+    if not os.path.exists(path):
+        return finished
+    with open(path) as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                # A line cut short by an interruption
+                continue
+            if result.get("status") in DONE_STATUSES:
+                finished.add(str(result.get("id")))
+    return finished
+
+
+def batch_story_id(item: Dict[str, Any]) -> str:
+    """Stable story id for an item, so reruns resume its checkpoints."""
+    key = json.dumps([item["id"], item["prompt"], item.get("genre"), item.get("num_sequences", 25)])
+    return "batch-" + hashlib.sha256(key.encode("utf-8")).hexdigest()[:24]
+
+
+def item_result(item: Dict[str, Any]) -> Dict[str, Any]:
+    if item.get("invalid"):
+        return {"id": item["id"], "status": "error", "error": item["invalid"]}
+    return {"id": item["id"], "story_id": batch_story_id(item), "prompt": item["prompt"],
+            "genre": item.get("genre"), "num_sequences": item.get("num_sequences", 25)}
+
+
+class BatchRunner:
+    """Generates items through StoryGenService's job functions and appends results as JSON lines."""
+
+    def __init__(self, service, output_path: str, use_cache: bool = True, include_story: bool = True):
+        self.service = service
+        self.use_cache = use_cache
+        self.include_story = include_story
+        self._output = open(output_path, "a")
+        self._lock = threading.Lock()
+        self.results = []
+
+    def close(self):
+        self._output.close()
+
+    def _write(self, result: Dict[str, Any], story: Optional[Dict[str, Any]]):
+        line = dict(result)
+        if story is not None and self.include_story:
+            line["story"] = story
+        with self._lock:
+            self._output.write(json.dumps(line) + "\n")
+            self._output.flush()
+            self.results.append(result)
+            done = len(self.results)
+        print(f"[{done}] {result['id']}: {result['status']} in {result['seconds']:.1f}s"
+              + (f" ({result['error']})" if result.get("error") else ""), file=sys.stderr)
+
+    def cached_story(self, prompt, genre, num_sequences) -> Optional[Dict[str, Any]]:
+        service = self.service
+        cache_key = service.StoryCache.key(prompt, genre, num_sequences)
+        cached = service.story_cache.get(cache_key)
+        if cached is not None:
+            return cached.to_dict()
+        job_id = service.story_store.find_completed(cache_key)
+        return service.story_store.load_story(job_id) if job_id else None
+
+    def prepare_item(self, item: Dict[str, Any], result: Dict[str, Any], status: str = "running"):
+        """Fill in result's status for a finished item and return its story; None once its job is ready to run."""
+        service = self.service
+        prompt = item["prompt"]
+        genre = item.get("genre")
+        num_sequences = item.get("num_sequences", 25)
+        story_id = result["story_id"]
+        job = service.story_store.get_job(story_id)
+        if job and job["status"] == "completed":
+            result["status"] = "ok"
+            return service.story_store.load_story(story_id)
+        story = self.cached_story(prompt, genre, num_sequences) if self.use_cache and not job else None
+        if story is not None:
+            result["status"] = "cached"
+            return story
+        if job:
+            # Resume from the checkpoints of an interrupted run
+            result["resumed_from_chunk"] = job["chunks_completed"]
+            service.story_store.mark_running(story_id, status=status)
+        else:
+            _, violations = service.check_story_request(item)
+            if violations:
+                raise ValueError("; ".join(violations))
+            service.story_store.create_job(
+                prompt,
+                genre,
+                num_sequences,
+                service.calculate_total_chunks(num_sequences),
+                item,
+                cache_key=service.StoryCache.key(prompt, genre, num_sequences),
+                job_id=story_id,
+                status=status
+            )
+        return None
+
+    def _finish(self, result: Dict[str, Any], story: Optional[Dict[str, Any]], started: float):
+        if result.get("status") != "error":
+            result["chunks"] = self.service.story_store.get_job(result["story_id"])["total_chunks"] \
+                if result["status"] == "ok" else 0
+            result["sequences"] = len(story["sequence"])
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        self._write(result, story)
+
+    def run_item(self, item: Dict[str, Any]):
+        started = time.perf_counter()
+        result, story = {"id": item["id"]}, None
+        try:
+            result = item_result(item)
+            if result.get("status") != "error":
+                story = self.prepare_item(item, result)
+                if story is None:
+                    story = self.service.execute_story_job(result["story_id"])
+                    result["status"] = "ok"
+        except Exception as e:
+            result["status"] = "error"
+            result["error"] = str(e)
+        self._finish(result, story, started)
+
+    def run_provider_batches(self, items: List[Dict[str, Any]]):
+        """Generate every item through provider Message Batches, one round of chunks at a time."""
+        service = self.service
+        started = time.perf_counter()
+        waiting = []
+        for item in items:
+            result, story = {"id": item["id"]}, None
+            try:
+                result = item_result(item)
+                if result.get("status") != "error":
+                    story = self.prepare_item(item, result, status="batch")
+            except Exception as e:
+                result["status"] = "error"
+                result["error"] = str(e)
+            if story is None and result.get("status") != "error":
+                waiting.append(result)
+            else:
+                self._finish(result, story, started)
+
+        while waiting:
+            service.process_provider_batches()
+            still_waiting = []
+            for result in waiting:
+                job = service.story_store.get_job(result["story_id"])
+                if job["status"] == "batch":
+                    still_waiting.append(result)
+                    continue
+                if job["status"] == "completed":
+                    result["status"] = "ok"
+                    self._finish(result, service.story_store.load_story(result["story_id"]), started)
+                else:
+                    result["status"] = "error"
+                    result["error"] = job["error"]
+                    self._finish(result, None, started)
+            waiting = still_waiting
+            if waiting:
+                time.sleep(service.BATCH_POLL_INTERVAL)
+
+
+def summarize(results, wall_time) -> Dict[str, Any]:
+    counts = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    generated = sorted(r["seconds"] for r in results if r["status"] == "ok")
+    return {
+        "items": len(results),
+        "statuses": counts,
+        "wall_time_s": round(wall_time, 2),
+        "stories_per_minute": round(len(results) / wall_time * 60, 2) if wall_time else 0.0,
+        "seconds_per_story": {
+            "p50": round(percentile(generated, 50), 2),
+            "p95": round(percentile(generated, 95), 2),
+            "max": generated[-1] if generated else 0.0,
+        },
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate stories in bulk from a JSONL file")
+    parser.add_argument('input', help="JSONL with one {\"prompt\", \"genre\", \"num_sequences\", \"id\"} per line")
+    parser.add_argument('--output', help="Results JSONL (appended; default <input>.results.jsonl)")
+    parser.add_argument('--concurrency', type=int, default=8, help="Stories generated at once")
+    parser.add_argument('--rpm', type=float, help="Provider requests per minute (LLM_RPM)")
+    parser.add_argument('--tpm', type=float, help="Provider tokens per minute (LLM_TPM)")
+    parser.add_argument('--db', help="Story store path (STORY_DB_PATH)")
+    parser.add_argument('--no-cache', action='store_true', help="Regenerate stories that were already generated")
+    parser.add_argument('--no-stories', action='store_true', help="Write timings and status only")
+    parser.add_argument('--report', help="Write the JSON summary to this file")
+    parser.add_argument('--provider-batches', action='store_true',
+                        help="Submit chunks as provider Message Batches instead of direct calls")
+    args = parser.parse_args()
+
+    # Configure the limiter and store before the service module creates them
+    if args.rpm:
+        os.environ['LLM_RPM'] = str(args.rpm)
+    if args.tpm:
+        os.environ['LLM_TPM'] = str(args.tpm)
+    if args.db:
+        os.environ['STORY_DB_PATH'] = args.db
+    os.environ.setdefault('LLM_MAX_CONCURRENCY', str(max(args.concurrency, 1)))
+    import StoryGenService as service
+
+    output_path = args.output or os.path.splitext(args.input)[0] + ".results.jsonl"
+    items = read_items(args.input)
+    finished = read_finished(output_path)
+    pending = [item for item in items if item["id"] not in finished]
+    print(f"{len(items)} items, {len(items) - len(pending)} already done, {len(pending)} to run", file=sys.stderr)
+
+    runner = BatchRunner(service, output_path, use_cache=not args.no_cache, include_story=not args.no_stories)
+    started = time.perf_counter()
+    try:
+        if args.provider_batches:
+            runner.run_provider_batches(pending)
+        else:
+            with ThreadPoolExecutor(max_workers=max(args.concurrency, 1)) as pool:
+                list(pool.map(runner.run_item, pending))
+    finally:
+        runner.close()
+
+    report = summarize(runner.results, time.perf_counter() - started)
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,271 @@
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Importing the services must not require provider credentials
+os.environ.setdefault('LLM_BACKEND', 'fake')
+
+from flask import jsonify
+
+import StoryGenService
+import olama_api_checkpoint
+from benchmarks.legacy import legacy_validate_and_fix_sequence
+from story_schema import normalize_story
+from story_compact import encode_compact, decode_compact
+from benchmarks.fixtures import SIZES, make_story, story_text, split_chunks, aliased_sequences
+
+# Microbenchmarks for the per-request CPU work in the story engines.
+#
+#   python benchmarks/bench_hot_paths.py                    # run and compare against baseline.json
+#   python benchmarks/bench_hot_paths.py --save-baseline    # record a new baseline
+#   python benchmarks/bench_hot_paths.py --filter parse --sizes 10 500
+#
+# Each case reports the best and median time per call and the peak memory
+# allocated during one call (tracemalloc). Every timing sample is paired with a
+# sample of a fixed reference workload (the calibration loop) taken right after
+# it, and a case is judged by its best time relative to the best calibration
+# time, so CPU frequency changes and busy neighbours during a run scale both
+# alike. The run exits non-zero when any case is slower than the baseline by
+# more than --threshold (--small-threshold for cases under SMALL_CASE_US, where
+# a few microseconds of jitter are already a large ratio) or allocates more
+# than --threshold extra.
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+# Cases faster than this are compared with --small-threshold
+SMALL_CASE_US = 100.0
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register a setup function returning the zero-argument callable to time."""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+@benchmark('parse_json_response/anthropic')
+def bench_parse_anthropic(story):
+    text = story_text(story)
+    return lambda: StoryGenService.parse_json_response(text)
+
+
+@benchmark('parse_json_response/ollama')
+def bench_parse_ollama(story):
+    text = story_text(story)
+    return lambda: olama_api_checkpoint.parse_json_response(text)
+
+
+@benchmark('validate_and_fix_sequence')
+def bench_validate(story):
+    sequences = aliased_sequences(story)
+    return lambda: [olama_api_checkpoint.validate_and_fix_sequence(seq) for seq in sequences]
+
+
+@benchmark('validate_and_fix_sequence/legacy')
+def bench_validate_legacy(story):
+    sequences = aliased_sequences(story)
+    return lambda: [legacy_validate_and_fix_sequence(seq) for seq in sequences]
+
+
+@benchmark('normalize_story')
+def bench_normalize_story(story):
+    chunk = dict(story, sequence=aliased_sequences(story))
+    return lambda: normalize_story(chunk)
+
+
+@benchmark('merge_chunk')
+def bench_merge(story):
+    chunks = split_chunks(story)
+
+    def run():
+        final_story = {'character': story['character'], 'sequence': list(chunks[0])}
+        for chunk in chunks[1:]:
+            StoryGenService.merge_chunk(final_story, {'sequence': list(chunk)})
+        return final_story
+    return run
+
+
+@benchmark('jsonify')
+def bench_jsonify(story):
+    def run():
+        with StoryGenService.app.app_context():
+            return jsonify(story).get_data()
+    return run
+
+
+@benchmark('encode_compact')
+def bench_encode_compact(story):
+    return lambda: encode_compact(story)
+
+
+@benchmark('parse/default')
+def bench_parse_default(story):
+    text = json.dumps(story, separators=(',', ':'))
+    return lambda: json.loads(text)
+
+
+@benchmark('parse/compact')
+def bench_parse_compact(story):
+    text = json.dumps(encode_compact(story), separators=(',', ':'))
+    return lambda: decode_compact(json.loads(text))
+
+
+def loops_for(fn, min_time):
+    """Calls per timing sample so one sample takes at least min_time, timeit-style."""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        if time.perf_counter() - start >= min_time:
+            return loops
+        loops *= 2
+
+
+def sample(fn, loops):
+    start = time.perf_counter()
+    for _ in range(loops):
+        fn()
+    return (time.perf_counter() - start) / loops
+
+
+def time_call(fn, repeat, min_time, reference=None):
+    """Median and minimum seconds per call, and the minimum seconds of the reference workload.
+
+    A reference sample is taken after every sample of fn, so both minimums come
+    from the same stretch of the run.
+    """
+    loops = loops_for(fn, min_time)
+    reference_loops = loops_for(reference, min_time) if reference else 0
+    samples, reference_samples = [], []
+    for _ in range(repeat):
+        samples.append(sample(fn, loops))
+        if reference:
+            reference_samples.append(sample(reference, reference_loops))
+    return statistics.median(samples), min(samples), min(reference_samples) if reference_samples else None
+
+
+def peak_allocation(fn):
+    """Peak bytes allocated during a single call."""
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def calibration_workload():
+    """A fixed reference workload (JSON round trip of a 25-sequence story) to time cases against."""
+    text = story_text(make_story(25, seed=1))
+    return lambda: json.dumps(json.loads(text))
+
+
+def calibrate(repeat, min_time):
+    """Best time of the reference workload on its own, reported for comparing machines."""
+    _, best, _ = time_call(calibration_workload(), repeat, min_time)
+    return best * 1e6
+
+
+def run_benchmarks(names, sizes, repeat, min_time):
+    reference = calibration_workload()
+    results = {}
+    for size in sizes:
+        story = make_story(size)
+        for name in names:
+            fn = BENCHMARKS[name](story)
+            median, best, reference_best = time_call(fn, repeat, min_time, reference)
+            results[f"{name}@{size}"] = {
+                'median_us': median * 1e6,
+                'min_us': best * 1e6,
+                # Best time in units of the calibration loop measured alongside it
+                'relative': best / reference_best,
+                'peak_kib': peak_allocation(fn) / 1024,
+            }
+    return results
+
+
+def compare(results, baseline, threshold, small_threshold=None, calibration_us=None):
+    """Print results next to the baseline; return the list of regressed keys."""
+    regressions = []
+    small_threshold = threshold if small_threshold is None else small_threshold
+    # Baselines recorded before per-case calibration are scaled by the run's calibration instead
+    speed = 1.0
+    if calibration_us and baseline.get('_calibration_us'):
+        speed = calibration_us / baseline['_calibration_us']
+        print(f"calibration: {calibration_us:.1f}us (baseline {baseline['_calibration_us']:.1f}us, scale {speed:.2f})")
+    print(f"{'case':<45} {'best':>11} {'median':>11} {'baseline':>11} {'ratio':>6} {'peak KiB':>9} {'baseline':>9}")
+    for key, result in results.items():
+        if key.startswith('_'):
+            continue
+        base = baseline.get(key)
+        line = f"{key:<45} {result['min_us']:>9.1f}us {result['median_us']:>9.1f}us"
+        if base:
+            if base.get('relative') and result.get('relative'):
+                time_ratio = result['relative'] / base['relative']
+            else:
+                time_ratio = result['min_us'] / (base['min_us'] * speed) if base['min_us'] else 1.0
+            mem_ratio = result['peak_kib'] / base['peak_kib'] if base['peak_kib'] else 1.0
+            allowed = small_threshold if base['min_us'] < SMALL_CASE_US else threshold
+            line += f" {base['min_us']:>9.1f}us {time_ratio:>6.2f} {result['peak_kib']:>9.1f} {base['peak_kib']:>9.1f}"
+            if time_ratio > 1 + allowed or mem_ratio > 1 + threshold:
+                regressions.append(key)
+                line += "  REGRESSION"
+        else:
+            line += f" {'-':>11} {'-':>6} {result['peak_kib']:>9.1f} {'-':>9}"
+        print(line)
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark parsing, validation, merging and serialization")
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help="Sequence counts to sweep")
+    parser.add_argument('--filter', default='', help="Only run cases whose name contains this string")
+    parser.add_argument('--repeat', type=int, default=15)
+    parser.add_argument('--min-time', type=float, default=0.02, help="Minimum seconds per timing sample")
+    parser.add_argument('--threshold', type=float, default=0.5, help="Allowed slowdown before failing (0.5 = 50%%)")
+    parser.add_argument('--small-threshold', type=float, default=1.0,
+                        help=f"Allowed slowdown for cases under {SMALL_CASE_US:.0f}us (1.0 = twice as slow)")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--log-level', default='INFO',
+                        help="Service log level while benchmarking (debug f-strings are still formatted)")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level)
+    names = [name for name in BENCHMARKS if args.filter in name]
+    calibration_us = calibrate(args.repeat, args.min_time)
+    results = run_benchmarks(names, args.sizes, args.repeat, args.min_time)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        baseline['_calibration_us'] = calibration_us
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        compare(results, {}, args.threshold)
+        print(f"Saved baseline to {args.baseline}")
+        sys.exit(0)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold, args.small_threshold, calibration_us)
+    if regressions:
+        print(f"{len(regressions)} case(s) regressed past the threshold "
+              f"({args.threshold:.0%}, {args.small_threshold:.0%} under {SMALL_CASE_US:.0f}us)")
+        sys.exit(1)
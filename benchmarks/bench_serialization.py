@@ -0,0 +1,70 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import make_story
+from json_responses import available_encodings, compress, dumps_bytes, orjson
+
+# Serialize-plus-compress time against bytes saved for story responses.
+#
+#   python benchmarks/bench_serialization.py
+#   python benchmarks/bench_serialization.py --story recorded_story.json
+#
+# "json-indent" is what jsonify produced before (the engines run with
+# debug=True, where Flask pretty-prints); "json" and "orjson" are the compact
+# serializers used by json_responses. Generated fixtures draw from a small
+# vocabulary and compress better than real model output; pass a recorded story
+# with --story for representative ratios.
+
+SERIALIZERS = {
+    'json-indent': lambda obj: json.dumps(obj, indent=2, sort_keys=True).encode('utf-8'),
+    'json': lambda obj: json.dumps(obj, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8'),
+}
+if orjson is not None:
+    SERIALIZERS['orjson'] = dumps_bytes
+
+
+def best_time(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark story serialization and compression")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 40, 100, 500])
+    parser.add_argument('--story', help="Use this story JSON file instead of generated fixtures")
+    parser.add_argument('--repeat', type=int, default=7)
+    args = parser.parse_args()
+
+    if args.story:
+        with open(args.story) as f:
+            story = json.load(f)
+        stories = [(len(story.get('sequence', [])), story)]
+    else:
+        stories = [(size, make_story(size, seed=size)) for size in args.sizes]
+
+    print(f"{'sequences':>9} {'serializer':<12} {'encoding':<9} {'serialize':>10} {'compress':>10} {'total':>10} {'bytes':>10} {'saved':>7}")
+    for size, story in stories:
+        reference = None
+        for name, serialize in SERIALIZERS.items():
+            serialize_time, data = best_time(lambda: serialize(story), args.repeat)
+            if reference is None:
+                reference = len(data)
+            for encoding in ['identity'] + available_encodings():
+                if encoding == 'identity':
+                    compress_time, body = 0.0, data
+                else:
+                    compress_time, body = best_time(lambda: compress(data, encoding), args.repeat)
+                total = serialize_time + compress_time
+                saved = 1 - len(body) / reference
+                print(f"{size:>9} {name:<12} {encoding:<9} {serialize_time * 1e3:>8.2f}ms {compress_time * 1e3:>8.2f}ms "
+                      f"{total * 1e3:>8.2f}ms {len(body):>10} {saved:>6.1%}")
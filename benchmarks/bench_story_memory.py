@@ -0,0 +1,53 @@
+import argparse
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import make_story, story_text
+from story_model import Story
+
+# Memory per cached story: plain nested dicts versus the compact Story model.
+#
+#   python benchmarks/bench_story_memory.py --stories 1000 --sequences 40
+#
+# Each story is parsed from its own JSON text, as it would be when it comes back
+# from the provider, so repeated strings are separate objects unless the model
+# interns them.
+
+
+def measure(build):
+    """Bytes still allocated after build() returns its result."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build()
+        gc.collect()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return current, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare memory of dict and compact story representations")
+    parser.add_argument('--stories', type=int, default=1000)
+    parser.add_argument('--sequences', type=int, default=40)
+    args = parser.parse_args()
+
+    texts = [story_text(make_story(args.sequences, seed=i % 50)) for i in range(args.stories)]
+
+    dict_bytes, dict_stories = measure(lambda: [json.loads(text) for text in texts])
+    del dict_stories
+    compact_bytes, compact_stories = measure(lambda: [Story.from_dict(json.loads(text)) for text in texts])
+
+    # Lossless round trip
+    assert compact_stories[0].to_dict() == json.loads(texts[0])
+
+    print(f"{args.stories} stories x {args.sequences} sequences")
+    print(f"dict:    {dict_bytes / 1024 / 1024:8.2f} MiB ({dict_bytes / args.stories / 1024:.1f} KiB/story)")
+    print(f"compact: {compact_bytes / 1024 / 1024:8.2f} MiB ({compact_bytes / args.stories / 1024:.1f} KiB/story)")
+    print(f"saving:  {1 - compact_bytes / dict_bytes:.1%}")
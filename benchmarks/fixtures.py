@@ -0,0 +1,40 @@
+import json
+import random
+from typing import Dict, Any, List
+
+from fake_llm import FakeLLM
+
+# Realistic story fixtures for the hot-path benchmarks. Content comes from the
+# fake LLM's vocabulary, which mirrors the system prompt examples (long
+# environment/atmosphere/negative_prompt strings repeated across sequences).
+
+SIZES = [10, 25, 50, 100, 250, 500]
+SEQUENCES_PER_CHUNK = 8
+
+
+def make_story(num_sequences: int, seed: int = 0) -> Dict[str, Any]:
+    """A story dict with num_sequences sequences, numbered 1..N."""
+    llm = FakeLLM(seed=seed, sleep=False)
+    return llm.build_story(random.Random(seed * 100003 + num_sequences), num_sequences)
+
+
+def story_text(story: Dict[str, Any]) -> str:
+    """The story as an LLM returns it (pretty-printed JSON)."""
+    return json.dumps(story, indent=4)
+
+
+def split_chunks(story: Dict[str, Any], size: int = SEQUENCES_PER_CHUNK) -> List[List[Dict[str, Any]]]:
+    """Split a story's sequences the way the chunk loop produces them."""
+    sequences = story['sequence']
+    return [sequences[i:i + size] for i in range(0, len(sequences), size)]
+
+
+def aliased_sequences(story: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Sequences with some of the field aliases models emit instead of the schema names."""
+    aliases = {'clip_duration': 'duration', 'environment': 'location', 'atmosphere': 'mood'}
+    result = []
+    for i, seq in enumerate(story['sequence']):
+        if i % 3 == 0:
+            seq = {aliases.get(k, k): v for k, v in seq.items()}
+        result.append(seq)
+    return result
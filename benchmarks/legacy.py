@@ -0,0 +1,50 @@
+# Reference implementations kept for before/after comparisons in the benchmarks.
+
+
+def legacy_validate_and_fix_sequence(sequence):
+    """Validate and fix sequence fields to ensure correct field names."""
+    required_fields = {
+        "sequence_number": int,
+        "clip_duration": float,
+        "clip_action": str,
+        "voice_narration": str,
+        "type": str,
+        "environment": str,
+        "atmosphere": str,
+        "negative_prompt": str
+    }
+    
+    # Fix common field name issues
+    field_mappings = {
+        "voice_nadration": "voice_narration",
+        "shot": "clip_action",
+        "duration": "clip_duration",
+        "narration": "voice_narration",
+        "location": "environment",
+        "setting": "environment",
+        "mood": "atmosphere",
+        "tone": "atmosphere",
+        "negative": "negative_prompt",
+        "exclude": "negative_prompt"
+    }
+    
+    # Create a new sequence with correct field names
+    fixed_sequence = {}
+    for key, value in sequence.items():
+        # Fix field name if needed
+        fixed_key = field_mappings.get(key, key)
+        fixed_sequence[fixed_key] = value
+    
+    # Add missing required fields with defaults
+    for field, field_type in required_fields.items():
+        if field not in fixed_sequence:
+            if field == "type":
+                fixed_sequence[field] = "b-roll"
+            elif field == "clip_duration":
+                fixed_sequence[field] = 3.0625
+            elif field == "sequence_number":
+                fixed_sequence[field] = len(fixed_sequence) + 1
+            else:
+                fixed_sequence[field] = ""
+    
+    return fixed_sequence
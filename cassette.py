@@ -0,0 +1,126 @@
+import anthropic
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Record/replay of provider calls.
+# Each interaction (request, response including usage, and wall-clock time) is
+# stored under a hash of the normalized request so recorded production traffic
+# can be replayed offline with its original or scaled timing.
+
+# Transport-only arguments that must not change the cassette key
+VOLATILE_FIELDS = {"timeout", "stream", "extra_headers", "extra_query", "extra_body", "metadata", "keep_alive"}
+
+
+class CassetteMiss(KeyError):
+    """Raised in replay mode when no recording exists for a request."""
+
+
+def normalize_request(kind: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop transport-only fields so equivalent requests share a key."""
+    normalized = {k: v for k, v in payload.items() if k not in VOLATILE_FIELDS and v is not None}
+    normalized["_kind"] = kind
+    return normalized
+
+
+def request_key(kind: str, payload: Dict[str, Any]) -> str:
+    canonical = json.dumps(normalize_request(kind, payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class CassetteStore:
+    """Directory of <request hash>.json files, each holding one or more recordings."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._replay_positions = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def record(self, kind: str, payload: Dict[str, Any], response: Dict[str, Any], elapsed: float):
+        key = request_key(kind, payload)
+        with self._lock:
+            cassette = self.load(key) or {"request": normalize_request(kind, payload), "interactions": []}
+            cassette["interactions"].append({
+                "response": response,
+                "elapsed": elapsed,
+                "recorded_at": time.time(),
+            })
+            tmp_path = self._path(key) + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(cassette, f)
+            os.replace(tmp_path, self._path(key))
+        logger.debug(f"Recorded {kind} interaction {key[:12]} ({elapsed:.2f}s)")
+
+    def replay(self, kind: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Return the next recorded interaction for payload, cycling through recordings."""
+        key = request_key(kind, payload)
+        cassette = self.load(key)
+        if not cassette or not cassette["interactions"]:
+            raise CassetteMiss(f"No {kind} recording for request {key[:12]}")
+        with self._lock:
+            position = self._replay_positions.get(key, 0)
+            self._replay_positions[key] = position + 1
+        interactions = cassette["interactions"]
+        return interactions[position % len(interactions)]
+
+
+def _message_to_dict(message) -> Dict[str, Any]:
+    if hasattr(message, "model_dump"):
+        return message.model_dump(mode="json")
+    return message.to_dict()
+
+
+class _RecordingMessages:
+    def __init__(self, inner, store):
+        self._inner = inner
+        self._store = store
+
+    def create(self, **kwargs):
+        start = time.perf_counter()
+        message = self._inner.create(**kwargs)
+        self._store.record("anthropic", kwargs, _message_to_dict(message), time.perf_counter() - start)
+        return message
+
+
+class RecordingAnthropicClient:
+    """Wraps a client and records every messages.create call."""
+
+    def __init__(self, inner, store: CassetteStore):
+        self.messages = _RecordingMessages(inner.messages, store)
+
+
+class _ReplayMessages:
+    def __init__(self, store, time_scale):
+        self._store = store
+        self._time_scale = time_scale
+
+    def create(self, **kwargs):
+        interaction = self._store.replay("anthropic", kwargs)
+        delay = interaction["elapsed"] * self._time_scale
+        if delay > 0:
+            time.sleep(delay)
+        return anthropic.types.Message.model_validate(interaction["response"])
+
+
+class ReplayAnthropicClient:
+    """Serves messages.create from a cassette store with original or scaled timing."""
+
+    def __init__(self, store: CassetteStore, time_scale: float = 1.0):
+        self.messages = _ReplayMessages(store, time_scale)
@@ -0,0 +1,28 @@
+// Decoder for the story engines' compact response format (?format=compact).
+// Sequences arrive as rows aligned to `columns`; values in `string_columns`
+// are indexes into the shared `strings` table and null marks a missing field.
+
+export const COMPACT_FORMAT = "compact/1";
+
+export const decodeCompactStory = (compact) => {
+  if (compact.format !== COMPACT_FORMAT) {
+    throw new Error(`Unsupported story format: ${compact.format}`);
+  }
+
+  const { strings, columns, string_columns: stringColumns, sequence, ...rest } =
+    compact;
+  const isString = columns.map((name) => stringColumns.includes(name));
+
+  const sequences = sequence.map((row) => {
+    const seq = {};
+    row.forEach((value, i) => {
+      if (value !== null) {
+        seq[columns[i]] = isString[i] ? strings[value] : value;
+      }
+    });
+    return seq;
+  });
+
+  delete rest.format;
+  return { ...rest, sequence: sequences };
+};
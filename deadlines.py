@@ -0,0 +1,154 @@
+import logging
+import math
+import os
+import select
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Per-request time budget and cancellation for the story engines.
+#
+# A request names its budget in seconds with the X-Request-Timeout header or a
+# "timeout" body field (STORY_REQUEST_TIMEOUT sets a default). The remaining
+# budget becomes the timeout of every provider call and is checked between
+# chunks. A watcher thread cancels the request when the client hangs up; an
+# in-flight provider call is then abandoned (its result is discarded and its
+# own timeout bounds how long it can linger).
+
+DEADLINE_HEADER = "X-Request-Timeout"
+DEFAULT_REQUEST_TIMEOUT = float(os.getenv('STORY_REQUEST_TIMEOUT', '0')) or None
+
+# How often waiting code looks at the cancellation flag and the client socket
+POLL_INTERVAL = 0.25
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class GenerationCancelled(Exception):
+    pass
+
+
+def _client_socket(environ: Dict[str, Any]) -> Optional[socket.socket]:
+    """The client connection behind a WSGI request, when the server exposes it."""
+    sock = environ.get("gunicorn.socket")
+    if sock is not None:
+        return sock
+    # Werkzeug's dev server: wsgi.input is a buffered reader over the socket
+    stream = environ.get("wsgi.input")
+    raw = getattr(stream, "raw", None)
+    return getattr(raw, "_sock", None)
+
+
+class Deadline:
+    """Time budget and cancellation flag for one generation request."""
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.expires_at = time.monotonic() + seconds if seconds else None
+        self.reason = None
+        self._cancelled = threading.Event()
+
+    @classmethod
+    def from_request(cls, data: Optional[Dict[str, Any]], headers, default: Optional[float] = DEFAULT_REQUEST_TIMEOUT) -> "Deadline":
+        """Budget from the X-Request-Timeout header, else the body's "timeout", else default.
+
+        Raises ValueError for anything but a finite, positive number of seconds.
+        """
+        value = headers.get(DEADLINE_HEADER)
+        if value is None and isinstance(data, dict):
+            value = data.get("timeout")
+        if value is None:
+            return cls(default)
+        if isinstance(value, bool):
+            raise ValueError(f"timeout must be a number of seconds, got {value!r}")
+        try:
+            seconds = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"timeout must be a number of seconds, got {value!r}") from None
+        if not math.isfinite(seconds) or seconds <= 0:
+            raise ValueError(f"timeout must be a positive number of seconds, got {value!r}")
+        return cls(seconds)
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, or None without a budget."""
+        if self.expires_at is None:
+            return None
+        return self.expires_at - time.monotonic()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self, reason: str = "cancelled"):
+        if not self._cancelled.is_set():
+            self.reason = reason
+            self._cancelled.set()
+
+    def check(self):
+        """Raise if the request was cancelled or its budget is spent."""
+        if self._cancelled.is_set():
+            raise GenerationCancelled(f"Generation cancelled: {self.reason}")
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded("Request deadline exceeded")
+
+    def timeout(self, cap: Optional[float] = None) -> Optional[float]:
+        """Timeout for the next provider call: the remaining budget, at most cap."""
+        self.check()
+        remaining = self.remaining()
+        if remaining is None:
+            return cap
+        return remaining if cap is None else min(remaining, cap)
+
+    def call(self, fn: Callable, *args, **kwargs):
+        """Run fn in a worker thread, abandoning it if the request is cancelled or runs out of time."""
+        self.check()
+        outcome = {}
+        done = threading.Event()
+
+        def run():
+            try:
+                outcome["result"] = fn(*args, **kwargs)
+            except BaseException as e:
+                outcome["error"] = e
+            finally:
+                done.set()
+
+        threading.Thread(target=run, daemon=True).start()
+        while not done.wait(POLL_INTERVAL):
+            self.check()
+        if "error" in outcome:
+            remaining = self.remaining()
+            if remaining is not None and remaining <= 0 and isinstance(outcome["error"], Exception):
+                # The provider call hit the timeout derived from this deadline
+                raise DeadlineExceeded("Request deadline exceeded") from outcome["error"]
+            raise outcome["error"]
+        return outcome["result"]
+
+    def watch_disconnect(self, environ: Dict[str, Any]) -> Callable[[], None]:
+        """Cancel this deadline when the client closes its connection; returns a stop function."""
+        sock = _client_socket(environ)
+        if sock is None:
+            logger.debug("Client socket unavailable; disconnects will not cancel generation")
+            return lambda: None
+
+        stopped = threading.Event()
+
+        def watch():
+            while not stopped.is_set() and not self.cancelled:
+                try:
+                    readable, _, _ = select.select([sock], [], [], POLL_INTERVAL)
+                    if readable and not sock.recv(1, socket.MSG_PEEK):
+                        self.cancel("client disconnected")
+                    elif readable:
+                        # Unexpected bytes (e.g. a pipelined request); leave them for the server
+                        stopped.wait(POLL_INTERVAL)
+                except (OSError, ValueError):
+                    self.cancel("client disconnected")
+
+        threading.Thread(target=watch, daemon=True).start()
+        return stopped.set
@@ -0,0 +1,524 @@
+from flask import Flask, request, jsonify
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Deterministic stand-in for the Anthropic Messages API and Ollama's /api/generate.
+# Every response (content, latency, truncation, malformed output) is derived from
+# a hash of the seed and the request text, so identical runs produce identical
+# results and performance changes can be measured offline.
+
+SHOTS = [
+    "ESTABLISHING SHOT - EYE LEVEL - RULE OF THIRDS",
+    "WIDE SHOT - LOW ANGLE - LEADING LINES",
+    "MEDIUM SHOT - EYE LEVEL - BALANCED COMPOSITION",
+    "CLOSE UP - EYE LEVEL - PORTRAIT FRAMING",
+    "WIDE SHOT - HIGH ANGLE - SYMMETRICAL FRAMING",
+]
+
+LOCATIONS = [
+    "EXT. ABANDONED WAREHOUSE WITH BROKEN WINDOWS AND RUSTED METAL DOORS - DAY - DUST PARTICLES FLOATING IN SUNBEAMS",
+    "INT. WAREHOUSE CORNER WITH EXPOSED BRICK WALL AND SINGLE SUNBEAM - DAY - DUST PARTICLES CATCHING LIGHT",
+    "EXT. RAIN SOAKED CITY STREET WITH NEON SIGNS REFLECTING IN PUDDLES - NIGHT - STEAM RISING FROM GRATES",
+    "EXT. COLORADO MOUNTAINS WITH SNOW COVERED PINES - DAY - CLOUDS DRIFTING ACROSS PEAKS",
+    "INT. DIMLY LIT APARTMENT WITH VENETIAN BLINDS - NIGHT - SMOKE CURLING IN STRIPED LIGHT",
+]
+
+ATMOSPHERES = [
+    "8k uhd, photorealistic, natural sunlight streaming through broken windows, dramatic shadows cast by debris, high contrast between light beams and dark corners, studio lighting quality, sharp details on textured surfaces, cinematic color grading with warm highlights and cool shadows",
+    "8k uhd, photorealistic, neon light reflecting off wet surfaces, deep blue and magenta color palette, volumetric fog, high contrast noir lighting, sharp details on rain droplets, cinematic color grading with teal shadows",
+    "(8k uhd:1.4), (photorealistic:1.4), (cinematic lighting:1.3), (film grain:1.2), (cinematic color grading:1.3)",
+]
+
+NEGATIVE_PROMPT = "(worst quality:1.4), (low quality:1.4), (blurry:1.2), (deformed:1.4), (distorted:1.4), (bad anatomy:1.4), (bad proportions:1.4), (multiple people:1.8), (wrong face:1.8), (different person:1.8), (duplicate body parts:1.4), (missing limbs:1.4)"
+
+ACTIONS = [
+    "dust particles catching golden light as they drift upward, creating delicate patterns of illumination across rusted metal surfaces",
+    "camera slowly panning right across the skyline as clouds drift overhead",
+    "fabric rippling delicately as breath escapes, shadows shifting subtly across exposed brick wall",
+    "rain streaking down the window as neon signs flicker in the distance",
+]
+
+NARRATIONS = [
+    "It has to be here somewhere...",
+    "I never thought I would come back to this place.",
+    "Every shadow remembers what happened here.",
+    "Keep moving. Don't look back.",
+]
+
+POSES = [
+    "[previous character traits], face turned slightly toward light source, chin slightly lowered, lips parted subtly",
+    "[previous character traits], walking forward with determined stride, shoulders squared",
+    "[previous character traits], looking over shoulder, eyes narrowed, hand resting on door frame",
+]
+
+MALFORMED_KINDS = ["preamble", "markdown", "trailing_comma", "single_quotes"]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token)."""
+    return max(1, len(text) // 4)
+
+
+class LatencyModel:
+    """Samples per-call overhead latency from a configurable distribution."""
+
+    def __init__(self, distribution="lognormal", mean=0.2, stddev=0.05, tokens_per_second=0.0):
+        if distribution not in ("constant", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Unsupported latency distribution: {distribution}")
+        self.distribution = distribution
+        self.mean = mean
+        self.stddev = stddev
+        self.tokens_per_second = tokens_per_second
+
+    def overhead(self, rng: random.Random) -> float:
+        if self.distribution == "constant" or self.mean <= 0:
+            return max(0.0, self.mean)
+        if self.distribution == "uniform":
+            return max(0.0, rng.uniform(self.mean - self.stddev, self.mean + self.stddev))
+        if self.distribution == "normal":
+            return max(0.0, rng.gauss(self.mean, self.stddev))
+        # Lognormal with the requested mean/stddev (long right tail like real providers)
+        variance = self.stddev ** 2
+        sigma2 = math.log(1 + variance / (self.mean ** 2))
+        mu = math.log(self.mean) - sigma2 / 2
+        return rng.lognormvariate(mu, sigma2 ** 0.5)
+
+    def duration(self, rng: random.Random, output_tokens: int) -> float:
+        """Total time for a call producing output_tokens."""
+        seconds = self.overhead(rng)
+        if self.tokens_per_second > 0:
+            seconds += output_tokens / self.tokens_per_second
+        return seconds
+
+
+class FakeAPIError(Exception):
+    """Provider error shaped like anthropic.APIStatusError (status_code, retry-after)."""
+
+    def __init__(self, status_code: int, error_type: str, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.error_type = error_type
+        self.retry_after = retry_after
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"type": "error", "error": {"type": self.error_type, "message": str(self)}}
+
+
+# Prompts that ask for an explicit number of sequences (e.g. regenerating a range)
+REQUESTED_SEQUENCES = re.compile(r"with (\d+) new sequence")
+NO_SEQUENCES = 'an empty "sequence" array'
+
+
+class FakeLLM:
+    """Deterministic story generator with latency, truncation and malformed-output injection."""
+
+    def __init__(self, latency=None, truncation_rate=0.0, malformed_rate=0.0,
+                 sequences_per_chunk=8, seed=0, sleep=True, capacity=0, overload_rate=0.0):
+        self.latency = latency or LatencyModel()
+        self.truncation_rate = truncation_rate
+        self.malformed_rate = malformed_rate
+        self.sequences_per_chunk = sequences_per_chunk
+        self.seed = seed
+        self.sleep = sleep
+        # Provider-side limits: calls beyond `capacity` concurrent ones get a 429,
+        # and a fraction `overload_rate` of calls get a 529 overloaded error
+        self.capacity = capacity
+        self.overload_rate = overload_rate
+        self._overload_rng = random.Random(seed)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Build a fake from FAKE_LLM_* environment variables."""
+        return cls(
+            latency=LatencyModel(
+                distribution=os.getenv('FAKE_LLM_LATENCY', 'lognormal'),
+                mean=float(os.getenv('FAKE_LLM_LATENCY_MEAN', '0.2')),
+                stddev=float(os.getenv('FAKE_LLM_LATENCY_STDDEV', '0.05')),
+                tokens_per_second=float(os.getenv('FAKE_LLM_TOKENS_PER_SECOND', '0')),
+            ),
+            truncation_rate=float(os.getenv('FAKE_LLM_TRUNCATION_RATE', '0')),
+            malformed_rate=float(os.getenv('FAKE_LLM_MALFORMED_RATE', '0')),
+            sequences_per_chunk=int(os.getenv('FAKE_LLM_SEQUENCES_PER_CHUNK', '8')),
+            seed=int(os.getenv('FAKE_LLM_SEED', '0')),
+            capacity=int(os.getenv('FAKE_LLM_CAPACITY', '0')),
+            overload_rate=float(os.getenv('FAKE_LLM_OVERLOAD_RATE', '0')),
+        )
+
+    def _rng(self, prompt: str) -> random.Random:
+        digest = hashlib.sha256(f"{self.seed}:{prompt}".encode('utf-8')).digest()
+        return random.Random(int.from_bytes(digest[:8], 'big'))
+
+    def build_story(self, rng: random.Random, num_sequences: int) -> Dict[str, Any]:
+        """Build a story chunk shaped like the engines' system prompt example."""
+        sequences = []
+        for i in range(num_sequences):
+            seq_type = "character" if rng.random() < 0.5 else "b-roll"
+            seq = {
+                "sequence_number": i + 1,
+                "clip_duration": rng.choice([2.5, 3.0625, 4.0, 6.0]),
+                "clip_action": rng.choice(ACTIONS),
+                "voice_narration": rng.choice(NARRATIONS),
+                "type": seq_type,
+            }
+            if seq_type == "character":
+                seq["pose"] = rng.choice(POSES)
+            seq["environment"] = f"{rng.choice(SHOTS)} - {rng.choice(LOCATIONS)}"
+            seq["atmosphere"] = rng.choice(ATMOSPHERES)
+            seq["negative_prompt"] = NEGATIVE_PROMPT
+            sequences.append(seq)
+
+        return {
+            "movie_info": {
+                "genre": rng.choice(["noir", "sci-fi", "horror", "indie"]),
+                "title": f"The Fake Story {rng.randint(1, 9999)}",
+                "description": "A deterministic story produced by the offline fake LLM backend.",
+                "release_year": 2025,
+                "director": "Jane Doe",
+                "rating": round(rng.uniform(7.0, 9.5), 1),
+            },
+            "character": {
+                "base_traits": "young 18 year old female, slender frame, fair complexion",
+                "facial_features": "defined features, slightly parted lips, expressive eyes",
+                "distinctive_features": "white hair, multiple facial piercings",
+                "clothing": "minimal visible clothing, possibly dark casual wear",
+            },
+            "music_score": {
+                "type": "ambient",
+                "style": "dark, ominous, suspenseful",
+                "tempo": "slow, steady, building tension",
+                "instrumentation": "piano, strings, electronic elements",
+            },
+            "sequence": sequences,
+        }
+
+    def _malform(self, rng: random.Random, text: str) -> str:
+        kind = rng.choice(MALFORMED_KINDS)
+        if kind == "preamble":
+            return "Here is the story you asked for:\n\n" + text
+        if kind == "markdown":
+            return "```json\n" + text + "\n```"
+        if kind == "trailing_comma":
+            return text[:text.rfind(']')].rstrip() + ",\n    ]\n}"
+        return text.replace('"', "'")
+
+    def complete(self, prompt: str, max_tokens: Optional[int] = None, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Produce a completion for prompt, sleeping for the simulated latency.
+
+        Raises TimeoutError (after sleeping `timeout`) when the call would take longer,
+        and FakeAPIError when the fake's capacity is exceeded or it is overloaded.
+        """
+        with self._lock:
+            if self.capacity and self._in_flight >= self.capacity:
+                raise FakeAPIError(429, "rate_limit_error", "Fake provider concurrency limit reached")
+            if self.overload_rate and self._overload_rng.random() < self.overload_rate:
+                raise FakeAPIError(529, "overloaded_error", "Fake provider overloaded")
+            self._in_flight += 1
+        try:
+            return self._complete(prompt, max_tokens, timeout)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def _complete(self, prompt: str, max_tokens: Optional[int], timeout: Optional[float]) -> Dict[str, Any]:
+        rng = self._rng(prompt)
+        requested = REQUESTED_SEQUENCES.search(prompt)
+        num_sequences = int(requested.group(1)) if requested else self.sequences_per_chunk
+        if NO_SEQUENCES in prompt:
+            num_sequences = 0
+        text = json.dumps(self.build_story(rng, num_sequences), indent=4)
+        stop_reason = "end_turn"
+
+        if rng.random() < self.malformed_rate:
+            text = self._malform(rng, text)
+
+        # Truncate either on request or when the output exceeds max_tokens
+        if rng.random() < self.truncation_rate:
+            text = text[:int(len(text) * rng.uniform(0.5, 0.95))]
+            stop_reason = "max_tokens"
+        if max_tokens and estimate_tokens(text) > max_tokens:
+            text = text[:max_tokens * 4]
+            stop_reason = "max_tokens"
+
+        input_tokens = estimate_tokens(prompt)
+        output_tokens = estimate_tokens(text)
+        duration = self.latency.duration(rng, output_tokens)
+        if timeout is not None and duration > timeout:
+            if self.sleep:
+                time.sleep(max(timeout, 0))
+            raise TimeoutError(f"Fake LLM call timed out after {timeout:.2f}s")
+        if self.sleep and duration > 0:
+            time.sleep(duration)
+
+        return {
+            "text": text,
+            "stop_reason": stop_reason,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "duration": duration,
+        }
+
+
+def _messages_prompt(system, messages) -> str:
+    """Flatten a Messages API request into a single string for seeding."""
+    parts = [system if isinstance(system, str) else json.dumps(system or "")]
+    for message in messages:
+        content = message.get("content")
+        parts.append(content if isinstance(content, str) else json.dumps(content))
+    return "\n".join(parts)
+
+
+class FakeTextBlock:
+    def __init__(self, text):
+        self.type = "text"
+        self.text = text
+
+
+class FakeUsage:
+    def __init__(self, input_tokens, output_tokens):
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+
+
+class FakeMessage:
+    """Mirrors the attributes of anthropic.types.Message used by the engines."""
+
+    def __init__(self, model, text, stop_reason, input_tokens, output_tokens):
+        self.id = f"msg_fake_{uuid.uuid4().hex[:24]}"
+        self.type = "message"
+        self.role = "assistant"
+        self.model = model
+        self.content = [FakeTextBlock(text)]
+        self.stop_reason = stop_reason
+        self.usage = FakeUsage(input_tokens, output_tokens)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "type": self.type,
+            "role": self.role,
+            "model": self.model,
+            "content": [{"type": "text", "text": block.text} for block in self.content],
+            "stop_reason": self.stop_reason,
+            "stop_sequence": None,
+            "usage": {
+                "input_tokens": self.usage.input_tokens,
+                "output_tokens": self.usage.output_tokens,
+            },
+        }
+
+
+class FakeMessages:
+    def __init__(self, llm: FakeLLM):
+        self._llm = llm
+
+    def create(self, model, max_tokens, messages, system=None, **kwargs):
+        result = self._llm.complete(_messages_prompt(system, messages), max_tokens=max_tokens,
+                                    timeout=kwargs.get("timeout"))
+        return FakeMessage(
+            model,
+            result["text"],
+            result["stop_reason"],
+            result["input_tokens"],
+            result["output_tokens"],
+        )
+
+
+class FakeRequestCounts:
+    def __init__(self):
+        self.processing = 0
+        self.succeeded = 0
+        self.errored = 0
+        self.canceled = 0
+        self.expired = 0
+
+
+class FakeBatch:
+    """Mirrors anthropic.types.messages.MessageBatch (id, processing_status, request_counts)."""
+
+    def __init__(self, batch_id, num_requests):
+        self.id = batch_id
+        self.type = "message_batch"
+        self.processing_status = "in_progress"
+        self.request_counts = FakeRequestCounts()
+        self.request_counts.processing = num_requests
+        self.created_at = time.time()
+        self.ended_at = None
+
+
+class FakeBatchResult:
+    def __init__(self, result_type, message=None, error=None):
+        self.type = result_type
+        self.message = message
+        self.error = error
+
+
+class FakeBatchResponse:
+    def __init__(self, custom_id, result):
+        self.custom_id = custom_id
+        self.result = result
+
+
+class FakeBatches:
+    """Stand-in for client.messages.batches: requests run through the fake in the background.
+
+    A batch is processed by `workers` threads and ends when every request has a
+    result; capacity and overload errors become errored results, as they do on
+    the provider.
+    """
+
+    def __init__(self, messages: "FakeMessages", workers: int = 8):
+        self._messages = messages
+        self.workers = workers
+        self._batches = {}
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def create(self, requests):
+        requests = list(requests)
+        batch = FakeBatch(f"msgbatch_fake_{uuid.uuid4().hex[:24]}", len(requests))
+        with self._lock:
+            self._batches[batch.id] = batch
+            self._results[batch.id] = []
+        threading.Thread(target=self._process, args=(batch, requests), daemon=True).start()
+        return batch
+
+    def _process(self, batch, requests):
+        pending = list(requests)
+
+        def worker():
+            while True:
+                with self._lock:
+                    if not pending or batch.processing_status != "in_progress":
+                        return
+                    item = pending.pop(0)
+                try:
+                    result = FakeBatchResult("succeeded", message=self._messages.create(**item["params"]))
+                except Exception as e:
+                    error = {"type": getattr(e, "error_type", "api_error"), "message": str(e)}
+                    result = FakeBatchResult("errored", error=error)
+                with self._lock:
+                    self._results[batch.id].append(FakeBatchResponse(item["custom_id"], result))
+                    batch.request_counts.processing -= 1
+                    setattr(batch.request_counts, result.type, getattr(batch.request_counts, result.type) + 1)
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(min(self.workers, len(requests)) or 1)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with self._lock:
+            # Requests never started (cancelled batch)
+            for item in pending:
+                self._results[batch.id].append(FakeBatchResponse(item["custom_id"], FakeBatchResult("canceled")))
+                batch.request_counts.processing -= 1
+                batch.request_counts.canceled += 1
+            batch.processing_status = "ended"
+            batch.ended_at = time.time()
+
+    def retrieve(self, batch_id):
+        with self._lock:
+            if batch_id not in self._batches:
+                raise FakeAPIError(404, "not_found_error", f"Unknown batch {batch_id}")
+            return self._batches[batch_id]
+
+    def results(self, batch_id):
+        batch = self.retrieve(batch_id)
+        if batch.processing_status != "ended":
+            raise FakeAPIError(400, "invalid_request_error", f"Batch {batch_id} has not ended")
+        with self._lock:
+            return iter(list(self._results[batch_id]))
+
+    def cancel(self, batch_id):
+        batch = self.retrieve(batch_id)
+        with self._lock:
+            if batch.processing_status == "in_progress":
+                batch.processing_status = "canceling"
+        return batch
+
+
+class FakeAnthropicClient:
+    """In-process replacement for anthropic.Anthropic (messages.create and messages.batches)."""
+
+    def __init__(self, llm: Optional[FakeLLM] = None):
+        self.llm = llm or FakeLLM.from_env()
+        self.messages = FakeMessages(self.llm)
+        self.messages.batches = FakeBatches(self.messages, int(os.getenv('FAKE_LLM_BATCH_WORKERS', '8')))
+
+
+def ollama_generate_response(llm: FakeLLM, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Build an Ollama /api/generate (stream=false) response body."""
+    options = payload.get("options") or {}
+    result = llm.complete(payload.get("prompt", ""), max_tokens=options.get("num_predict"))
+    duration_ns = int(result["duration"] * 1e9)
+    return {
+        "model": payload.get("model", "llama3"),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "response": result["text"],
+        "done": True,
+        "done_reason": "length" if result["stop_reason"] == "max_tokens" else "stop",
+        "prompt_eval_count": result["input_tokens"],
+        "eval_count": result["output_tokens"],
+        "total_duration": duration_ns,
+        "eval_duration": duration_ns,
+    }
+
+
+def create_app(llm: Optional[FakeLLM] = None) -> Flask:
+    """HTTP server speaking both the Anthropic and Ollama wire formats."""
+    llm = llm or FakeLLM.from_env()
+    fake_app = Flask(__name__)
+
+    @fake_app.route('/v1/messages', methods=['POST'])
+    def messages():
+        data = request.get_json(force=True)
+        message = FakeMessages(llm).create(
+            data.get("model", "fake"),
+            data.get("max_tokens"),
+            data.get("messages", []),
+            system=data.get("system"),
+        )
+        return jsonify(message.to_dict())
+
+    @fake_app.errorhandler(FakeAPIError)
+    def api_error(error):
+        response = jsonify(error.to_dict())
+        response.status_code = error.status_code
+        if error.retry_after is not None:
+            response.headers["retry-after"] = str(error.retry_after)
+        return response
+
+    @fake_app.route('/api/generate', methods=['POST'])
+    def generate():
+        return jsonify(ollama_generate_response(llm, request.get_json(force=True)))
+
+    @fake_app.route('/api/tags', methods=['GET'])
+    def tags():
+        return jsonify({"models": [{"name": "llama3.3"}, {"name": "llama3"}]})
+
+    @fake_app.route('/api/version', methods=['GET'])
+    def version():
+        return jsonify({"version": "fake"})
+
+    return fake_app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the fake Anthropic/Ollama server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11434)
+    args = parser.parse_args()
+    create_app().run(host=args.host, port=args.port, threaded=True)
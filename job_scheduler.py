@@ -0,0 +1,207 @@
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Admission of story jobs onto a fixed number of worker slots.
+#
+# Two priority lanes: interactive jobs always go first, and batch jobs may only
+# occupy `workers - interactive_reserved` slots, so an interactive request can
+# start at once even while a large batch is running. Within a lane, tenants are
+# served by start-time fair queuing: each job is tagged at submission with
+#   start = max(virtual time, tenant's last finish tag)
+#   finish = start + cost / tenant weight
+# and the job with the smallest start tag runs next, so backlogged tenants get
+# slots in proportion to their weights whatever their arrival pattern. A job's
+# cost is the number of chunks it still has to generate.
+
+PRIORITIES = ("interactive", "batch")
+
+
+def parse_weights(value: str) -> Dict[str, float]:
+    """'tenant-a=3,tenant-b=1' -> {'tenant-a': 3.0, 'tenant-b': 1.0}"""
+    weights = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        tenant, _, weight = item.partition("=")
+        weights[tenant.strip()] = float(weight)
+    return weights
+
+
+class Ticket:
+    __slots__ = ("job_id", "tenant", "priority", "cost", "start_tag", "seq", "submitted_at",
+                 "started_at", "started", "finished")
+
+    def __init__(self, job_id, tenant, priority, cost, start_tag, seq):
+        self.job_id = job_id
+        self.tenant = tenant
+        self.priority = priority
+        self.cost = cost
+        self.start_tag = start_tag
+        self.seq = seq
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.started = False
+        self.finished = False
+
+
+class FairScheduler:
+    """Priority lanes with weighted fair queuing per tenant (thread-safe)."""
+
+    def __init__(self, workers: int = 4, interactive_reserved: int = 1, tenant_weights: Optional[Dict[str, float]] = None,
+                 default_weight: float = 1.0, seconds_per_chunk: float = 15.0):
+        self.workers = workers
+        self.interactive_reserved = min(interactive_reserved, workers - 1) if workers > 1 else 0
+        self.tenant_weights = tenant_weights or {}
+        self.default_weight = default_weight
+        # Moving average of observed generation time per chunk, used for start estimates
+        self.seconds_per_chunk = seconds_per_chunk
+
+        self._cond = threading.Condition()
+        self._queues = {priority: {} for priority in PRIORITIES}  # priority -> tenant -> deque of tickets
+        self._virtual_time = {priority: 0.0 for priority in PRIORITIES}
+        self._last_finish = {priority: {} for priority in PRIORITIES}
+        self._tickets = {}
+        self._running = {priority: 0 for priority in PRIORITIES}
+        self._seq = itertools.count()
+
+    @classmethod
+    def from_env(cls):
+        """Build a scheduler from STORY_WORKERS, INTERACTIVE_RESERVED_WORKERS and TENANT_WEIGHTS."""
+        return cls(
+            workers=int(os.getenv('STORY_WORKERS', '4')),
+            interactive_reserved=int(os.getenv('INTERACTIVE_RESERVED_WORKERS', '1')),
+            tenant_weights=parse_weights(os.getenv('TENANT_WEIGHTS', '')),
+            seconds_per_chunk=float(os.getenv('SECONDS_PER_CHUNK_ESTIMATE', '15')),
+        )
+
+    def weight(self, tenant: str) -> float:
+        return self.tenant_weights.get(tenant, self.default_weight)
+
+    def submit(self, job_id: str, tenant: str, priority: str = "interactive", cost: float = 1.0) -> Ticket:
+        if priority not in PRIORITIES:
+            raise ValueError(f"priority must be one of {', '.join(PRIORITIES)}")
+        with self._cond:
+            start_tag = max(self._virtual_time[priority], self._last_finish[priority].get(tenant, 0.0))
+            self._last_finish[priority][tenant] = start_tag + max(cost, 1) / self.weight(tenant)
+            ticket = Ticket(job_id, tenant, priority, max(cost, 1), start_tag, next(self._seq))
+            self._queues[priority].setdefault(tenant, deque()).append(ticket)
+            self._tickets[job_id] = ticket
+            self._dispatch()
+            return ticket
+
+    def _head(self, priority: str) -> Optional[Ticket]:
+        """Queued ticket with the smallest start tag in a lane."""
+        best = None
+        for queue in self._queues[priority].values():
+            if queue and (best is None or (queue[0].start_tag, queue[0].seq) < (best.start_tag, best.seq)):
+                best = queue[0]
+        return best
+
+    def _can_start(self, priority: str) -> bool:
+        running = sum(self._running.values())
+        if running >= self.workers:
+            return False
+        if priority == "batch":
+            return self._running["batch"] < self.workers - self.interactive_reserved
+        return True
+
+    def _dispatch(self):
+        started = False
+        for priority in PRIORITIES:
+            while self._can_start(priority):
+                ticket = self._head(priority)
+                if ticket is None:
+                    break
+                queue = self._queues[priority][ticket.tenant]
+                queue.popleft()
+                if not queue:
+                    del self._queues[priority][ticket.tenant]
+                self._virtual_time[priority] = ticket.start_tag
+                self._running[priority] += 1
+                ticket.started = True
+                ticket.started_at = time.time()
+                started = True
+        if started:
+            self._cond.notify_all()
+
+    def wait(self, ticket: Ticket, deadline=None):
+        """Block until the ticket is started. A deadline (deadlines.Deadline) that expires or
+        is cancelled removes the ticket from the queue and raises."""
+        with self._cond:
+            while not ticket.started:
+                if deadline is not None:
+                    try:
+                        deadline.check()
+                    except Exception:
+                        self._remove(ticket)
+                        raise
+                self._cond.wait(0.25)
+
+    def _remove(self, ticket: Ticket):
+        queue = self._queues[ticket.priority].get(ticket.tenant)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[ticket.priority][ticket.tenant]
+        ticket.finished = True
+        if self._tickets.get(ticket.job_id) is ticket:
+            del self._tickets[ticket.job_id]
+
+    def done(self, ticket: Ticket):
+        """Release a started ticket's slot and fold its run time into the per-chunk estimate."""
+        with self._cond:
+            if ticket.finished:
+                return
+            if ticket.started:
+                self._running[ticket.priority] -= 1
+                elapsed = time.time() - ticket.started_at
+                self.seconds_per_chunk = 0.8 * self.seconds_per_chunk + 0.2 * (elapsed / ticket.cost)
+            self._remove(ticket)
+            self._dispatch()
+
+    def _queued_in_order(self):
+        """Queued tickets in expected start order (lane first, then start tag)."""
+        ordered = []
+        for priority in PRIORITIES:
+            tickets = [t for queue in self._queues[priority].values() for t in queue]
+            ordered.extend(sorted(tickets, key=lambda t: (t.start_tag, t.seq)))
+        return ordered
+
+    def queue_info(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Queue position (0 = next) and estimated start time of a job; None if unknown."""
+        with self._cond:
+            ticket = self._tickets.get(job_id)
+            if ticket is None:
+                return None
+            info = {"priority": ticket.priority, "tenant": ticket.tenant, "submitted_at": ticket.submitted_at}
+            if ticket.started:
+                info.update(state="running", started_at=ticket.started_at)
+                return info
+
+            now = time.time()
+            ordered = self._queued_in_order()
+            position = ordered.index(ticket)
+            # Work ahead of this job: what running jobs have left plus the queued jobs in front of it
+            running_left = sum(max(0.0, t.cost * self.seconds_per_chunk - (now - t.started_at))
+                               for t in self._tickets.values() if t.started)
+            queued_ahead = sum(t.cost for t in ordered[:position]) * self.seconds_per_chunk
+            slots = self.workers if ticket.priority == "interactive" else self.workers - self.interactive_reserved
+            info.update(state="queued", position=position,
+                        estimated_start=now + (running_left + queued_ahead) / max(slots, 1))
+            return info
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "workers": self.workers,
+                "interactive_reserved": self.interactive_reserved,
+                "running": dict(self._running),
+                "queued": {priority: {tenant: len(queue) for tenant, queue in tenants.items()}
+                           for priority, tenants in self._queues.items()},
+                "seconds_per_chunk": round(self.seconds_per_chunk, 2),
+            }
@@ -0,0 +1,132 @@
+import gzip
+import json
+import logging
+from typing import Any, Optional
+
+from flask import request
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    from flask.json.provider import DefaultJSONProvider
+except ImportError:
+    DefaultJSONProvider = None
+
+logger = logging.getLogger(__name__)
+
+# Fast JSON serialization and negotiated response compression for the story
+# engines. orjson, brotli and zstandard are optional: without them responses
+# fall back to the json module and gzip.
+
+# Responses smaller than this are sent uncompressed
+MIN_COMPRESS_SIZE = 1024
+
+# Levels picked for latency rather than maximum ratio
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ZSTD_LEVEL = 3
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+
+
+def dumps_bytes(obj: Any, default=None) -> bytes:
+    """Serialize obj to compact UTF-8 JSON (sorted keys, like Flask's jsonify)."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=default, option=_ORJSON_OPTIONS)
+        except TypeError:
+            # Values orjson cannot handle (e.g. integers beyond 64 bits)
+            pass
+    return json.dumps(obj, default=default, sort_keys=True, separators=(",", ":"),
+                      ensure_ascii=False).encode("utf-8")
+
+
+if DefaultJSONProvider is not None:
+    class FastJSONProvider(DefaultJSONProvider):
+        """jsonify() through dumps_bytes, always compact (no debug-mode indentation)."""
+
+        def dumps(self, obj, **kwargs):
+            if kwargs:
+                return super().dumps(obj, **kwargs)
+            return dumps_bytes(obj, default=self.default).decode("utf-8")
+
+        def response(self, *args, **kwargs):
+            obj = self._prepare_response_obj(args, kwargs)
+            return self._app.response_class(dumps_bytes(obj, default=self.default), mimetype=self.mimetype)
+
+
+def available_encodings():
+    """Content-Encodings this process can produce, in server preference order."""
+    encodings = []
+    if zstandard is not None:
+        encodings.append("zstd")
+    if brotli is not None:
+        encodings.append("br")
+    encodings.append("gzip")
+    return encodings
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=GZIP_LEVEL)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def negotiate_encoding(accept_encodings) -> Optional[str]:
+    """Pick the preferred encoding the client accepts (werkzeug Accept object)."""
+    best, best_quality = None, 0
+    for encoding in available_encodings():
+        quality = accept_encodings.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress_response(response):
+    """after_request hook: compress JSON bodies the client can decode."""
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or "Content-Encoding" in response.headers
+            or response.mimetype != "application/json"):
+        return response
+
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def install_json_responses(app):
+    """Install the fast JSON provider and response compression on a Flask app."""
+    if DefaultJSONProvider is not None:
+        app.json = FastJSONProvider(app)
+    else:
+        logger.warning("Flask JSON providers unavailable; jsonify keeps the default serializer")
+    app.after_request(compress_response)
+    logger.debug(f"JSON responses: {'orjson' if orjson else 'json'}, encodings {available_encodings()}")
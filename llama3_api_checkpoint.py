@@ -6,6 +6,11 @@ from dotenv import load_dotenv
 from typing import Dict, Any
 import requests
 import gc
+from llm_backends import LLM_BACKEND, ollama_generate
+from story_schema import normalize_story, log_issues
+from json_responses import install_json_responses
+from deadlines import Deadline, DeadlineExceeded, GenerationCancelled
+from story_compact import story_response
 
 # Set up logging first
 logging.basicConfig(
@@ -508,6 +513,7 @@ Music Score Guidelines:
     - Inappropriate instrumentation"""
 
 app = Flask(__name__)
+install_json_responses(app)
 
 # Ollama API configuration
 OLLAMA_API_URL = os.getenv('OLLAMA_API_URL', 'http://localhost:11434/api/generate')
@@ -515,6 +521,9 @@ OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama3')
 
 def check_ollama_connection():
     """Check if Ollama is running and accessible."""
+    if LLM_BACKEND == 'replay':
+        # Replayed calls never reach Ollama
+        return True
     try:
         response = requests.get(OLLAMA_API_URL.replace('/generate', '/tags'))
         if response.status_code == 200:
@@ -553,7 +562,7 @@ def parse_json_response(response_text: str) -> Dict:
         logger.error(f"Error occurred at position: {e.pos if hasattr(e, 'pos') else 'unknown'}")
         raise
 
-def generate_story_chunk(prompt, chunk_number, total_chunks, previous_character=None, previous_sequence=None):
+def generate_story_chunk(prompt, chunk_number, total_chunks, previous_character=None, previous_sequence=None, deadline=None):
     """Generate a chunk of the story with continuity from previous chunks."""
     chunk_prompt = f"""Create a story about: {prompt}
 This is chunk {chunk_number} of {total_chunks}.
@@ -589,18 +598,18 @@ Maintain visual and narrative continuity with previous sequences.
         }
         
         # Send request to Ollama
-        response = requests.post(OLLAMA_API_URL, json=payload)
-        
-        if response.status_code != 200:
-            logger.error(f"Ollama API error: {response.status_code} - {response.text}")
-            raise Exception(f"Ollama API error: {response.status_code}")
+        if deadline is not None:
+            response_data = deadline.call(ollama_generate, OLLAMA_API_URL, payload, timeout=deadline.timeout())
+        else:
+            response_data = ollama_generate(OLLAMA_API_URL, payload)
         
         # Extract the generated text
-        response_data = response.json()
         generated_text = response_data.get('response', '')
         
-        # Parse the JSON response
-        return parse_json_response(generated_text)
+        # Parse the JSON response and normalize it against the shared story schema
+        story, issues = normalize_story(parse_json_response(generated_text))
+        log_issues(issues, f"chunk {chunk_number}")
+        return story
         
     except Exception as e:
         logger.error(f"Error generating story chunk: {str(e)}")
@@ -625,38 +634,57 @@ def test_model():
         
         # Extract parameters
         prompt = data.get('prompt')
+        try:
+            deadline = Deadline.from_request(data, request.headers)
+        except ValueError as e:
+            return jsonify({'error': str(e), 'status': 'error'}), 400
         
         # Calculate number of chunks needed (aiming for 30-40 sequences total)
         total_chunks = 4  # This will generate ~32-40 sequences
         
-        # Generate first chunk
-        first_chunk = generate_story_chunk(prompt, 1, total_chunks)
-        final_story = first_chunk
-        
-        # Generate subsequent chunks with continuity
-        for chunk_num in range(2, total_chunks + 1):
-            previous_sequence = final_story['sequence'][-1]
-            chunk = generate_story_chunk(
-                prompt, 
-                chunk_num, 
-                total_chunks,
-                previous_character=final_story['character'],
-                previous_sequence=previous_sequence
-            )
-            
-            # Append new sequences while maintaining character consistency
-            final_story['sequence'].extend(chunk['sequence'])
-            
-            # Log progress
-            logger.debug(f"Generated chunk {chunk_num} with {len(chunk['sequence'])} sequences")
+        # Stop between chunks (and abandon the in-flight call) on deadline or client disconnect
+        final_story = None
+        stop_watching = deadline.watch_disconnect(request.environ)
+        try:
+            # Generate first chunk
+            first_chunk = generate_story_chunk(prompt, 1, total_chunks, deadline=deadline)
+            final_story = first_chunk
             
-            # Force garbage collection to prevent memory issues
-            gc.collect()
+            # Generate subsequent chunks with continuity
+            for chunk_num in range(2, total_chunks + 1):
+                deadline.check()
+                previous_sequence = final_story['sequence'][-1] if final_story['sequence'] else None
+                chunk = generate_story_chunk(
+                    prompt, 
+                    chunk_num, 
+                    total_chunks,
+                    previous_character=final_story['character'],
+                    previous_sequence=previous_sequence,
+                    deadline=deadline
+                )
+                
+                # Append new sequences while maintaining character consistency
+                final_story['sequence'].extend(chunk['sequence'])
+                
+                # Log progress
+                logger.debug(f"Generated chunk {chunk_num} with {len(chunk['sequence'])} sequences")
+                
+                # Force garbage collection to prevent memory issues
+                gc.collect()
+        except (DeadlineExceeded, GenerationCancelled) as e:
+            logger.warning(f"Story generation stopped: {str(e)}")
+            if final_story and data.get('allow_partial', False):
+                response = story_response(final_story)
+                response.headers['X-Story-Partial'] = 'true'
+                return response
+            return jsonify({'error': str(e), 'status': 'error'}), 499 if isinstance(e, GenerationCancelled) else 504
+        finally:
+            stop_watching()
         
         # Log final story length
         logger.debug(f"Final story contains {len(final_story['sequence'])} sequences")
         
-        return jsonify(final_story)
+        return story_response(final_story)
             
     except Exception as e:
         logger.error(f"Error testing model: {str(e)}")
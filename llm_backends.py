@@ -0,0 +1,79 @@
+import anthropic
+import logging
+import os
+import time
+from typing import Dict, Any
+
+import requests
+
+from cassette import CassetteStore, RecordingAnthropicClient, ReplayAnthropicClient
+from fake_llm import FakeAnthropicClient
+from provider_limits import LimitedAnthropicClient, ProviderLimiter
+
+logger = logging.getLogger(__name__)
+
+# Backend selection for the story engines.
+#   LLM_BACKEND=anthropic  real provider (default)
+#   LLM_BACKEND=fake       deterministic in-process fake (see fake_llm.py)
+#   LLM_BACKEND=record     real provider, every call saved to LLM_CASSETTE_DIR
+#   LLM_BACKEND=replay     calls served from LLM_CASSETTE_DIR, delays scaled by LLM_REPLAY_TIME_SCALE
+# Ollama engines can also be pointed at `python fake_llm.py` through OLLAMA_API_URL.
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'anthropic')
+LLM_CASSETTE_DIR = os.getenv('LLM_CASSETTE_DIR', 'cassettes')
+LLM_REPLAY_TIME_SCALE = float(os.getenv('LLM_REPLAY_TIME_SCALE', '1.0'))
+# Client-side rate limiting, adaptive concurrency and retries (see provider_limits.py)
+LLM_LIMITER = os.getenv('LLM_LIMITER', '1') != '0'
+
+_cassette_store = None
+
+
+def get_cassette_store() -> CassetteStore:
+    global _cassette_store
+    if _cassette_store is None:
+        _cassette_store = CassetteStore(LLM_CASSETTE_DIR)
+    return _cassette_store
+
+
+def create_anthropic_client(backend=None, limited=None):
+    """Create the client used for messages.create calls (behind a ProviderLimiter unless LLM_LIMITER=0)."""
+    backend = backend or LLM_BACKEND
+    limited = LLM_LIMITER if limited is None else limited
+    if limited:
+        limiter = ProviderLimiter.from_env()
+        logger.info(f"Provider limiter: {limiter.stats()}")
+        return LimitedAnthropicClient(create_anthropic_client(backend, limited=False), limiter)
+    if backend == 'anthropic':
+        # Retries are left to the limiter so they are coordinated across requests
+        return anthropic.Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY'),
+                                   max_retries=0 if LLM_LIMITER else anthropic.DEFAULT_MAX_RETRIES)
+    if backend == 'fake':
+        logger.info("Using fake LLM backend")
+        return FakeAnthropicClient()
+    if backend == 'record':
+        logger.info(f"Recording provider calls to {LLM_CASSETTE_DIR}")
+        return RecordingAnthropicClient(create_anthropic_client('anthropic', limited=False), get_cassette_store())
+    if backend == 'replay':
+        logger.info(f"Replaying provider calls from {LLM_CASSETTE_DIR} (time scale {LLM_REPLAY_TIME_SCALE})")
+        return ReplayAnthropicClient(get_cassette_store(), LLM_REPLAY_TIME_SCALE)
+    raise ValueError(f"Unsupported LLM_BACKEND: {backend}")
+
+
+def ollama_generate(url: str, payload: Dict[str, Any], timeout=None) -> Dict[str, Any]:
+    """POST payload to Ollama's /api/generate and return the response body."""
+    if LLM_BACKEND == 'replay':
+        interaction = get_cassette_store().replay('ollama', payload)
+        delay = interaction['elapsed'] * LLM_REPLAY_TIME_SCALE
+        if delay > 0:
+            time.sleep(delay)
+        return interaction['response']
+
+    start = time.perf_counter()
+    response = requests.post(url, json=payload, timeout=timeout)
+    if response.status_code != 200:
+        logger.error(f"Ollama API error: {response.status_code} - {response.text}")
+        raise Exception(f"Ollama API error: {response.status_code}")
+    response_data = response.json()
+
+    if LLM_BACKEND == 'record':
+        get_cassette_store().record('ollama', payload, response_data, time.perf_counter() - start)
+    return response_data
@@ -0,0 +1,170 @@
+import argparse
+import importlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+import requests
+
+from latency_stats import percentile
+
+# Load-test harness for the story engines.
+#
+# Drive a running service over HTTP:
+#   LLM_BACKEND=fake python StoryGenService.py
+#   python loadtest.py --url http://localhost:5007 --concurrency 8 --requests 100
+#
+# Or drive the Flask app in-process (no server, no ports):
+#   LLM_BACKEND=fake python loadtest.py --app StoryGenService --concurrency 8
+#   OLLAMA_API_URL=http://localhost:11434/api/generate python loadtest.py \
+#       --app olama_api_checkpoint --endpoint /test-model
+
+DEFAULT_ENDPOINT = '/generate-cinematic-story'
+
+
+def build_payload(args) -> Dict:
+    payload = {'prompt': args.prompt}
+    if args.endpoint == DEFAULT_ENDPOINT:
+        payload['num_sequences'] = args.num_sequences
+        if args.genre:
+            payload['genre'] = args.genre
+    return payload
+
+
+class HttpTarget:
+    """Sends requests to a running service."""
+
+    def __init__(self, base_url, endpoint, timeout):
+        self.url = base_url.rstrip('/') + endpoint
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def post(self, payload):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.local.session = requests.Session()
+        response = session.post(self.url, json=payload, timeout=self.timeout)
+        return response.status_code, response.content
+
+
+class AppTarget:
+    """Sends requests to a Flask app through its test client."""
+
+    def __init__(self, module_name, endpoint):
+        self.app = importlib.import_module(module_name).app
+        self.endpoint = endpoint
+
+    def post(self, payload):
+        response = self.app.test_client().post(self.endpoint, json=payload)
+        return response.status_code, response.get_data()
+
+
+def run(target, payload, concurrency, total_requests, duration):
+    """Issue requests from `concurrency` workers; return per-request results."""
+    results = []
+    lock = threading.Lock()
+    issued = [0]
+    deadline = time.perf_counter() + duration if duration else None
+
+    def next_ticket():
+        with lock:
+            if deadline is None and issued[0] >= total_requests:
+                return False
+            if deadline is not None and time.perf_counter() >= deadline:
+                return False
+            issued[0] += 1
+            return True
+
+    def worker():
+        while next_ticket():
+            start = time.perf_counter()
+            try:
+                status, body = target.post(payload)
+                error = None
+                if status >= 400:
+                    error = f"HTTP {status}"
+            except Exception as e:
+                status, body, error = None, b'', type(e).__name__
+            elapsed = time.perf_counter() - start
+            with lock:
+                results.append({'latency': elapsed, 'status': status, 'bytes': len(body), 'error': error})
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    return results, time.perf_counter() - started
+
+
+def summarize(results, wall_time, concurrency) -> Dict:
+    latencies = sorted(r['latency'] for r in results)
+    errors = {}
+    for r in results:
+        if r['error']:
+            errors[r['error']] = errors.get(r['error'], 0) + 1
+    total = len(results)
+    failed = sum(errors.values())
+    return {
+        'concurrency': concurrency,
+        'requests': total,
+        'succeeded': total - failed,
+        'failed': failed,
+        'error_rate': failed / total if total else 0.0,
+        'errors': errors,
+        'wall_time_s': wall_time,
+        'throughput_rps': total / wall_time if wall_time else 0.0,
+        'goodput_rps': (total - failed) / wall_time if wall_time else 0.0,
+        'latency_s': {
+            'mean': sum(latencies) / total if total else 0.0,
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'max': latencies[-1] if latencies else 0.0,
+        },
+        'mean_response_bytes': sum(r['bytes'] for r in results) / total if total else 0.0,
+    }
+
+
+def print_report(report):
+    latency = report['latency_s']
+    print(f"requests:    {report['requests']} ({report['succeeded']} ok, {report['failed']} failed)")
+    print(f"concurrency: {report['concurrency']}")
+    print(f"wall time:   {report['wall_time_s']:.2f}s")
+    print(f"throughput:  {report['throughput_rps']:.2f} req/s (goodput {report['goodput_rps']:.2f} req/s)")
+    print(f"latency:     p50 {latency['p50']:.3f}s  p95 {latency['p95']:.3f}s  "
+          f"p99 {latency['p99']:.3f}s  max {latency['max']:.3f}s")
+    print(f"error rate:  {report['error_rate']:.2%}")
+    for error, count in sorted(report['errors'].items()):
+        print(f"  {error}: {count}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load test the story generation endpoints")
+    target_group = parser.add_mutually_exclusive_group()
+    target_group.add_argument('--url', default='http://localhost:5007', help="Base URL of a running service")
+    target_group.add_argument('--app', help="Module with a Flask `app` to drive in-process")
+    parser.add_argument('--endpoint', default=DEFAULT_ENDPOINT, choices=[DEFAULT_ENDPOINT, '/test-model'])
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=20, help="Total requests (ignored with --duration)")
+    parser.add_argument('--duration', type=float, help="Run for this many seconds instead of a fixed count")
+    parser.add_argument('--prompt', default='A detective searching an abandoned warehouse')
+    parser.add_argument('--genre', default='noir')
+    parser.add_argument('--num-sequences', type=int, default=25)
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--output', help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    if args.app:
+        target = AppTarget(args.app, args.endpoint)
+    else:
+        target = HttpTarget(args.url, args.endpoint, args.timeout)
+
+    results, wall_time = run(target, build_payload(args), args.concurrency, args.requests, args.duration)
+    report = summarize(results, wall_time, args.concurrency)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,79 @@
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Provider Message Batches for non-interactive story generation.
+#
+# Batch jobs skip the synchronous messages.create path (and its rate limits):
+# their chunk requests are submitted through client.messages.batches, which the
+# provider processes asynchronously at batch pricing. A story's chunks depend on
+# the previous chunk, so each round submits the next chunk of every waiting
+# story as one batch, and the stories advance as their batches end.
+
+# Seconds between looking for ended batches and submitting the next round
+BATCH_POLL_INTERVAL = float(os.getenv('STORY_BATCH_POLL_INTERVAL', '30'))
+# Requests per submitted batch (the provider accepts up to 100,000)
+BATCH_MAX_REQUESTS = int(os.getenv('STORY_BATCH_MAX_REQUESTS', '10000'))
+# Batch requests per chunk before its job is failed
+BATCH_MAX_ATTEMPTS = int(os.getenv('STORY_BATCH_MAX_ATTEMPTS', '3'))
+
+
+class BatchResult:
+    """Outcome of one request in an ended batch: a message, or an error description."""
+
+    def __init__(self, custom_id: str, message=None, error: Optional[str] = None):
+        self.custom_id = custom_id
+        self.message = message
+        self.error = error
+
+
+def batches_api(client):
+    """client.messages.batches, or a clear error for backends without it (record/replay)."""
+    batches = getattr(client.messages, "batches", None)
+    if batches is None:
+        raise RuntimeError(f"{type(client).__name__} does not support message batches")
+    return batches
+
+
+def submit_batch(client, requests: List[Dict[str, Any]]) -> str:
+    """Submit [{"custom_id", "params"}] requests as one batch; returns the batch id."""
+    batch = batches_api(client).create(requests=requests)
+    logger.info(f"Submitted message batch {batch.id} with {len(requests)} request(s)")
+    return batch.id
+
+
+def _error_text(result) -> str:
+    error = getattr(result, "error", None)
+    # SDK results nest the error object (ErrorResponse.error); the fake passes a dict
+    error = getattr(error, "error", error)
+    if isinstance(error, dict):
+        return f"{error.get('type')}: {error.get('message')}"
+    if error is not None:
+        return f"{getattr(error, 'type', 'error')}: {getattr(error, 'message', error)}"
+    return result.type
+
+
+def batch_results(client, batch_id: str) -> Optional[Dict[str, BatchResult]]:
+    """Results of an ended batch keyed by custom_id; None while it is still processing."""
+    batches = batches_api(client)
+    try:
+        batch = batches.retrieve(batch_id)
+    except Exception as e:
+        if getattr(e, "status_code", None) != 404:
+            raise
+        # Expired on the provider or submitted to a client that no longer exists:
+        # every request is reported missing and submitted again
+        logger.warning(f"Message batch {batch_id} not found; its requests will be resubmitted")
+        return {}
+    if batch.processing_status != "ended":
+        return None
+    results = {}
+    for entry in batches.results(batch_id):
+        if entry.result.type == "succeeded":
+            results[entry.custom_id] = BatchResult(entry.custom_id, message=entry.result.message)
+        else:
+            # errored, canceled or expired
+            results[entry.custom_id] = BatchResult(entry.custom_id, error=_error_text(entry.result))
+    return results
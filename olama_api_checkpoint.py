@@ -5,6 +5,11 @@ import logging
 import os
 from dotenv import load_dotenv
 from typing import Dict, Any
+from llm_backends import ollama_generate
+from story_schema import normalize_sequence, normalize_story, log_issues
+from json_responses import install_json_responses
+from deadlines import Deadline, DeadlineExceeded, GenerationCancelled
+from story_compact import story_response
 
 # Set up logging first
 logging.basicConfig(
@@ -21,7 +26,7 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 # Ollama API endpoint
-OLLAMA_API_URL = "http://localhost:11434/api/generate"
+OLLAMA_API_URL = os.getenv('OLLAMA_API_URL', 'http://localhost:11434/api/generate')
 
 # System prompt for Llama3.3
 system_prompt = """IMPORTANT: Return ONLY the JSON structure below. Do not add any explanatory text, introductions, or additional formatting before or after the JSON. The response must start with { and end with }.
@@ -93,6 +98,7 @@ Return this exact JSON structure with your story content:
 }"""
 
 app = Flask(__name__)
+install_json_responses(app)
 
 def parse_json_response(response_text: str) -> Dict:
     """Parse JSON response using json module."""
@@ -110,55 +116,13 @@ def parse_json_response(response_text: str) -> Dict:
         logger.error(f"Error occurred at position: {e.pos if hasattr(e, 'pos') else 'unknown'}")
         raise
 
-def validate_and_fix_sequence(sequence):
+def validate_and_fix_sequence(sequence, index=0):
     """Validate and fix sequence fields to ensure correct field names."""
-    required_fields = {
-        "sequence_number": int,
-        "clip_duration": float,
-        "clip_action": str,
-        "voice_narration": str,
-        "type": str,
-        "environment": str,
-        "atmosphere": str,
-        "negative_prompt": str
-    }
-    
-    # Fix common field name issues
-    field_mappings = {
-        "voice_nadration": "voice_narration",
-        "shot": "clip_action",
-        "duration": "clip_duration",
-        "narration": "voice_narration",
-        "location": "environment",
-        "setting": "environment",
-        "mood": "atmosphere",
-        "tone": "atmosphere",
-        "negative": "negative_prompt",
-        "exclude": "negative_prompt"
-    }
-    
-    # Create a new sequence with correct field names
-    fixed_sequence = {}
-    for key, value in sequence.items():
-        # Fix field name if needed
-        fixed_key = field_mappings.get(key, key)
-        fixed_sequence[fixed_key] = value
-    
-    # Add missing required fields with defaults
-    for field, field_type in required_fields.items():
-        if field not in fixed_sequence:
-            if field == "type":
-                fixed_sequence[field] = "b-roll"
-            elif field == "clip_duration":
-                fixed_sequence[field] = 3.0625
-            elif field == "sequence_number":
-                fixed_sequence[field] = len(fixed_sequence) + 1
-            else:
-                fixed_sequence[field] = ""
-    
+    fixed_sequence, issues = normalize_sequence(sequence, index)
+    log_issues(issues, "sequence")
     return fixed_sequence
 
-def generate_story_chunk(prompt, previous_sequences=None):
+def generate_story_chunk(prompt, previous_sequences=None, deadline=None):
     """Generate a chunk of the story using Llama 3.3"""
     try:
         # Construct the full prompt with previous sequences if any
@@ -178,28 +142,28 @@ def generate_story_chunk(prompt, previous_sequences=None):
         logging.debug("================================================================================")
         
         # Make the API call to Ollama
-        response = requests.post(
-            "http://localhost:11434/api/generate",
-            json={
-                "model": "llama3.3",
-                "prompt": full_prompt,
-                "stream": False
-            }
-        )
+        payload = {
+            "model": "llama3.3",
+            "prompt": full_prompt,
+            "stream": False
+        }
+        if deadline is not None:
+            response_data = deadline.call(ollama_generate, OLLAMA_API_URL, payload, timeout=deadline.timeout())
+        else:
+            response_data = ollama_generate(OLLAMA_API_URL, payload)
         
         # Log the raw response for debugging
         logging.debug("================================================================================")
         logging.debug("Raw response from Llama 3.3:")
-        logging.debug(response.text)
+        logging.debug(response_data)
         logging.debug("================================================================================")
         
-        response.raise_for_status()
-        response_text = response.json()['response']
+        response_text = response_data['response']
         parsed_json = parse_json_response(response_text)
         
-        # Validate and fix sequences
-        if 'sequence' in parsed_json:
-            parsed_json['sequence'] = [validate_and_fix_sequence(seq) for seq in parsed_json['sequence']]
+        # Validate and fix the chunk against the shared story schema
+        parsed_json, issues = normalize_story(parsed_json)
+        log_issues(issues, "Llama 3.3 chunk")
         
         return parsed_json
     except Exception as e:
@@ -218,34 +182,53 @@ def test_model():
         
         # Extract parameters
         prompt = data.get('prompt')
+        try:
+            deadline = Deadline.from_request(data, request.headers)
+        except ValueError as e:
+            return jsonify({'error': str(e), 'status': 'error'}), 400
         
         # Calculate number of chunks needed (aiming for 8 sequences total)
         # With 2 sequences per chunk, we need 4 chunks
         total_chunks = 4  # This will generate ~8 sequences
         
-        # Generate first chunk
-        first_chunk = generate_story_chunk(prompt)
-        final_story = first_chunk
-        
-        # Generate subsequent chunks with continuity
-        for chunk_num in range(2, total_chunks + 1):
-            previous_sequence = final_story['sequence'][-1]
-            chunk = generate_story_chunk(
-                prompt,
-                previous_sequences=[previous_sequence]
-            )
-            
-            # Append new sequences while maintaining character consistency
-            final_story['sequence'].extend(chunk['sequence'])
+        # Stop between chunks (and abandon the in-flight call) on deadline or client disconnect
+        final_story = None
+        stop_watching = deadline.watch_disconnect(request.environ)
+        try:
+            # Generate first chunk
+            first_chunk = generate_story_chunk(prompt, deadline=deadline)
+            final_story = first_chunk
             
-            # Log progress
-            logger.debug(f"Generated chunk {chunk_num} with {len(chunk['sequence'])} sequences")
-            logger.debug(f"Total sequences so far: {len(final_story['sequence'])}")
+            # Generate subsequent chunks with continuity
+            for chunk_num in range(2, total_chunks + 1):
+                deadline.check()
+                previous_sequences = final_story['sequence'][-1:] or None
+                chunk = generate_story_chunk(
+                    prompt,
+                    previous_sequences=previous_sequences,
+                    deadline=deadline
+                )
+                
+                # Append new sequences while maintaining character consistency
+                final_story['sequence'].extend(chunk['sequence'])
+                
+                # Log progress
+                logger.debug(f"Generated chunk {chunk_num} with {len(chunk['sequence'])} sequences")
+                logger.debug(f"Total sequences so far: {len(final_story['sequence'])}")
+        except (DeadlineExceeded, GenerationCancelled) as e:
+            logger.warning(f"Story generation stopped: {str(e)}")
+            if final_story and data.get('allow_partial', False):
+                response = story_response(final_story)
+                response.headers['X-Story-Partial'] = 'true'
+                return response
+            return jsonify({'error': str(e), 'status': 'error'}), 499 if isinstance(e, GenerationCancelled) else 504
+        finally:
+            stop_watching()
         
         # Log final story length
         logger.debug(f"Final story contains {len(final_story['sequence'])} sequences")
         
-        return jsonify(final_story)
+        return story_response(final_story)
             
     except Exception as e:
         logger.error(f"Error testing model: {str(e)}")
@@ -259,7 +242,7 @@ def test_model():
 def health_check():
     try:
         # Check if Ollama API is available
-        response = requests.get("http://localhost:11434/api/version")
+        response = requests.get(OLLAMA_API_URL.replace('/generate', '/version'))
         response.raise_for_status()
         
         return jsonify({
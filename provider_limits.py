@@ -0,0 +1,265 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Client-side admission control for provider calls.
+#
+# Every messages.create call first reserves one request from a requests-per-minute
+# bucket, its estimated tokens (prompt size + max_tokens) from a tokens-per-minute
+# bucket, and a slot under an adaptive concurrency limit. Calls that cannot be
+# admitted yet wait in a bounded queue instead of failing. The concurrency limit
+# follows AIMD: it grows by one per limit's worth of successful calls and is
+# halved when the provider answers 429 (rate limited) or 529/503 (overloaded).
+# Those calls are retried with exponential backoff, honouring retry-after.
+
+# Statuses that shrink the concurrency limit
+BACKOFF_STATUS = {429, 503, 529}
+# Statuses worth retrying
+RETRYABLE_STATUS = BACKOFF_STATUS | {500, 502, 504}
+
+
+class AdmissionTimeout(Exception):
+    """A call could not be admitted within the queue wait (or the queue was full)."""
+
+
+def estimate_request_tokens(kwargs: Dict[str, Any]) -> int:
+    """Upper bound on the tokens a messages.create call consumes (about 4 characters per token)."""
+    system = kwargs.get("system") or ""
+    prompt_chars = len(system) if isinstance(system, str) else len(json.dumps(system))
+    for message in kwargs.get("messages", []):
+        content = message.get("content")
+        prompt_chars += len(content) if isinstance(content, str) else len(json.dumps(content))
+    return prompt_chars // 4 + (kwargs.get("max_tokens") or 0)
+
+
+def _error_status(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    value = getattr(error, "retry_after", None)
+    if value is None:
+        headers = getattr(getattr(error, "response", None), "headers", None)
+        value = headers.get("retry-after") if headers is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _is_connection_error(error: Exception) -> bool:
+    # anthropic.APIConnectionError, minus its APITimeoutError subclass (the caller's budget is spent)
+    names = {cls.__name__ for cls in type(error).__mro__}
+    return "APIConnectionError" in names and "APITimeoutError" not in names
+
+
+class TokenBucket:
+    """Refills `per_minute` units per minute, holding at most one minute's worth."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.tokens = self.capacity
+        self.rate = self.capacity / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` units are available (amounts above capacity wait for a full bucket)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount: float):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class ProviderLimiter:
+    """RPM/TPM buckets, AIMD concurrency and retries around provider calls (thread-safe)."""
+
+    def __init__(self, rpm: float = 0, tpm: float = 0, initial_concurrency: int = 8, min_concurrency: int = 1,
+                 max_concurrency: int = 64, max_queue_wait: float = 60.0, max_queue: int = 256,
+                 max_retries: int = 4, base_backoff: float = 0.5, max_backoff: float = 20.0):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.limit = float(initial_concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.max_queue_wait = max_queue_wait
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self.in_flight = 0
+        self.waiting = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self._rng = random.Random()
+        self.counters = {"admitted": 0, "succeeded": 0, "throttled": 0, "retried": 0, "rejected": 0, "failed": 0}
+
+    @classmethod
+    def from_env(cls):
+        """Build a limiter from LLM_* environment variables."""
+        return cls(
+            rpm=float(os.getenv('LLM_RPM', '0')),
+            tpm=float(os.getenv('LLM_TPM', '0')),
+            initial_concurrency=int(os.getenv('LLM_CONCURRENCY', '8')),
+            max_concurrency=int(os.getenv('LLM_MAX_CONCURRENCY', '64')),
+            max_queue_wait=float(os.getenv('LLM_QUEUE_WAIT', '60')),
+            max_queue=int(os.getenv('LLM_MAX_QUEUE', '256')),
+            max_retries=int(os.getenv('LLM_MAX_RETRIES', '4')),
+        )
+
+    def _admission_wait(self, tokens: int, now: float) -> float:
+        if self.in_flight >= int(self.limit):
+            # A slot frees up on release(), which notifies waiters
+            return self.max_queue_wait
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1, now))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(tokens, now))
+        return wait
+
+    def acquire(self, tokens: int, timeout: Optional[float] = None) -> float:
+        """Wait for admission; returns the admission time. Raises AdmissionTimeout."""
+        wait_budget = self.max_queue_wait if timeout is None else min(timeout, self.max_queue_wait)
+        give_up = time.monotonic() + wait_budget
+        with self._cond:
+            if self.waiting >= self.max_queue:
+                self.counters["rejected"] += 1
+                raise AdmissionTimeout(f"Provider queue full ({self.waiting} waiting)")
+            self.waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self._admission_wait(tokens, now)
+                    if wait <= 0:
+                        break
+                    if now >= give_up:
+                        self.counters["rejected"] += 1
+                        raise AdmissionTimeout(f"Not admitted within {wait_budget:.1f}s "
+                                               f"({self.in_flight} in flight, limit {int(self.limit)})")
+                    self._cond.wait(min(wait, give_up - now))
+            finally:
+                self.waiting -= 1
+            if self.requests is not None:
+                self.requests.take(1)
+            if self.tokens is not None:
+                self.tokens.take(tokens)
+            self.in_flight += 1
+            self.counters["admitted"] += 1
+            return now
+
+    def release(self, admitted_at: float, reserved_tokens: int, used_tokens: Optional[int] = None,
+                outcome: str = "ok", status: Optional[int] = None):
+        """Return a slot, refund unused tokens and adapt the concurrency limit.
+
+        outcome is "ok", "throttled" (multiplicative decrease) or "error" (no change).
+        """
+        with self._cond:
+            self.in_flight -= 1
+            if self.tokens is not None and used_tokens is not None and used_tokens < reserved_tokens:
+                self.tokens.refund(reserved_tokens - used_tokens)
+            if outcome == "throttled":
+                self.counters["throttled"] += 1
+                # Halve at most once per congestion event: ignore calls admitted before the last decrease
+                if admitted_at >= self._last_decrease:
+                    self.limit = max(self.min_concurrency, self.limit / 2)
+                    self._last_decrease = time.monotonic()
+                    logger.info(f"Provider throttled ({status}); concurrency limit now {int(self.limit)}")
+            elif outcome == "ok":
+                self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+    def _count(self, name: str):
+        with self._cond:
+            self.counters[name] += 1
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        delay = min(self.max_backoff, self.base_backoff * (2 ** attempt)) * self._rng.uniform(0.5, 1.0)
+        retry_after = _retry_after(error)
+        return max(delay, retry_after) if retry_after is not None else delay
+
+    def call(self, fn, **kwargs):
+        """Run fn(**kwargs) (a messages.create) under admission control, retrying throttled calls.
+
+        A `timeout` kwarg is treated as the budget for queueing, retries and the
+        call itself; each attempt gets whatever is left of it.
+        """
+        reserved = estimate_request_tokens(kwargs)
+        budget = kwargs.get("timeout")
+        give_up = time.monotonic() + budget if budget is not None else None
+
+        attempt = 0
+        while True:
+            remaining = give_up - time.monotonic() if give_up is not None else None
+            admitted_at = self.acquire(reserved, timeout=remaining)
+            if give_up is not None:
+                kwargs["timeout"] = max(0.001, give_up - time.monotonic())
+            try:
+                result = fn(**kwargs)
+            except Exception as e:
+                status = _error_status(e)
+                self.release(admitted_at, reserved, outcome="throttled" if status in BACKOFF_STATUS else "error",
+                             status=status)
+                retryable = status in RETRYABLE_STATUS or _is_connection_error(e)
+                if not retryable or attempt >= self.max_retries:
+                    self._count("failed")
+                    raise
+                delay = self._backoff(attempt, e)
+                if give_up is not None and time.monotonic() + delay >= give_up:
+                    self._count("failed")
+                    raise
+                attempt += 1
+                self._count("retried")
+                logger.warning(f"Provider call failed ({status or type(e).__name__}); "
+                               f"retry {attempt}/{self.max_retries} in {delay:.2f}s")
+                time.sleep(delay)
+                continue
+
+            usage = getattr(result, "usage", None)
+            used = None
+            if usage is not None:
+                used = (getattr(usage, "input_tokens", 0) or 0) + (getattr(usage, "output_tokens", 0) or 0)
+            self.release(admitted_at, reserved, used_tokens=used)
+            self._count("succeeded")
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return dict(self.counters, limit=round(self.limit, 2), in_flight=self.in_flight, waiting=self.waiting)
+
+
+class _LimitedMessages:
+    def __init__(self, inner, limiter):
+        self._inner = inner
+        self._limiter = limiter
+
+    def create(self, **kwargs):
+        return self._limiter.call(self._inner.create, **kwargs)
+
+
+class LimitedAnthropicClient:
+    """Wraps a client so every messages.create goes through a ProviderLimiter."""
+
+    def __init__(self, inner, limiter: ProviderLimiter):
+        self.limiter = limiter
+        self.messages = _LimitedMessages(inner.messages, limiter)
@@ -1,10 +1,30 @@
 from flask import Flask, request, jsonify
 from dotenv import load_dotenv
 import os
-import firebase_admin
-from firebase_admin import credentials, firestore, storage
-from PIL import Image
-import io
+import atexit
+import time
+import logging
+import threading
+from firebase_clients import FirebaseClients, StartupReport
+
+startup = StartupReport()
+with startup.step("imports"):
+    from PIL import Image
+    import io
+    from pipelines import GenerationParams, ScenePrompt, create_pipeline, parse_seed, prompt_seed
+    from character_conditioning import character_text, split_pose
+    from scene_batcher import SceneBatcher
+    from image_cache import ImageCache, encode_png, image_key
+    from broll_index import BrollIndex
+    from storage_backends import create_storage
+    from upload_stage import UploadStage
+    from status_buffer import StatusBuffer, create_status_sink
+    from prompt_compiler import PromptCompiler
+    from post_processing import PostProcessor
+    import numpy as np
+    import requests
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
@@ -12,37 +32,297 @@ load_dotenv()
 # Initialize Flask app
 app = Flask(__name__)
 
-# Initialize Firebase Admin
-cred = credentials.Certificate(os.getenv('FIREBASE_SERVICE_ACCOUNT_PATH'))
-firebase_admin.initialize_app(cred)
-db = firestore.client()
-bucket = storage.bucket()
+# Firebase Admin is initialized on first use (firebase.db(), firebase.bucket()), not at import
+firebase = FirebaseClients.from_env()
+
+# Scenes from concurrent requests share pipeline batches (VISUAL_BACKEND=cpu for the stand-in)
+with startup.step("pipeline"):
+    scene_batcher = SceneBatcher.from_env(create_pipeline())
+# Prompts are fitted to the encoder's token window before they are keyed or rendered
+prompt_compiler = PromptCompiler.from_env(scene_batcher.pipeline.count_tokens)
+STORY_SERVICE_URL = os.getenv('STORY_SERVICE_URL')
+OUTPUT_DIR = os.getenv('OUTPUT_DIR', 'output')
+
+# Identical scenes (same normalized prompt, seed and params) are rendered, stored and uploaded once
+with startup.step("image_cache"):
+    image_cache = ImageCache.from_env(OUTPUT_DIR)
+# Uploads run in the background, overlapping with rendering (STORAGE_BACKEND=local for tests)
+upload_stage = UploadStage.from_env(create_storage(bucket_factory=firebase.bucket), OUTPUT_DIR)
+
+# Grading, thumbnails and web copies on a thread pool sized to the cores
+post_processor = PostProcessor.from_env()
+
+# Progress per project document, coalesced and written in batches (STATUS_BACKEND=local for tests)
+status_buffer = StatusBuffer.from_env(create_status_sink(db_factory=firebase.db))
+atexit.register(status_buffer.flush)
+
+# Rendered b-roll by environment/atmosphere similarity, reused across stories of a genre
+with startup.step("broll_index"):
+    broll_index = BrollIndex.from_env(OUTPUT_DIR)
+startup.finish()
+
+def scene_prompt(scene, character=None):
+    """ScenePrompt for a scene: an explicit prompt, else pose/environment/atmosphere/description.
+
+    A pose's "[previous character traits]" stands for the story's character block, which
+    goes in as the prompt's cached character part rather than being repeated in its text.
+    """
+    if scene.get('prompt'):
+        return ScenePrompt(scene['prompt'])
+    traits = ''
+    parts = []
+    if scene.get('type') == 'character' and scene.get('pose'):
+        uses_traits, pose = split_pose(scene['pose'])
+        if uses_traits:
+            traits = character_text(character)
+        parts.append(pose)
+    parts += [scene.get('environment'), scene.get('atmosphere'), scene.get('description')]
+    return ScenePrompt(', '.join(part for part in parts if part), traits)
+
+def compile_prompt(prompt, negative):
+    """Fit a ScenePrompt's parts to the token budget; returns the compiled prompt and its stats.
+
+    Terms the negative prompt lists are dropped from both parts, and terms the
+    character block has are dropped from the scene text.
+    """
+    character = prompt_compiler.compile(prompt.character, negative.keys)
+    text = prompt_compiler.compile(prompt.text, negative.keys | character.keys)
+    stats = {
+        "tokens": text.tokens,
+        "character_tokens": character.tokens,
+        "dropped": list(character.dropped + text.dropped),
+        "dropped_tokens": character.dropped_tokens + text.dropped_tokens,
+        "deduplicated": character.deduplicated + text.deduplicated
+    }
+    return ScenePrompt(text.text, character.text), stats
+
+def report_prompt_stats(story_id, scenes):
+    """Send a request's truncation stats to the story service in the background (best effort)."""
+    if not (story_id and STORY_SERVICE_URL):
+        return
+    payload = {"budget": prompt_compiler.budget, "scenes": scenes}
+    url = f"{STORY_SERVICE_URL.rstrip('/')}/stories/{story_id}/prompt-stats"
+
+    def send():
+        try:
+            requests.post(url, json=payload, timeout=10).raise_for_status()
+        except requests.RequestException as e:
+            logger.warning(f"Could not report prompt stats for story {story_id}: {e}")
+
+    threading.Thread(target=send, daemon=True).start()
+
+def report_progress(project_id, visuals, stage=None):
+    """Buffer a progress update for the project's status document (no-op without a project_id)."""
+    if not project_id:
+        return
+    fields = {"visuals": visuals, "updated_at": time.time()}
+    if stage:
+        fields["stage"] = stage
+    status_buffer.update(project_id, fields)
+
+SCENE_TEXT_FIELDS = ('prompt', 'type', 'pose', 'environment', 'atmosphere', 'description', 'negative_prompt')
+
+def scene_error(scene):
+    """Why a scene cannot be rendered as given, or None; params and seed are checked by their parsers."""
+    if not isinstance(scene, dict):
+        return f"expected an object, got {type(scene).__name__}"
+    for field in SCENE_TEXT_FIELDS:
+        if scene.get(field) is not None and not isinstance(scene[field], str):
+            return f"{field} must be a string, got {type(scene[field]).__name__}"
+    return None
+
+def scene_id(scene, index):
+    number = scene.get('scene_number', scene.get('sequence_number'))
+    return str(index + 1 if number is None else number)
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({"status": "healthy"}), 200
+    """Liveness plus startup timings; answers without touching Firebase."""
+    return jsonify({
+        "status": "healthy",
+        "startup": startup.to_dict(),
+        "firebase": firebase.status()
+    }), 200
+
+@app.route('/batcher', methods=['GET'])
+def batcher_stats():
+    """Pipeline batches, image cache, b-roll reuse and upload statistics."""
+    return jsonify({
+        "batcher": scene_batcher.stats(),
+        "image_cache": image_cache.stats(),
+        "broll_reuse": broll_index.stats(),
+        "character_conditioning": scene_batcher.pipeline.conditioning.stats(),
+        "prompts": prompt_compiler.stats(),
+        "post_processing": post_processor.stats(),
+        "uploads": upload_stage.stats(),
+        "status_writes": status_buffer.stats()
+    }), 200
 
 @app.route('/generate-visuals', methods=['POST'])
 def generate_visuals():
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not isinstance(data.get('scenes', []), list):
+            return jsonify({"error": "Body must be a JSON object with a list of scenes"}), 400
+        if data.get('character') is not None and not isinstance(data['character'], dict):
+            return jsonify({"error": "character must be an object"}), 400
         
         # Extract scene descriptions
         scenes = data.get('scenes', [])
+        # Every scene is checked before any image is claimed, so a bad one cannot leave renders pending
+        scene_settings = []
+        for index, scene in enumerate(scenes):
+            error = scene_error(scene)
+            if error is None:
+                try:
+                    scene_settings.append((GenerationParams.from_request(data, scene),
+                                           parse_seed(scene['seed']) if 'seed' in scene else None))
+                except ValueError as e:
+                    error = str(e)
+            if error is not None:
+                return jsonify({"error": f"scenes[{index}]: {error}", "scene_index": index}), 400
+        project_id = data.get('project_id')
+        # Stage boundary: written now; per-scene progress below is coalesced until the next flush
+        report_progress(project_id, {"status": "running", "total": len(scenes), "rendered": 0}, stage="visuals")
+        status_buffer.flush()
+        
+        genre = data.get('genre') or (data.get('movie_info') or {}).get('genre')
+        reuse_broll = data.get('reuse_broll', True)
+        character = data.get('character')
+        
+        # Queue every uncached scene at once so they batch with each other and with other requests
+        pending = []
+        for scene, (params, seed) in zip(scenes, scene_settings):
+            negative = prompt_compiler.compile(params.negative_prompt)
+            params = params._replace(negative_prompt=negative.text)
+            prompt, prompt_stats = compile_prompt(scene_prompt(scene, character), negative)
+            if seed is None:
+                seed = prompt_seed(prompt.full_text)
+            broll = scene.get('type') == 'b-roll'
+            reused = None
+            # A scene with an explicit seed asks for that exact image
+            if broll and reuse_broll and 'seed' not in scene:
+                reused = broll_index.find(scene.get('environment'), scene.get('atmosphere'), genre,
+                                          params.width, params.height, available=image_cache.__contains__)
+            if reused:
+                key = reused['image_key']
+                # Never claimed: if it was evicted since the index was checked, this scene is rendered instead
+                image, owner = image_cache.lookup(key, claim=False)
+                if image is None:
+                    reused = None
+            if not reused:
+                key = image_key(prompt.full_text, seed, params)
+                image, owner = image_cache.lookup(key)
+            render = scene_batcher.submit(prompt, params, seed) if owner else None
+            pending.append((scene, seed, key, image, render, reused, broll, prompt_stats))
+        
+        # Post-processed frames upload as soon as their batch is done; the earliest batches first
+        processing = []  # (indexes, Future of [Derivatives])
+        uploads = {}  # index -> {result field: upload Future}
+
+        def start_uploads(wait):
+            while processing and (wait or processing[0][1].done()):
+                indexes, outputs = processing.pop(0)
+                for index, output in zip(indexes, outputs.result()):
+                    scene, key = pending[index][0], pending[index][2]
+                    # The grade depends on the scene's atmosphere, so a reused render can yield several looks
+                    name = f"visuals/{key}-{output.grade}"
+                    uploads[index] = {
+                        "image_url": upload_stage.submit(f"{name}.png", output.full),
+                        "thumbnail_url": upload_stage.submit(f"{name}-thumb.jpg", output.thumbnail, "image/jpeg"),
+                        "web_url": upload_stage.submit(f"{name}-web.jpg", output.web, "image/jpeg")
+                    }
+                    if project_id:
+                        sid = scene_id(scene, index)
+                        uploads[index]["image_url"].add_done_callback(
+                            lambda f, sid=sid: f.exception() is None and report_progress(
+                                project_id, {"scenes": {sid: {"status": "uploaded", "image_url": f.result()}}}))
+        
+        # Every render this request owns is stored (or failed) before anything else is waited on, so
+        # requests coalescing on those keys never wait forever, even on each other. Frames finished
+        # together (one pipeline batch) are graded and resized together, off the request thread, while
+        # later batches are still rendering; cached and reused scenes follow once they are ready.
+        error = None
+        indexed = False
+        rendered_scenes = 0
+        owned = [index for index, entry in enumerate(pending) if entry[4] is not None]
+        batch = []  # (index, frame as an array, or PNG bytes for cached scenes)
+
+        def frame_ready(index, frame):
+            nonlocal rendered_scenes
+            batch.append((index, frame))
+            rendered_scenes += 1
+            if project_id:
+                scene, key = pending[index][0], pending[index][2]
+                report_progress(project_id, {"rendered": rendered_scenes, "scenes": {
+                    scene_id(scene, index): {"status": "rendered", "image_key": key}}})
+
+        def process_batch():
+            processing.append(([i for i, _ in batch], post_processor.submit(
+                [frame for _, frame in batch], [pending[i][0].get('atmosphere') for i, _ in batch])))
+            del batch[:]
+
+        for position, index in enumerate(owned):
+            scene, seed, key, image, render, reused, broll, prompt_stats = pending[index]
+            try:
+                rendered = render.result()
+                image_cache.put(key, encode_png(rendered))
+            except Exception as e:
+                image_cache.fail(key, e)
+                error = error or e
+                continue
+            if error is not None:
+                continue
+            try:
+                if broll:
+                    broll_index.add(key, scene.get('environment'), scene.get('atmosphere'), genre,
+                                    rendered.width, rendered.height, rendered.info.get('render_seconds', 0.0))
+                    indexed = True
+                frame_ready(index, np.asarray(rendered.convert('RGB')))
+                following = owned[position + 1] if position + 1 < len(owned) else None
+                if following is None or not pending[following][4].done():
+                    process_batch()
+                start_uploads(wait=False)
+            except Exception as e:
+                error = e
+        try:
+            if error is None:
+                for index, (scene, seed, key, image, render, reused, broll, prompt_stats) in enumerate(pending):
+                    if render is None:
+                        frame_ready(index, image.result())
+                if batch:
+                    process_batch()
+                start_uploads(wait=True)
+        except Exception as e:
+            error = e
+        if indexed:
+            broll_index.save()
+        if error is not None:
+            report_progress(project_id, {"status": "failed", "error": str(error)})
+            status_buffer.flush()
+            raise error
+        
+        results = []
+        for index, (scene, seed, key, image, render, reused, broll, prompt_stats) in enumerate(pending):
+            result = {
+                "scene_number": scene.get('scene_number', scene.get('sequence_number')),
+                "seed": seed,
+                "image_key": key,
+                "cached": render is None,
+                "prompt": prompt_stats
+            }
+            result.update((field, upload.result()) for field, upload in uploads[index].items())
+            if reused:
+                result["reused"] = {"similarity": reused['similarity']}
+            results.append(result)
+        visuals = {"scenes": results}
+        report_prompt_stats(data.get('story_id'), [
+            dict(result["prompt"], sequence_number=result["scene_number"]) for result in results
+        ])
+        report_progress(project_id, {"status": "done"})
+        status_buffer.flush()
         
-        # TODO: Implement Stable Diffusion integration
-        # For now, return mock image URLs
-        mock_visuals = {
-            "scenes": [
-                {
-                    "scene_number": scene.get('scene_number'),
-                    "image_url": f"https://storage.googleapis.com/{bucket.name}/mock_scene_{scene.get('scene_number')}.png"
-                }
-                for scene in scenes
-            ]
-        }
-        
-        return jsonify(mock_visuals), 200
+        return jsonify(visuals), 200
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
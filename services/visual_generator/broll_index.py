@@ -0,0 +1,168 @@
+import json
+import logging
+import os
+import re
+import threading
+import zlib
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Similarity index over rendered b-roll, so a new b-roll scene can reuse an
+# existing image instead of a fresh GPU render.
+#
+# A scene's environment and atmosphere are turned into hashed bag-of-words
+# vectors (unigrams and bigrams, signed feature hashing), each L2-normalized and
+# mixed by ENVIRONMENT_WEIGHT, so the cosine similarity of two scenes is a dot
+# product. All vectors live in one float32 matrix; a query scores every
+# candidate with a single matrix-vector product, masked to the same genre and
+# resolution. Reuses above the threshold count the GPU seconds the original
+# render took as saved.
+
+FEATURES = 4096
+ENVIRONMENT_WEIGHT = 0.7
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def _hash_features(text: str) -> np.ndarray:
+    tokens = _TOKEN.findall((text or "").lower())
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    vector = np.zeros(FEATURES, dtype=np.float32)
+    if not grams:
+        return vector
+    hashes = np.array([zlib.crc32(gram.encode("utf-8")) for gram in grams], dtype=np.uint32)
+    # The top bit picks the sign, so collisions cancel out instead of piling up
+    signs = np.where(hashes >> 31, -1.0, 1.0).astype(np.float32)
+    np.add.at(vector, hashes % FEATURES, signs)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def scene_features(environment: str, atmosphere: str) -> np.ndarray:
+    """Unit vector for a scene's environment and atmosphere."""
+    vector = ENVIRONMENT_WEIGHT * _hash_features(environment) + (1 - ENVIRONMENT_WEIGHT) * _hash_features(atmosphere)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class BrollIndex:
+    """Cosine-similarity index of rendered b-roll images (thread-safe), saved to `path`."""
+
+    def __init__(self, path: Optional[str] = None, threshold: float = 0.9):
+        self.path = path
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((256, FEATURES), dtype=np.float32)
+        self._genres = np.zeros(256, dtype=np.int32)
+        self._sizes = np.zeros((256, 2), dtype=np.int32)
+        self._entries = []  # {"image_key", "gpu_seconds", "genre", "width", "height"} per row
+        self._genre_ids = {}
+        self._keys = set()
+        self.counters = {"queries": 0, "hits": 0, "gpu_seconds_saved": 0.0}
+        if path and os.path.exists(path):
+            self._load()
+
+    @classmethod
+    def from_env(cls, output_dir: str):
+        return cls(os.path.join(output_dir, "broll_index.npz"), float(os.getenv('BROLL_REUSE_THRESHOLD', '0.9')))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _genre_id(self, genre: Optional[str]) -> int:
+        genre = (genre or "").lower()
+        if genre not in self._genre_ids:
+            self._genre_ids[genre] = len(self._genre_ids)
+        return self._genre_ids[genre]
+
+    def _grow(self):
+        """Double the row capacity."""
+        self._vectors = np.concatenate([self._vectors, np.zeros_like(self._vectors)])
+        self._genres = np.concatenate([self._genres, np.zeros_like(self._genres)])
+        self._sizes = np.concatenate([self._sizes, np.zeros_like(self._sizes)])
+
+    def add(self, image_key: str, environment: str, atmosphere: str, genre: Optional[str],
+            width: int, height: int, gpu_seconds: float = 0.0):
+        with self._lock:
+            if image_key in self._keys:
+                return
+            row = len(self._entries)
+            if row == len(self._vectors):
+                self._grow()
+            self._vectors[row] = scene_features(environment, atmosphere)
+            self._genres[row] = self._genre_id(genre)
+            self._sizes[row] = (width, height)
+            self._entries.append({"image_key": image_key, "gpu_seconds": gpu_seconds, "genre": (genre or "").lower(),
+                                  "width": width, "height": height})
+            self._keys.add(image_key)
+
+    def find(self, environment: str, atmosphere: str, genre: Optional[str], width: int, height: int,
+             available=None) -> Optional[Dict[str, Any]]:
+        """Most similar rendered b-roll of the same genre and size above the threshold, or None.
+
+        Records the query (and the saved GPU time on a hit) in the stats. Matches
+        for which available(image_key) is false (e.g. evicted images) are
+        dropped from the index.
+        """
+        query = scene_features(environment, atmosphere)
+        with self._lock:
+            self.counters["queries"] += 1
+            count = len(self._entries)
+            genre_id = self._genre_ids.get((genre or "").lower())
+            if not count or genre_id is None:
+                return None
+            scores = self._vectors[:count] @ query
+            mask = (self._genres[:count] == genre_id) & np.all(self._sizes[:count] == (width, height), axis=1)
+            scores = np.where(mask, scores, -1.0)
+            for row in np.argsort(scores)[::-1]:
+                if scores[row] < self.threshold:
+                    return None
+                entry = self._entries[row]
+                if available is not None and not available(entry["image_key"]):
+                    # A zero vector never matches again
+                    self._vectors[row] = 0.0
+                    self._keys.discard(entry["image_key"])
+                    continue
+                self.counters["hits"] += 1
+                self.counters["gpu_seconds_saved"] += entry["gpu_seconds"]
+                return dict(entry, similarity=round(float(scores[row]), 4))
+            return None
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            count = len(self._entries)
+            tmp_path = f"{self.path}.tmp.npz"
+            np.savez(tmp_path, vectors=self._vectors[:count], entries=json.dumps(self._entries))
+            os.replace(tmp_path, self.path)
+
+    def _load(self):
+        with np.load(self.path) as saved:
+            vectors = saved["vectors"]
+            entries = json.loads(str(saved["entries"]))
+        for vector, entry in zip(vectors, entries):
+            row = len(self._entries)
+            if row == len(self._vectors):
+                self._grow()
+            self._vectors[row] = vector
+            self._genres[row] = self._genre_id(entry["genre"])
+            self._sizes[row] = (entry["width"], entry["height"])
+            self._entries.append(entry)
+            self._keys.add(entry["image_key"])
+        logger.info(f"Loaded {len(self._entries)} b-roll images from {self.path}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            queries = self.counters["queries"]
+            return {
+                "entries": len(self._entries),
+                "threshold": self.threshold,
+                "queries": queries,
+                "hits": self.counters["hits"],
+                "hit_rate": round(self.counters["hits"] / queries, 3) if queries else 0.0,
+                "gpu_seconds_saved": round(self.counters["gpu_seconds_saved"], 2),
+            }
@@ -0,0 +1,111 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Text conditioning shared across a story's character scenes.
+#
+# Every character pose starts with "[previous character traits]", which stands
+# for the story's whole character block (base traits, facial features,
+# distinctive features, clothing). Encoding that block again for each frame
+# repeats the same text-encoder work, so a scene's conditioning is built from
+# two parts: the character block, encoded once per story and cached here keyed
+# by its text, and the scene's own delta (pose, environment, atmosphere),
+# encoded per scene. The pipeline concatenates the two along the token axis.
+# The cache is LRU-bounded (CHARACTER_CACHE_SIZE entries) and concurrent
+# requests for a block that is still encoding share one encode.
+
+CHARACTER_PLACEHOLDER = "[previous character traits]"
+CHARACTER_FIELDS = ("base_traits", "facial_features", "distinctive_features", "clothing")
+
+_PLACEHOLDER = re.compile(r"\s*" + re.escape(CHARACTER_PLACEHOLDER) + r"\s*,?", re.IGNORECASE)
+
+
+def character_text(character) -> str:
+    """The story's character block as one prompt fragment, fields in a fixed order."""
+    if not character:
+        return ""
+    return ", ".join(str(character[field]).strip() for field in CHARACTER_FIELDS if character.get(field))
+
+
+def split_pose(pose: str) -> Tuple[bool, str]:
+    """(whether the pose refers to the character block, the pose without the placeholder)."""
+    pose = pose or ""
+    delta, count = _PLACEHOLDER.subn(" ", pose)
+    return count > 0, ", ".join(part.strip() for part in delta.split(",") if part.strip())
+
+
+def conditioning_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ConditioningCache:
+    """Encoder outputs keyed by the text they encode, LRU-bounded (thread-safe)."""
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (conditioning, encode seconds)
+        self._pending = {}  # key -> Future, while its owner encodes it
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "encode_seconds": 0.0, "seconds_saved": 0.0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(int(os.getenv('CHARACTER_CACHE_SIZE', '64')))
+
+    def get(self, text: str, encode: Callable[[str], Any]):
+        """Conditioning for text, calling encode(text) only if no earlier call produced it."""
+        key = conditioning_key(text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                self.counters["seconds_saved"] += entry[1]
+                return entry[0]
+            pending = self._pending.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._pending[key] = Future()
+                self.counters["misses"] += 1
+            else:
+                self.counters["hits"] += 1
+        if not owner:
+            return pending.result()
+
+        started = time.perf_counter()
+        try:
+            conditioning = encode(text)
+        except Exception as e:
+            with self._lock:
+                del self._pending[key]
+            pending.set_exception(e)
+            raise
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            del self._pending[key]
+            self._entries[key] = (conditioning, elapsed)
+            self.counters["encode_seconds"] += elapsed
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters["evictions"] += 1
+        pending.set_result(conditioning)
+        return conditioning
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return dict(
+                self.counters,
+                encode_seconds=round(self.counters["encode_seconds"], 3),
+                seconds_saved=round(self.counters["seconds_saved"], 3),
+                entries=len(self._entries),
+                hit_rate=round(self.counters["hits"] / lookups, 3) if lookups else 0.0,
+            )
@@ -0,0 +1,109 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict
+
+logger = logging.getLogger(__name__)
+
+# Firebase clients created on first use instead of at import.
+#
+# Importing firebase_admin, loading the service account and creating the
+# Firestore/Storage clients is slow and fails without credentials, so none of it
+# happens until a request needs the database or the bucket. One lock makes the
+# initialization happen once even when the first requests arrive together; a
+# failed attempt is retried by the next caller. With STORAGE_BACKEND=local the
+# service never touches Firebase at all.
+
+
+class FirebaseClients:
+    """Lazily initialized firebase_admin app, Firestore client and Storage bucket (thread-safe)."""
+
+    def __init__(self, service_account_path: str = None, storage_bucket: str = None):
+        self.service_account_path = service_account_path
+        self.storage_bucket = storage_bucket
+        self._lock = threading.Lock()
+        self._app = None
+        self._db = None
+        self._bucket = None
+        self.timings = {}
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.getenv('FIREBASE_SERVICE_ACCOUNT_PATH'), os.getenv('FIREBASE_STORAGE_BUCKET'))
+
+    def _timed(self, name: str, create):
+        started = time.perf_counter()
+        value = create()
+        self.timings[name] = round(time.perf_counter() - started, 3)
+        logger.info(f"Firebase {name} ready in {self.timings[name]}s")
+        return value
+
+    def _initialize_app(self):
+        import firebase_admin
+        from firebase_admin import credentials
+
+        cred = credentials.Certificate(self.service_account_path)
+        options = {'storageBucket': self.storage_bucket} if self.storage_bucket else None
+        return firebase_admin.initialize_app(cred, options)
+
+    def app(self):
+        if self._app is None:
+            with self._lock:
+                if self._app is None:
+                    self._app = self._timed("app", self._initialize_app)
+        return self._app
+
+    def db(self):
+        """Firestore client."""
+        if self._db is None:
+            app = self.app()
+            with self._lock:
+                if self._db is None:
+                    from firebase_admin import firestore
+                    self._db = self._timed("firestore", lambda: firestore.client(app))
+        return self._db
+
+    def bucket(self):
+        """Default Storage bucket."""
+        if self._bucket is None:
+            app = self.app()
+            with self._lock:
+                if self._bucket is None:
+                    from firebase_admin import storage
+                    self._bucket = self._timed("storage", lambda: storage.bucket(app=app))
+        return self._bucket
+
+    def status(self) -> Dict[str, Any]:
+        """What has been initialized so far; never initializes anything itself."""
+        return {
+            "app": self._app is not None,
+            "firestore": self._db is not None,
+            "storage": self._bucket is not None,
+            "init_seconds": dict(self.timings),
+        }
+
+
+class StartupReport:
+    """Seconds spent in each startup step, logged and served by /health."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.steps = {}
+
+    @contextmanager
+    def step(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps[name] = round(time.perf_counter() - started, 3)
+
+    def finish(self) -> Dict[str, Any]:
+        self.total = round(time.perf_counter() - self.started, 3)
+        logger.info(f"Startup took {self.total}s: {self.steps}")
+        return self.to_dict()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"total_seconds": getattr(self, "total", None), "steps": dict(self.steps)}
@@ -0,0 +1,173 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Content-addressed store for generated images.
+#
+# An image is identified by the sha256 of its normalized prompt, seed and
+# GenerationParams, so the same scene rendered twice (in one story, across
+# stories, or on a re-render) is produced, stored and uploaded once. PNG bytes
+# are kept on local disk under <dir>/<key[:2]>/<key>.png, evicting the least
+# recently used files beyond max_bytes (MAX_STORAGE_GB). Concurrent requests for
+# a key that is still rendering share one render.
+
+_SPACES = re.compile(r"\s+")
+_COMMAS = re.compile(r"\s*,\s*")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Lowercase (CLIP's tokenizer does too), collapse whitespace and tidy commas."""
+    prompt = _SPACES.sub(" ", (prompt or "").lower()).strip()
+    return _COMMAS.sub(", ", prompt).strip(", ")
+
+
+def image_key(prompt: str, seed: int, params) -> str:
+    params = params._replace(negative_prompt=normalize_prompt(params.negative_prompt))
+    payload = json.dumps([normalize_prompt(prompt), seed, list(params)], separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def encode_png(image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class ImageCache:
+    """Disk tier of PNG bytes keyed by image_key, LRU-bounded by size (thread-safe)."""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> size, least recently used first
+        self._pending = {}  # key -> Future of bytes, while its owner renders it
+        self.total_bytes = 0
+        self.counters = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+        self._load()
+
+    @classmethod
+    def from_env(cls, output_dir: str):
+        return cls(os.path.join(output_dir, "cache"), int(float(os.getenv('MAX_STORAGE_GB', '100')) * 1024 ** 3))
+
+    def _load(self):
+        """Index images left by earlier runs, oldest access first."""
+        files = []
+        if os.path.isdir(self.directory):
+            for shard in os.listdir(self.directory):
+                shard_dir = os.path.join(self.directory, shard)
+                if not os.path.isdir(shard_dir):
+                    continue
+                for name in os.listdir(shard_dir):
+                    if name.endswith(".png"):
+                        stat = os.stat(os.path.join(shard_dir, name))
+                        files.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self.total_bytes += size
+        with self._lock:
+            self._evict()
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.png")
+
+    def _read(self, key: str):
+        try:
+            with open(self.path(key), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        # mtime doubles as last access, so LRU order survives restarts
+        os.utime(self.path(key))
+        return data
+
+    def lookup(self, key: str, claim: bool = True) -> Tuple[Optional[Future], bool]:
+        """Future of the PNG bytes for key, and whether the caller must render them.
+
+        An owner (True) must call put() or fail(); everyone else just waits. With
+        claim=False a key that is neither stored nor rendering is left unclaimed
+        and the Future is None.
+        """
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is not None:
+                self.counters["coalesced"] += 1
+                return pending, False
+            cached = key in self._entries
+            if cached:
+                self._entries.move_to_end(key)
+        data = self._read(key) if cached else None
+        future = Future()
+        with self._lock:
+            if data is not None:
+                self.counters["hits"] += 1
+                future.set_result(data)
+                return future, False
+            if key in self._pending:
+                # Another request claimed the key while we read
+                self.counters["coalesced"] += 1
+                return self._pending[key], False
+            if cached:
+                # Removed from disk behind our back
+                self.total_bytes -= self._entries.pop(key, 0)
+            if not claim:
+                return None, False
+            self.counters["misses"] += 1
+            self._pending[key] = future
+            return future, True
+
+    def put(self, key: str, data: bytes):
+        """Store a rendered image and hand it to everyone waiting for it."""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.total_bytes += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._evict()
+            future = self._pending.pop(key, None)
+        if future is not None:
+            future.set_result(data)
+
+    def fail(self, key: str, error: Exception):
+        with self._lock:
+            future = self._pending.pop(key, None)
+        if future is not None:
+            future.set_exception(error)
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            self.counters["evictions"] += 1
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"] + self.counters["coalesced"]
+            return dict(
+                self.counters,
+                entries=len(self._entries),
+                bytes=self.total_bytes,
+                max_bytes=self.max_bytes,
+                hit_rate=round((lookups - self.counters["misses"]) / lookups, 3) if lookups else 0.0,
+            )
@@ -0,0 +1,240 @@
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from typing import List, NamedTuple
+
+import numpy as np
+from PIL import Image
+
+from character_conditioning import ConditioningCache
+from prompt_compiler import approximate_tokens, parse_weighted
+
+logger = logging.getLogger(__name__)
+
+# Image generation backends for the scene batcher.
+#   VISUAL_BACKEND=diffusers  Stable Diffusion through diffusers on the GPU (default)
+#   VISUAL_BACKEND=cpu        deterministic CPU stand-in for tests and local runs
+# Every backend renders a whole batch of prompts that share GenerationParams in
+# one call; the per-image seeds keep each frame reproducible whatever batch it
+# lands in. A prompt is a ScenePrompt: the story's character block, whose
+# encoding comes from the pipeline's ConditioningCache, plus the scene's text.
+
+
+# Seeds are 32-bit, like the ones prompt_seed derives
+MAX_SEED = 2 ** 32 - 1
+
+
+def _positive(name: str, value, kind):
+    """value as a positive int or finite float; ValueError naming the field otherwise."""
+    noun = "integer" if kind is int else "number"
+    if isinstance(value, bool):
+        raise ValueError(f"{name} must be a positive {noun}, got {value!r}")
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a positive {noun}, got {value!r}") from None
+    if not math.isfinite(number) or number <= 0 or (kind is int and not number.is_integer()):
+        raise ValueError(f"{name} must be a positive {noun}, got {value!r}")
+    return kind(number)
+
+
+class GenerationParams(NamedTuple):
+    """Settings that must match for scenes to share a pipeline call."""
+    width: int
+    height: int
+    steps: int
+    guidance_scale: float
+    negative_prompt: str
+
+    @classmethod
+    def from_request(cls, data, scene=None):
+        """Request values (a scene's own negative_prompt first) over the SD_* defaults.
+
+        Raises ValueError naming the field when a value is not usable.
+        """
+        scene = scene or {}
+        negative_prompt = scene.get('negative_prompt') or data.get('negative_prompt') or ''
+        if not isinstance(negative_prompt, str):
+            raise ValueError(f"negative_prompt must be a string, got {type(negative_prompt).__name__}")
+        return cls(
+            width=_positive('width', data.get('width') or os.getenv('SD_WIDTH', '512'), int),
+            height=_positive('height', data.get('height') or os.getenv('SD_HEIGHT', '512'), int),
+            steps=_positive('steps', data.get('steps') or os.getenv('SD_NUM_INFERENCE_STEPS', '50'), int),
+            guidance_scale=_positive('guidance_scale',
+                                     data.get('guidance_scale') or os.getenv('SD_GUIDANCE_SCALE', '7.5'), float),
+            negative_prompt=negative_prompt,
+        )
+
+
+class ScenePrompt(NamedTuple):
+    """A scene's own text and the character block (empty for b-roll) it is conditioned on."""
+    text: str
+    character: str = ""
+
+    @property
+    def full_text(self) -> str:
+        return ", ".join(part for part in (self.character, self.text) if part)
+
+
+def prompt_seed(prompt: str) -> int:
+    """Stable seed for a prompt when the request does not pick one."""
+    return int.from_bytes(hashlib.sha256(prompt.encode('utf-8')).digest()[:4], 'big')
+
+
+def parse_seed(value) -> int:
+    """A client-chosen seed: an integer (or integer string) from 0 to MAX_SEED."""
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"seed must be an integer, got {value!r}")
+    try:
+        seed = int(value)
+    except ValueError:
+        raise ValueError(f"seed must be an integer, got {value!r}") from None
+    if not 0 <= seed <= MAX_SEED:
+        raise ValueError(f"seed must be between 0 and {MAX_SEED}, got {seed}")
+    return seed
+
+
+class CPUPipeline:
+    """Renders deterministic gradient images derived from prompt and seed.
+
+    batch_overhead/seconds_per_image simulate the fixed and per-image cost of a
+    GPU call, so batching gains can be measured without a GPU.
+    """
+
+    def __init__(self, max_batch_size: int = 8, batch_overhead: float = 0.0, seconds_per_image: float = 0.0,
+                 seconds_per_encode: float = 0.0, conditioning: ConditioningCache = None):
+        self.max_batch_size = max_batch_size
+        self.batch_overhead = batch_overhead
+        self.seconds_per_image = seconds_per_image
+        self.seconds_per_encode = seconds_per_encode
+        self.conditioning = conditioning or ConditioningCache()
+
+    def count_tokens(self, text: str) -> int:
+        return approximate_tokens(text)
+
+    def _encode(self, text: str) -> np.ndarray:
+        if self.seconds_per_encode > 0:
+            time.sleep(self.seconds_per_encode)
+        return np.frombuffer(hashlib.sha256(text.encode('utf-8')).digest(), dtype=np.uint8)
+
+    def generate(self, prompts: List[ScenePrompt], params: GenerationParams, seeds: List[int]) -> List[Image.Image]:
+        # Simulated encoder work, with the character block cached like the real pipeline's
+        for prompt in prompts:
+            self.conditioning.get(prompt.character, self._encode)
+            self._encode(prompt.text)
+        delay = self.batch_overhead + self.seconds_per_image * len(prompts)
+        if delay > 0:
+            time.sleep(delay)
+        images = []
+        for prompt, seed in zip(prompts, seeds):
+            digest = hashlib.sha256(f"{seed}:{prompt.full_text}:{params}".encode('utf-8')).digest()
+            top = np.frombuffer(digest[:3], dtype=np.uint8).astype(np.float32)
+            bottom = np.frombuffer(digest[3:6], dtype=np.uint8).astype(np.float32)
+            ramp = np.linspace(0.0, 1.0, params.height, dtype=np.float32)[:, None, None]
+            rows = top * (1 - ramp) + bottom * ramp
+            pixels = np.broadcast_to(rows, (params.height, params.width, 3)).astype(np.uint8)
+            images.append(Image.fromarray(pixels, 'RGB'))
+        return images
+
+
+class DiffusersPipeline:
+    """Stable Diffusion on the GPU; the model is loaded on first use."""
+
+    def __init__(self, model_path: str, device: str = 'cuda', max_batch_size: int = 4,
+                 conditioning: ConditioningCache = None):
+        self.model_path = model_path
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.conditioning = conditioning or ConditioningCache()
+        self._pipe = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._pipe is None:
+                import torch
+                from diffusers import StableDiffusionPipeline
+
+                started = time.perf_counter()
+                pipe = StableDiffusionPipeline.from_pretrained(self.model_path, torch_dtype=torch.float16)
+                self._pipe = pipe.to(self.device)
+                logger.info(f"Loaded {self.model_path} in {time.perf_counter() - started:.1f}s")
+        return self._pipe
+
+    def count_tokens(self, text: str) -> int:
+        return len(self._load().tokenizer(text, add_special_tokens=False).input_ids)
+
+    def _encode(self, text: str):
+        """CLIP text-encoder output for one 77-token chunk, shape (1, 77, hidden), with term weights applied."""
+        import torch
+
+        pipe = self._load()
+        tokenizer = pipe.tokenizer
+        comma = tokenizer(",", add_special_tokens=False).input_ids
+        ids, weights = [], []
+        # Weighted terms are tokenized without their "(...:w)" syntax; the weight scales their outputs
+        for term, weight in parse_weighted(text):
+            if ids:
+                ids += comma
+                weights += [1.0] * len(comma)
+            term_ids = tokenizer(term, add_special_tokens=False).input_ids
+            ids += term_ids
+            weights += [weight] * len(term_ids)
+        window = tokenizer.model_max_length - 2
+        padding = window - len(ids[:window])
+        ids = [tokenizer.bos_token_id] + ids[:window] + [tokenizer.eos_token_id] + [tokenizer.pad_token_id] * padding
+        weights = [1.0] + weights[:window] + [1.0] * (padding + 1)
+        with torch.no_grad():
+            hidden = pipe.text_encoder(torch.tensor([ids], device=self.device))[0]
+            mean = hidden.mean()
+            hidden = hidden * torch.tensor(weights, device=self.device, dtype=hidden.dtype).reshape(1, -1, 1)
+            # Keep the overall magnitude the UNet expects
+            return hidden * (mean / hidden.mean())
+
+    def generate(self, prompts: List[ScenePrompt], params: GenerationParams, seeds: List[int]) -> List[Image.Image]:
+        import torch
+
+        pipe = self._load()
+        generators = [torch.Generator(self.device).manual_seed(seed) for seed in seeds]
+        # Character chunk (cached per story) followed by the scene's own chunk. B-roll gets the
+        # cached empty chunk, so every scene has the same length and renders the same in any batch.
+        prompt_embeds = torch.cat([
+            torch.cat([self.conditioning.get(prompt.character, self._encode), self._encode(prompt.text)], dim=1)
+            for prompt in prompts
+        ])
+        # The unconditional side must match that length: negative prompt, then an empty chunk
+        negative_embeds = torch.cat([
+            self.conditioning.get(params.negative_prompt, self._encode), self.conditioning.get("", self._encode)
+        ], dim=1).expand(len(prompts), -1, -1)
+        result = pipe(
+            prompt_embeds=prompt_embeds,
+            negative_prompt_embeds=negative_embeds,
+            num_inference_steps=params.steps,
+            guidance_scale=params.guidance_scale,
+            width=params.width,
+            height=params.height,
+            generator=generators,
+        )
+        return result.images
+
+
+def create_pipeline(backend=None):
+    backend = backend or os.getenv('VISUAL_BACKEND', 'diffusers')
+    max_batch_size = int(os.getenv('SD_BATCH_SIZE', '4'))
+    conditioning = ConditioningCache.from_env()
+    if backend == 'cpu':
+        logger.info("Using CPU stand-in pipeline")
+        return CPUPipeline(
+            max_batch_size=max_batch_size,
+            batch_overhead=float(os.getenv('CPU_PIPELINE_BATCH_OVERHEAD', '0')),
+            seconds_per_image=float(os.getenv('CPU_PIPELINE_SECONDS_PER_IMAGE', '0')),
+            seconds_per_encode=float(os.getenv('CPU_PIPELINE_SECONDS_PER_ENCODE', '0')),
+            conditioning=conditioning,
+        )
+    if backend == 'diffusers':
+        return DiffusersPipeline(os.getenv('SD_MODEL_PATH'), max_batch_size=max_batch_size,
+                                 conditioning=conditioning)
+    raise ValueError(f"Unsupported VISUAL_BACKEND: {backend}")
@@ -0,0 +1,235 @@
+import io
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Dict, List, NamedTuple, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Post-processing of rendered frames: color grading, thumbnails and web copies.
+#
+# Each frame is graded with the look its sequence's atmosphere asks for (warm
+# sunlight, teal-and-orange, neon night, noir), then scaled down to a thumbnail
+# and a web-sized copy. Frames stay uint8 NumPy arrays from decode to encode:
+# grading is a per-channel 256-entry LUT applied to a whole batch with one
+# fancy-indexing gather (plus a luma mix for saturation), and resizing is two
+# matrix products with area-weighted resampling matrices. Only the final
+# outputs are encoded (PNG for the full frame, JPEG for the derivatives).
+# Batches are split across a thread pool sized to the cores: the NumPy gathers
+# and matrix products and PIL's encoders release the GIL, and threads keep the
+# service's startup (pipeline, caches) from being run again in worker processes.
+
+THUMBNAIL_SIZE = 256
+WEB_SIZE = 1024
+JPEG_QUALITY = 85
+
+# Rec. 601 luma, as PIL uses for "L"
+_LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+class Grade(NamedTuple):
+    keywords: Tuple[str, ...]
+    contrast: float = 1.0
+    saturation: float = 1.0
+    # RGB offsets (in 0-1 units) added to the shadows and to the highlights
+    shadows: Tuple[float, float, float] = (0.0, 0.0, 0.0)
+    highlights: Tuple[float, float, float] = (0.0, 0.0, 0.0)
+
+
+# Checked in order; the grade with the most keyword hits in the atmosphere wins
+GRADES = {
+    "noir": Grade(("noir", "black and white", "monochrome", "b&w"), contrast=1.25, saturation=0.0),
+    "neon": Grade(("neon", "magenta", "cyberpunk", "night"), contrast=1.1, saturation=1.2,
+                  shadows=(-0.02, 0.0, 0.06), highlights=(0.04, -0.02, 0.04)),
+    "teal_orange": Grade(("teal", "warm highlights", "cool shadows", "cinematic color grading"), contrast=1.1,
+                         saturation=1.05, shadows=(-0.04, 0.02, 0.05), highlights=(0.05, 0.02, -0.04)),
+    "warm": Grade(("golden", "warm", "sunlight", "sunset", "sunbeams", "candle"), contrast=1.05, saturation=1.1,
+                  shadows=(0.02, 0.0, -0.02), highlights=(0.05, 0.02, -0.03)),
+    "cold": Grade(("cold", "winter", "snow", "moonlight", "overcast", "fog"), contrast=1.05, saturation=0.85,
+                  shadows=(-0.02, 0.0, 0.04), highlights=(-0.02, 0.0, 0.03)),
+    "neutral": Grade(()),
+}
+
+
+def match_grade(atmosphere: str) -> str:
+    """Name of the grade whose keywords the atmosphere mentions most; neutral if none."""
+    text = (atmosphere or "").lower()
+    best, best_hits = "neutral", 0
+    for name, grade in GRADES.items():
+        hits = sum(1 for keyword in grade.keywords if keyword in text)
+        if hits > best_hits:
+            best, best_hits = name, hits
+    return best
+
+
+@lru_cache(maxsize=None)
+def grade_lut(name: str) -> np.ndarray:
+    """(3, 256) uint8 curves for a grade: contrast around mid-grey plus shadow/highlight tints."""
+    grade = GRADES[name]
+    x = np.linspace(0.0, 1.0, 256, dtype=np.float32)
+    curve = (x - 0.5) * grade.contrast + 0.5
+    shadow_weight = (1.0 - x) ** 2
+    highlight_weight = x ** 2
+    channels = [curve + shadow_weight * s + highlight_weight * h for s, h in zip(grade.shadows, grade.highlights)]
+    return np.clip(np.round(np.stack(channels) * 255.0), 0, 255).astype(np.uint8)
+
+
+def apply_grades(frames: np.ndarray, names: List[str]) -> np.ndarray:
+    """Grade a (N, H, W, 3) uint8 batch, frame i with grade names[i]."""
+    luts = np.stack([grade_lut(name) for name in names])  # (N, 3, 256)
+    graded = luts[np.arange(len(names))[:, None, None, None], np.arange(3), frames]
+    saturation = np.array([GRADES[name].saturation for name in names], dtype=np.float32)
+    if np.all(saturation == 1.0):
+        return graded
+    pixels = graded.astype(np.float32)
+    luma = (pixels @ _LUMA)[..., None]
+    pixels = luma + (pixels - luma) * saturation[:, None, None, None]
+    return np.clip(pixels + 0.5, 0, 255).astype(np.uint8)
+
+
+@lru_cache(maxsize=64)
+def resize_matrix(size_in: int, size_out: int) -> np.ndarray:
+    """(size_out, size_in) area-averaging weights: each output pixel covers size_in/size_out inputs."""
+    scale = size_in / size_out
+    starts = np.arange(size_out, dtype=np.float64)[:, None] * scale
+    pixels = np.arange(size_in, dtype=np.float64)[None, :]
+    overlap = np.clip(np.minimum(pixels + 1, starts + scale) - np.maximum(pixels, starts), 0.0, None)
+    return (overlap / overlap.sum(axis=1, keepdims=True)).astype(np.float32)
+
+
+def fit_size(height: int, width: int, max_side: int) -> Tuple[int, int]:
+    """Size within max_side keeping the aspect ratio; frames are never scaled up."""
+    scale = min(1.0, max_side / max(height, width))
+    return max(1, round(height * scale)), max(1, round(width * scale))
+
+
+def resize_frames(frames: np.ndarray, height: int, width: int) -> np.ndarray:
+    """Resize a (N, H, W, 3) uint8 batch with two matrix products over (N, 3, H, W)."""
+    if frames.shape[1:3] == (height, width):
+        return frames
+    channels_first = frames.transpose(0, 3, 1, 2).astype(np.float32)
+    resized = resize_matrix(frames.shape[1], height) @ channels_first @ resize_matrix(frames.shape[2], width).T
+    return np.clip(resized + 0.5, 0, 255).astype(np.uint8).transpose(0, 2, 3, 1)
+
+
+def _encode(pixels: np.ndarray, format: str) -> bytes:
+    buffer = io.BytesIO()
+    image = Image.fromarray(pixels, "RGB")
+    if format == "JPEG":
+        image.save(buffer, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    else:
+        image.save(buffer, format=format)
+    return buffer.getvalue()
+
+
+def _as_array(frame: Union[np.ndarray, bytes]) -> np.ndarray:
+    if isinstance(frame, (bytes, bytearray)):
+        with Image.open(io.BytesIO(frame)) as image:
+            return np.asarray(image.convert("RGB"))
+    return frame
+
+
+def process_frames(frames: List[Union[np.ndarray, bytes]], grades: List[str], thumbnail_size: int,
+                   web_size: int) -> Tuple[List[Tuple[bytes, bytes, bytes]], float]:
+    """One pool task: (full PNG, thumbnail JPEG, web JPEG) per frame, and the seconds spent."""
+    started = time.perf_counter()
+    arrays = [_as_array(frame) for frame in frames]
+    outputs = [None] * len(arrays)
+    # Frames of one size are graded and resized as one batch
+    by_shape = {}
+    for index, array in enumerate(arrays):
+        by_shape.setdefault(array.shape, []).append(index)
+    for (height, width, _), indexes in by_shape.items():
+        batch = apply_grades(np.stack([arrays[i] for i in indexes]), [grades[i] for i in indexes])
+        thumbnails = resize_frames(batch, *fit_size(height, width, thumbnail_size))
+        web = resize_frames(batch, *fit_size(height, width, web_size))
+        for position, index in enumerate(indexes):
+            outputs[index] = (_encode(batch[position], "PNG"), _encode(thumbnails[position], "JPEG"),
+                              _encode(web[position], "JPEG"))
+    return outputs, time.perf_counter() - started
+
+
+class Derivatives(NamedTuple):
+    full: bytes
+    thumbnail: bytes
+    web: bytes
+    grade: str
+
+
+class PostProcessor:
+    """Grades frames and builds their derivatives on a thread pool (thread-safe)."""
+
+    def __init__(self, workers: int = None, thumbnail_size: int = THUMBNAIL_SIZE, web_size: int = WEB_SIZE):
+        self.workers = workers or os.cpu_count() or 1
+        self.thumbnail_size = thumbnail_size
+        self.web_size = web_size
+        self._pool = None
+        self._lock = threading.Lock()
+        self.counters = {"frames": 0, "tasks": 0, "failed_tasks": 0, "worker_seconds": 0.0}
+        self.grades = {}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            workers=int(os.getenv('POSTPROCESS_WORKERS', '0')) or None,
+            thumbnail_size=int(os.getenv('THUMBNAIL_SIZE', str(THUMBNAIL_SIZE))),
+            web_size=int(os.getenv('WEB_SIZE', str(WEB_SIZE))),
+        )
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="postprocess")
+            return self._pool
+
+    def submit(self, frames: List[Union[np.ndarray, bytes]], atmospheres: List[str]) -> Future:
+        """Post-process frames (arrays, or PNG bytes from the cache); the Future resolves to [Derivatives]."""
+        grades = [match_grade(atmosphere) for atmosphere in atmospheres]
+        result = Future()
+        if not frames:
+            result.set_result([])
+            return result
+        # One task per worker at most, so a batch uses every core
+        per_task = -(-len(frames) // self.workers)
+        starts = list(range(0, len(frames), per_task))
+        pool = self._executor()
+        tasks = [pool.submit(process_frames, frames[start:start + per_task], grades[start:start + per_task],
+                             self.thumbnail_size, self.web_size) for start in starts]
+        remaining = [len(tasks)]
+
+        def task_done(task):
+            with self._lock:
+                self.counters["tasks"] += 1
+                if task.exception() is not None:
+                    self.counters["failed_tasks"] += 1
+                else:
+                    self.counters["worker_seconds"] += task.result()[1]
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            # The last task to finish hands the whole batch back, in order
+            errors = [t.exception() for t in tasks if t.exception() is not None]
+            if errors:
+                result.set_exception(errors[0])
+                return
+            outputs = [output for t in tasks for output in t.result()[0]]
+            with self._lock:
+                self.counters["frames"] += len(outputs)
+                for grade in grades:
+                    self.grades[grade] = self.grades.get(grade, 0) + 1
+            result.set_result([Derivatives(*output, grade) for output, grade in zip(outputs, grades)])
+
+        for task in tasks:
+            task.add_done_callback(task_done)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.counters, worker_seconds=round(self.counters["worker_seconds"], 3),
+                        workers=self.workers, grades=dict(self.grades))
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, FrozenSet, List, NamedTuple, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Compiles story prompts to fit the text encoder's token window.
+#
+# Story prompts are comma-separated terms in SD weight syntax ("(8k uhd:1.4)",
+# "(term)" for 1.1, "[term]" for 1/1.1) and often run past CLIP's 77 tokens,
+# where everything after the window is silently cut off. The compiler parses
+# the terms, drops repeats (a term the negative prompt or the character block
+# already has is dropped from the scene text), and when the rest still does
+# not fit the budget keeps the highest-weighted terms, earlier terms first on
+# ties, in their original order. Weights are kept in the compiled text; the
+# diffusers pipeline applies them to the encoder output instead of feeding the
+# parentheses to CLIP. Compiled prompts are cached by the hash of their input.
+
+# CLIP's 77 positions minus the start and end tokens
+TOKEN_BUDGET = 75
+
+_WEIGHTED = re.compile(r"^\((.+):\s*(-?\d*\.?\d+)\s*\)$", re.DOTALL)
+_SPACES = re.compile(r"\s+")
+_TOKENS = re.compile(r"\w+|[^\w\s]")
+
+
+def approximate_tokens(text: str) -> int:
+    """CLIP-like token count without a tokenizer: words and punctuation marks."""
+    return len(_TOKENS.findall(text))
+
+
+def split_terms(text: str) -> List[str]:
+    """Top-level comma-separated terms; commas inside brackets stay in their term."""
+    terms, depth, start = [], 0, 0
+    for i, ch in enumerate(text or ""):
+        if ch in "([":
+            depth += 1
+        elif ch in ")]":
+            depth = max(0, depth - 1)
+        elif ch == "," and depth == 0:
+            terms.append(text[start:i])
+            start = i + 1
+    terms.append((text or "")[start:])
+    return [term.strip() for term in terms if term.strip()]
+
+
+def parse_term(term: str) -> Tuple[str, float]:
+    match = _WEIGHTED.match(term)
+    if match:
+        return match.group(1).strip(), float(match.group(2))
+    if term.startswith("(") and term.endswith(")"):
+        return term[1:-1].strip(), 1.1
+    if term.startswith("[") and term.endswith("]"):
+        return term[1:-1].strip(), round(1 / 1.1, 3)
+    return term, 1.0
+
+
+def parse_weighted(text: str) -> List[Tuple[str, float]]:
+    """[(term, weight)] in prompt order."""
+    return [parsed for parsed in map(parse_term, split_terms(text)) if parsed[0]]
+
+
+def term_key(term: str) -> str:
+    return _SPACES.sub(" ", term.lower()).strip()
+
+
+def render_term(term: str, weight: float) -> str:
+    return term if weight == 1.0 else f"({term}:{weight:g})"
+
+
+class CompiledPrompt(NamedTuple):
+    text: str
+    tokens: int
+    dropped: Tuple[str, ...]
+    dropped_tokens: int
+    deduplicated: int
+    keys: FrozenSet[str]
+
+
+class PromptCompiler:
+    """Parses, deduplicates and budgets weighted prompts, caching the results (thread-safe)."""
+
+    def __init__(self, count_tokens: Callable[[str], int] = approximate_tokens, budget: int = TOKEN_BUDGET,
+                 max_entries: int = 4096):
+        self.count_tokens = count_tokens
+        self.budget = budget
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # hash of (text, exclude) -> CompiledPrompt
+        self.counters = {"compiled": 0, "hits": 0, "truncated": 0, "dropped_terms": 0, "dropped_tokens": 0,
+                         "deduplicated_terms": 0}
+
+    @classmethod
+    def from_env(cls, count_tokens: Callable[[str], int] = approximate_tokens):
+        return cls(count_tokens, budget=int(os.getenv('PROMPT_TOKEN_BUDGET', str(TOKEN_BUDGET))),
+                   max_entries=int(os.getenv('PROMPT_CACHE_SIZE', '4096')))
+
+    def compile(self, text: str, exclude: FrozenSet[str] = frozenset()) -> CompiledPrompt:
+        """Fit text to the budget, leaving out terms whose key is in exclude."""
+        key = hashlib.sha256(json.dumps([text or "", sorted(exclude)]).encode("utf-8")).hexdigest()
+        with self._lock:
+            compiled = self._cache.get(key)
+            if compiled is not None:
+                self._cache.move_to_end(key)
+                self.counters["hits"] += 1
+                return compiled
+        compiled = self._compile(text, exclude)
+        with self._lock:
+            self._cache[key] = compiled
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+            self.counters["compiled"] += 1
+            self.counters["deduplicated_terms"] += compiled.deduplicated
+            if compiled.dropped:
+                self.counters["truncated"] += 1
+                self.counters["dropped_terms"] += len(compiled.dropped)
+                self.counters["dropped_tokens"] += compiled.dropped_tokens
+        return compiled
+
+    def _compile(self, text: str, exclude: FrozenSet[str]) -> CompiledPrompt:
+        terms = OrderedDict()  # key -> [term, weight]
+        deduplicated = 0
+        for term, weight in parse_weighted(text):
+            key = term_key(term)
+            if key in exclude:
+                deduplicated += 1
+            elif key in terms:
+                # A repeated term keeps its first position and its strongest weight
+                terms[key][1] = max(terms[key][1], weight)
+                deduplicated += 1
+            else:
+                terms[key] = [term, weight]
+
+        # Each term after the first also costs a comma
+        costs = {key: self.count_tokens(term) + 1 for key, (term, _) in terms.items()}
+        order = list(terms)
+        ranked = sorted(order, key=lambda k: (-terms[k][1], order.index(k)))
+        kept, used = set(), 0
+        for key in ranked:
+            if used + costs[key] <= self.budget + 1:
+                kept.add(key)
+                used += costs[key]
+        dropped = [key for key in order if key not in kept]
+        return CompiledPrompt(
+            text=", ".join(render_term(*terms[key]) for key in order if key in kept),
+            tokens=max(0, used - 1),
+            dropped=tuple(terms[key][0] for key in dropped),
+            dropped_tokens=sum(costs[key] for key in dropped),
+            deduplicated=deduplicated,
+            keys=frozenset(kept),
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.counters["compiled"] + self.counters["hits"]
+            return dict(
+                self.counters,
+                budget=self.budget,
+                entries=len(self._cache),
+                hit_rate=round(self.counters["hits"] / lookups, 3) if lookups else 0.0,
+            )
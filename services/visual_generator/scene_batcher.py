@@ -0,0 +1,140 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, List
+
+from pipelines import GenerationParams, ScenePrompt
+
+logger = logging.getLogger(__name__)
+
+# Groups scenes from concurrent /generate-visuals requests into pipeline batches.
+#
+# Scenes are queued per GenerationParams (resolution, steps, guidance, negative
+# prompt), since only scenes with equal params can share one pipeline call. A
+# group is dispatched once it holds a full batch, or once its oldest scene has
+# waited max_wait seconds; among ready groups the oldest goes first. A single
+# dispatcher thread owns the pipeline (one GPU), and each scene's image is
+# handed back to its request through a Future.
+
+
+class _Scene:
+    __slots__ = ("prompt", "seed", "future", "queued_at")
+
+    def __init__(self, prompt: ScenePrompt, seed: int):
+        self.prompt = prompt
+        self.seed = seed
+        self.future = Future()
+        self.queued_at = time.monotonic()
+
+
+class SceneBatcher:
+    """Batches scenes by GenerationParams and runs them through a pipeline (thread-safe)."""
+
+    def __init__(self, pipeline, max_batch_size: int = None, max_wait: float = 0.05):
+        self.pipeline = pipeline
+        self.max_batch_size = max_batch_size or pipeline.max_batch_size
+        self.max_wait = max_wait
+        self._groups = OrderedDict()  # GenerationParams -> list of _Scene
+        self._cond = threading.Condition()
+        self._thread = None
+        self.counters = {"batches": 0, "images": 0, "failed_batches": 0, "busy_seconds": 0.0}
+
+    @classmethod
+    def from_env(cls, pipeline):
+        return cls(
+            pipeline,
+            max_batch_size=int(os.getenv('SD_BATCH_SIZE', '0')) or None,
+            max_wait=float(os.getenv('SD_BATCH_WAIT', '0.05')),
+        )
+
+    def submit(self, prompt: ScenePrompt, params: GenerationParams, seed: int) -> Future:
+        """Queue one scene; the Future resolves to its PIL image."""
+        scene = _Scene(prompt, seed)
+        with self._cond:
+            self._groups.setdefault(params, []).append(scene)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return scene.future
+
+    def generate(self, scenes: List[Dict[str, Any]]) -> List[Any]:
+        """Submit [{"prompt", "params", "seed"}] and wait for all images, in order."""
+        futures = [self.submit(scene["prompt"], scene["params"], scene["seed"]) for scene in scenes]
+        return [future.result() for future in futures]
+
+    def _next_batch(self):
+        """Pop the next batch to run, or return the seconds until one is due."""
+        now = time.monotonic()
+        ready = None
+        wait = None
+        for params, scenes in self._groups.items():
+            due = scenes[0].queued_at + self.max_wait
+            if len(scenes) >= self.max_batch_size or due <= now:
+                if ready is None or scenes[0].queued_at < self._groups[ready][0].queued_at:
+                    ready = params
+            else:
+                wait = due - now if wait is None else min(wait, due - now)
+        if ready is None:
+            return None, wait
+        scenes = self._groups[ready]
+        batch, rest = scenes[:self.max_batch_size], scenes[self.max_batch_size:]
+        if rest:
+            self._groups[ready] = rest
+        else:
+            del self._groups[ready]
+        return (ready, batch), None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    batch, wait = self._next_batch()
+                    if batch is not None:
+                        break
+                    self._cond.wait(wait)
+            self._dispatch(*batch)
+
+    def _dispatch(self, params: GenerationParams, batch: List[_Scene]):
+        started = time.perf_counter()
+        try:
+            images = self.pipeline.generate([s.prompt for s in batch], params, [s.seed for s in batch])
+        except Exception as e:
+            logger.error(f"Pipeline batch of {len(batch)} failed: {e}")
+            with self._cond:
+                self.counters["failed_batches"] += 1
+            for scene in batch:
+                scene.future.set_exception(e)
+            return
+        elapsed = time.perf_counter() - started
+        images = list(images or [])
+        mismatch = f"Pipeline returned {len(images)} images for a batch of {len(batch)}"
+        if len(images) != len(batch):
+            logger.error(mismatch)
+        with self._cond:
+            self.counters["batches"] += 1
+            self.counters["images"] += min(len(images), len(batch))
+            self.counters["busy_seconds"] += elapsed
+            if len(images) < len(batch):
+                self.counters["failed_batches"] += 1
+        for scene, image in zip(batch, images):
+            # Each image's share of the pipeline call, for GPU-time accounting
+            image.info["render_seconds"] = elapsed / len(batch)
+            scene.future.set_result(image)
+        # Scenes the pipeline returned no image for must not wait forever
+        for scene in batch[len(images):]:
+            scene.future.set_exception(RuntimeError(mismatch))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            batches = self.counters["batches"]
+            return dict(
+                self.counters,
+                busy_seconds=round(self.counters["busy_seconds"], 3),
+                max_batch_size=self.max_batch_size,
+                mean_batch_size=round(self.counters["images"] / batches, 2) if batches else 0.0,
+                queued=sum(len(scenes) for scenes in self._groups.values()),
+            )
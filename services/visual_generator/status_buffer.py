@@ -0,0 +1,161 @@
+import copy
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict
+
+logger = logging.getLogger(__name__)
+
+# Write-behind buffer for pipeline progress in Firestore.
+#
+# Progress (stage, per-scene status, URLs) changes many times per request, and
+# a Firestore write per change means a round trip and a billed write each time.
+# Updates are instead merged into one pending document per project, and the
+# pending documents are written as batched set(merge=True) calls, either every
+# `interval` seconds from a background thread or when flush() is called at a
+# stage boundary. However many updates a project gets between flushes, it costs
+# one write. A failed commit puts its documents back under any newer updates
+# so the next flush retries them.
+#   STATUS_BACKEND=firestore  the Firestore collection STATUS_COLLECTION (default)
+#   STATUS_BACKEND=local      one JSON file per project under LOCAL_STATUS_DIR
+
+# Firestore's limit on writes per batch
+MAX_BATCH_WRITES = 500
+
+
+def merge_fields(into: Dict[str, Any], update: Dict[str, Any]) -> Dict[str, Any]:
+    """Deep-merge update into into (nested maps merge, other values replace), like set(merge=True)."""
+    for name, value in update.items():
+        if isinstance(value, dict) and isinstance(into.get(name), dict):
+            merge_fields(into[name], value)
+        else:
+            into[name] = copy.deepcopy(value)
+    return into
+
+
+class FirestoreStatusSink:
+    """Writes project documents to a Firestore collection, MAX_BATCH_WRITES per commit."""
+
+    def __init__(self, db_factory, collection: str = "projects"):
+        self._db_factory = db_factory
+        self.collection = collection
+
+    def write(self, docs: Dict[str, Dict[str, Any]]) -> int:
+        db = self._db_factory()
+        items = list(docs.items())
+        commits = 0
+        for start in range(0, len(items), MAX_BATCH_WRITES):
+            batch = db.batch()
+            for doc_id, fields in items[start:start + MAX_BATCH_WRITES]:
+                batch.set(db.collection(self.collection).document(doc_id), fields, merge=True)
+            batch.commit()
+            commits += 1
+        return commits
+
+
+class LocalStatusSink:
+    """Project documents as JSON files under directory, merged the way Firestore merges them."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def path(self, doc_id: str) -> str:
+        return os.path.join(self.directory, f"{doc_id}.json")
+
+    def read(self, doc_id: str) -> Dict[str, Any]:
+        try:
+            with open(self.path(doc_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def write(self, docs: Dict[str, Dict[str, Any]]) -> int:
+        os.makedirs(self.directory, exist_ok=True)
+        for doc_id, fields in docs.items():
+            doc = merge_fields(self.read(doc_id), fields)
+            tmp_path = f"{self.path(doc_id)}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(doc, f)
+            os.replace(tmp_path, self.path(doc_id))
+        return 1 if docs else 0
+
+
+def create_status_sink(backend=None, db_factory=None):
+    """Sink for status documents; db_factory returns the Firestore client when it is needed."""
+    backend = backend or os.getenv('STATUS_BACKEND', 'firestore')
+    if backend == 'local':
+        directory = os.getenv('LOCAL_STATUS_DIR', 'local_status')
+        logger.info(f"Writing status documents to {directory}")
+        return LocalStatusSink(directory)
+    if backend == 'firestore':
+        return FirestoreStatusSink(db_factory, os.getenv('STATUS_COLLECTION', 'projects'))
+    raise ValueError(f"Unsupported STATUS_BACKEND: {backend}")
+
+
+class StatusBuffer:
+    """Coalesces status updates per document and writes them in batches (thread-safe)."""
+
+    def __init__(self, sink, interval: float = 1.0, max_pending: int = MAX_BATCH_WRITES):
+        self.sink = sink
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending = {}  # doc_id -> merged fields not yet written
+        self._cond = threading.Condition()
+        # Flushes are serialized so an older snapshot never lands after a newer one
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self.counters = {"updates": 0, "documents_written": 0, "commits": 0, "failed_commits": 0}
+
+    @classmethod
+    def from_env(cls, sink):
+        return cls(sink, interval=float(os.getenv('STATUS_FLUSH_INTERVAL', '1.0')))
+
+    def update(self, doc_id: str, fields: Dict[str, Any]):
+        """Merge fields into the document's pending write; it reaches the sink on the next flush."""
+        with self._cond:
+            merge_fields(self._pending.setdefault(doc_id, {}), fields)
+            self.counters["updates"] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            if len(self._pending) >= self.max_pending:
+                self._cond.notify()
+
+    def flush(self) -> bool:
+        """Write everything pending now (call at stage boundaries); False if the write failed."""
+        with self._flush_lock:
+            with self._cond:
+                docs, self._pending = self._pending, {}
+            if not docs:
+                return True
+            try:
+                commits = self.sink.write(docs)
+            except Exception as e:
+                logger.warning(f"Status write of {len(docs)} documents failed, will retry: {e}")
+                with self._cond:
+                    # Newer updates win over the ones being put back
+                    for doc_id, fields in self._pending.items():
+                        merge_fields(docs.setdefault(doc_id, {}), fields)
+                    self._pending = docs
+                    self.counters["failed_commits"] += 1
+                return False
+            with self._cond:
+                self.counters["documents_written"] += len(docs)
+                self.counters["commits"] += commits
+            return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait(self.interval)
+            self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            written = self.counters["documents_written"]
+            return dict(
+                self.counters,
+                pending=len(self._pending),
+                updates_per_write=round(self.counters["updates"] / written, 2) if written else 0.0,
+            )
@@ -0,0 +1,149 @@
+import logging
+import os
+import threading
+import uuid
+from typing import Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Object storage for generated assets.
+#   STORAGE_BACKEND=firebase  the Firebase Storage bucket (default; honours
+#                             STORAGE_EMULATOR_HOST for the Firebase emulator)
+#   STORAGE_BACKEND=local     files under LOCAL_STORAGE_DIR, for tests and offline runs
+# Both backends take in-memory bytes for small objects and offer resumable
+# sessions for large ones: a session is started once, chunks are sent at
+# increasing offsets, and after a failure the committed offset is queried so the
+# upload continues where it stopped rather than starting over.
+
+
+class TransientStorageError(Exception):
+    """An upload failure worth retrying (timeouts, 429/5xx)."""
+
+
+def _check_response(response):
+    if response.status_code == 429 or response.status_code >= 500:
+        raise TransientStorageError(f"Storage returned {response.status_code}")
+    if response.status_code not in (200, 201, 308):
+        raise RuntimeError(f"Storage returned {response.status_code}: {response.text[:200]}")
+
+
+class FirebaseStorage:
+    """A firebase_admin storage bucket (google-cloud-storage Bucket), fetched on first use."""
+
+    def __init__(self, bucket_factory):
+        self._bucket_factory = bucket_factory
+
+    @property
+    def bucket(self):
+        return self._bucket_factory()
+
+    @property
+    def name(self) -> str:
+        return self.bucket.name
+
+    def exists(self, name: str) -> bool:
+        return self.bucket.blob(name).exists()
+
+    def upload(self, name: str, data: bytes, content_type: str) -> str:
+        blob = self.bucket.blob(name)
+        blob.upload_from_string(data, content_type=content_type)
+        return blob.public_url
+
+    def public_url(self, name: str) -> str:
+        return self.bucket.blob(name).public_url
+
+    def start_resumable(self, name: str, size: int, content_type: str) -> str:
+        """Session URL of a new resumable upload (pre-authorized, so plain HTTP can use it)."""
+        return self.bucket.blob(name).create_resumable_upload_session(content_type=content_type, size=size)
+
+    def resumable_offset(self, session: str, size: int) -> Optional[int]:
+        """Bytes the server has committed, or None if the upload is already complete."""
+        try:
+            response = requests.put(session, headers={"Content-Range": f"bytes */{size}"}, timeout=30)
+        except requests.RequestException as e:
+            raise TransientStorageError(str(e)) from e
+        _check_response(response)
+        if response.status_code in (200, 201):
+            return None
+        committed = response.headers.get("Range")
+        return int(committed.rsplit("-", 1)[1]) + 1 if committed else 0
+
+    def put_chunk(self, session: str, offset: int, data: bytes, size: int) -> bool:
+        """Send data at offset; True once the object is complete."""
+        headers = {"Content-Range": f"bytes {offset}-{offset + len(data) - 1}/{size}"}
+        try:
+            response = requests.put(session, data=data, headers=headers, timeout=120)
+        except requests.RequestException as e:
+            raise TransientStorageError(str(e)) from e
+        _check_response(response)
+        return response.status_code in (200, 201)
+
+
+class LocalStorage:
+    """Objects as files under root, served from base_url; resumable sessions are .part files."""
+
+    def __init__(self, root: str, base_url: str = None, name: str = "local"):
+        self.root = root
+        self.base_url = (base_url or f"file://{os.path.abspath(root)}").rstrip("/")
+        self._name = name
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, *name.split("/"))
+
+    def exists(self, name: str) -> bool:
+        return os.path.exists(self._path(name))
+
+    def upload(self, name: str, data: bytes, content_type: str) -> str:
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return self.public_url(name)
+
+    def public_url(self, name: str) -> str:
+        return f"{self.base_url}/{name}"
+
+    def start_resumable(self, name: str, size: int, content_type: str) -> str:
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        session = f"{path}.{uuid.uuid4().hex}.part"
+        open(session, "wb").close()
+        return session
+
+    def resumable_offset(self, session: str, size: int) -> Optional[int]:
+        if not os.path.exists(session):
+            # Finished and renamed into place
+            return None
+        return os.path.getsize(session)
+
+    def put_chunk(self, session: str, offset: int, data: bytes, size: int) -> bool:
+        with self._lock:
+            with open(session, "r+b") as f:
+                f.seek(offset)
+                f.write(data)
+                f.truncate()
+            if offset + len(data) >= size:
+                os.replace(session, session.rsplit(".", 2)[0])
+                return True
+        return False
+
+
+def create_storage(backend=None, bucket_factory=None):
+    """Storage for uploads; bucket_factory returns the Firebase bucket when it is needed."""
+    backend = backend or os.getenv('STORAGE_BACKEND', 'firebase')
+    if backend == 'local':
+        root = os.getenv('LOCAL_STORAGE_DIR', 'local_storage')
+        logger.info(f"Using local storage in {root}")
+        return LocalStorage(root, os.getenv('LOCAL_STORAGE_URL'))
+    if backend == 'firebase':
+        return FirebaseStorage(bucket_factory)
+    raise ValueError(f"Unsupported STORAGE_BACKEND: {backend}")
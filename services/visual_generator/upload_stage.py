@@ -0,0 +1,199 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from storage_backends import TransientStorageError
+
+logger = logging.getLogger(__name__)
+
+# Background uploads of generated assets.
+#
+# Uploads run on a bounded thread pool, so a request can hand each image over
+# as soon as it is rendered and keep waiting for the next batch while earlier
+# images upload. Object names are content-addressed, so a name that was already
+# uploaded (by this process, a concurrent request, or an earlier run) is not
+# sent again: names still uploading are shared in memory, finished ones are
+# found with the backend's exists() check. Small objects go up in one call from memory; files above
+# RESUMABLE_THRESHOLD are streamed in chunks through a resumable session whose
+# URL is kept in state_dir, so a retry, or a restarted process, continues from
+# the committed offset. Transient failures are retried with jittered backoff.
+
+RESUMABLE_THRESHOLD = 8 * 1024 * 1024
+# Resumable chunks must be multiples of 256 KiB
+CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def _is_transient(error: Exception) -> bool:
+    if isinstance(error, (TransientStorageError, ConnectionError, TimeoutError)):
+        return True
+    # google.api_core exceptions carry an HTTP code
+    code = getattr(error, "code", None)
+    return isinstance(code, int) and (code == 429 or code >= 500)
+
+
+class UploadStage:
+    """Deduplicated, retried uploads on a bounded thread pool (thread-safe)."""
+
+    def __init__(self, storage, workers: int = 8, max_retries: int = 4, base_backoff: float = 0.5,
+                 state_dir: Optional[str] = None, chunk_size: int = CHUNK_SIZE,
+                 resumable_threshold: int = RESUMABLE_THRESHOLD):
+        self.storage = storage
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.state_dir = state_dir
+        self.chunk_size = chunk_size
+        self.resumable_threshold = resumable_threshold
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="upload")
+        self._lock = threading.Lock()
+        self._uploads = {}  # name -> Future of public URL, while it is uploading
+        self._rng = random.Random()
+        self.counters = {"uploads": 0, "deduplicated": 0, "retries": 0, "failed": 0, "resumed": 0, "bytes": 0}
+
+    @classmethod
+    def from_env(cls, storage, output_dir: str):
+        return cls(
+            storage,
+            workers=int(os.getenv('UPLOAD_WORKERS', '8')),
+            max_retries=int(os.getenv('UPLOAD_MAX_RETRIES', '4')),
+            state_dir=os.path.join(output_dir, "uploads"),
+        )
+
+    def _count(self, name: str, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def _claim(self, name: str):
+        """(future, owner): only the first caller for a name uploads it; a failed upload can be retried."""
+        with self._lock:
+            future = self._uploads.get(name)
+            if future is not None and not (future.done() and future.exception() is not None):
+                self.counters["deduplicated"] += 1
+                return future, False
+            future = self._uploads[name] = Future()
+        future.add_done_callback(lambda done: self._release(name, done))
+        return future, True
+
+    def _release(self, name: str, future: Future):
+        with self._lock:
+            if self._uploads.get(name) is future:
+                del self._uploads[name]
+
+    def submit(self, name: str, data: bytes, content_type: str = "image/png") -> Future:
+        """Upload in-memory bytes in the background; the Future resolves to the public URL."""
+        future, owner = self._claim(name)
+        if owner:
+            self._pool.submit(self._run, future, self._upload_bytes, name, data, content_type)
+        return future
+
+    def submit_file(self, name: str, path: str, content_type: str = "video/mp4") -> Future:
+        """Upload a file from disk in the background, through a resumable session when it is large."""
+        future, owner = self._claim(name)
+        if owner:
+            self._pool.submit(self._run, future, self._upload_file, name, path, content_type)
+        return future
+
+    def _run(self, future: Future, upload, *args):
+        try:
+            future.set_result(upload(*args))
+        except Exception as e:
+            self._count("failed")
+            logger.error(f"Upload of {args[0]} failed: {e}")
+            future.set_exception(e)
+
+    def _retrying(self, fn, *args):
+        attempt = 0
+        while True:
+            try:
+                return fn(*args)
+            except Exception as e:
+                if not _is_transient(e) or attempt >= self.max_retries:
+                    raise
+                delay = self.base_backoff * (2 ** attempt) * self._rng.uniform(0.5, 1.0)
+                attempt += 1
+                self._count("retries")
+                logger.warning(f"Upload failed ({e}); retry {attempt}/{self.max_retries} in {delay:.2f}s")
+                time.sleep(delay)
+
+    def _upload_bytes(self, name: str, data: bytes, content_type: str) -> str:
+        # Content-addressed names: an existing object already holds these bytes
+        if self._retrying(self.storage.exists, name):
+            self._count("deduplicated")
+            return self.storage.public_url(name)
+        url = self._retrying(self.storage.upload, name, data, content_type)
+        self._count("uploads")
+        self._count("bytes", len(data))
+        return url
+
+    def _session_path(self, name: str) -> Optional[str]:
+        if not self.state_dir:
+            return None
+        return os.path.join(self.state_dir, hashlib.sha256(name.encode("utf-8")).hexdigest() + ".json")
+
+    def _upload_file(self, name: str, path: str, content_type: str) -> str:
+        size = os.path.getsize(path)
+        if size < self.resumable_threshold:
+            with open(path, "rb") as f:
+                return self._upload_bytes(name, f.read(), content_type)
+        if self._retrying(self.storage.exists, name):
+            self._count("deduplicated")
+            return self.storage.public_url(name)
+
+        state_path = self._session_path(name)
+        session = None
+        if state_path and os.path.exists(state_path):
+            with open(state_path) as f:
+                state = json.load(f)
+            if state.get("size") == size:
+                try:
+                    # Sessions expire (a week on Cloud Storage); check this one is still usable
+                    self._retrying(self.storage.resumable_offset, state["session"], size)
+                    session = state["session"]
+                    self._count("resumed")
+                except Exception as e:
+                    logger.info(f"Starting a new upload session for {name}: {e}")
+        if session is None:
+            session = self._retrying(self.storage.start_resumable, name, size, content_type)
+            if state_path:
+                os.makedirs(self.state_dir, exist_ok=True)
+                with open(state_path, "w") as f:
+                    json.dump({"name": name, "size": size, "session": session}, f)
+
+        progress = {"offset": self._retrying(self.storage.resumable_offset, session, size), "failed": False}
+
+        def send_chunk(f):
+            # After a failure, ask the server what it committed so only that chunk is resent
+            if progress["failed"]:
+                progress["offset"] = self.storage.resumable_offset(session, size)
+                progress["failed"] = False
+                if progress["offset"] is None:
+                    return
+            offset = progress["offset"]
+            f.seek(offset)
+            chunk = f.read(self.chunk_size)
+            try:
+                done = self.storage.put_chunk(session, offset, chunk, size)
+            except Exception:
+                progress["failed"] = True
+                raise
+            self._count("bytes", len(chunk))
+            progress["offset"] = None if done else offset + len(chunk)
+
+        with open(path, "rb") as f:
+            while progress["offset"] is not None:
+                # Retried per chunk, so the backoff restarts after every chunk that gets through
+                self._retrying(send_chunk, f)
+
+        if state_path and os.path.exists(state_path):
+            os.remove(state_path)
+        self._count("uploads")
+        return self.storage.public_url(name)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.counters, in_progress=len(self._uploads))
@@ -0,0 +1,98 @@
+from typing import Dict, Any, List
+
+from flask import request, jsonify
+
+# Dictionary-encoded story format, served when a client asks for ?format=compact.
+#
+# Sequences become rows aligned to `columns`. In the columns listed in
+# `string_columns` every value is an index into the shared `strings` table, so
+# the atmosphere/negative_prompt/environment text repeated across dozens of
+# sequences is sent and parsed once. null marks a field the sequence does not
+# have (e.g. pose on b-roll). Everything outside `sequence` is passed through.
+#
+#   {
+#     "format": "compact/1",
+#     "strings": ["ESTABLISHING SHOT - ...", "8k uhd, ...", ...],
+#     "columns": ["sequence_number", "clip_duration", "clip_action", ...],
+#     "string_columns": ["clip_action", ...],
+#     "sequence": [[1, 3.0625, 0, 1, 2, null, 3, 4, 5], ...],
+#     "character": {...}, "movie_info": {...}, "music_score": {...}
+#   }
+
+COMPACT_FORMAT = "compact/1"
+
+
+def encode_compact(story: Dict[str, Any]) -> Dict[str, Any]:
+    """Encode a story dict into the compact string-table format."""
+    sequences = story.get("sequence", [])
+
+    # Columns in order of first appearance; a column is table-encoded when all its values are strings
+    columns = []
+    column_index = {}
+    string_column = []
+    for seq in sequences:
+        for key, value in seq.items():
+            position = column_index.get(key)
+            if position is None:
+                column_index[key] = len(columns)
+                columns.append(key)
+                string_column.append(value is None or type(value) is str)
+            elif string_column[position] and value is not None and type(value) is not str:
+                string_column[position] = False
+
+    strings = []
+    string_ids = {}
+    rows = []
+    width = len(columns)
+    for seq in sequences:
+        row = [None] * width
+        for key, value in seq.items():
+            position = column_index[key]
+            if value is not None and string_column[position]:
+                string_id = string_ids.get(value)
+                if string_id is None:
+                    string_id = string_ids[value] = len(strings)
+                    strings.append(value)
+                value = string_id
+            row[position] = value
+        rows.append(row)
+
+    compact = {k: v for k, v in story.items() if k != "sequence"}
+    compact["format"] = COMPACT_FORMAT
+    compact["strings"] = strings
+    compact["columns"] = columns
+    compact["string_columns"] = [name for name, is_string in zip(columns, string_column) if is_string]
+    compact["sequence"] = rows
+    return compact
+
+
+def decode_compact(compact: Dict[str, Any]) -> Dict[str, Any]:
+    """Rebuild the default story dict from the compact format."""
+    if compact.get("format") != COMPACT_FORMAT:
+        raise ValueError(f"Unsupported story format: {compact.get('format')!r}")
+
+    strings: List[str] = compact["strings"]
+    columns = compact["columns"]
+    string_columns = set(compact["string_columns"])
+    resolvers = [(name, name in string_columns) for name in columns]
+
+    sequences = []
+    for row in compact["sequence"]:
+        seq = {}
+        for (name, is_string), value in zip(resolvers, row):
+            if value is None:
+                continue
+            seq[name] = strings[value] if is_string else value
+        sequences.append(seq)
+
+    story = {k: v for k, v in compact.items()
+             if k not in ("format", "strings", "columns", "string_columns", "sequence")}
+    story["sequence"] = sequences
+    return story
+
+
+def story_response(story: Dict[str, Any]):
+    """jsonify a story in the format the request asked for (default JSON unless ?format=compact)."""
+    if request.args.get("format") == "compact":
+        return jsonify(encode_compact(story))
+    return jsonify(story)
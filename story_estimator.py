@@ -0,0 +1,102 @@
+import logging
+import os
+import threading
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Cost and latency estimates for story requests, and the per-request limits
+# checked against them before a job is created.
+#
+# Output size and call latency come from moving averages of recent chunk calls
+# (seeded with conservative defaults until the first calls are observed). Chunks
+# run sequentially, so expected latency is chunks x seconds per chunk.
+
+# USD per million tokens
+INPUT_PRICE_PER_MTOK = float(os.getenv('INPUT_PRICE_PER_MTOK', '3.0'))
+OUTPUT_PRICE_PER_MTOK = float(os.getenv('OUTPUT_PRICE_PER_MTOK', '15.0'))
+
+# Character block plus last sequence sent with every chunk after the first
+CONTINUITY_CONTEXT_TOKENS = 300
+
+
+class ObservedRates:
+    """Moving averages of output tokens and seconds per chunk call (thread-safe)."""
+
+    def __init__(self, output_tokens: float = 2500.0, seconds: float = 30.0, alpha: float = 0.2):
+        self.output_tokens = output_tokens
+        self.seconds = seconds
+        self.alpha = alpha
+        self.samples = 0
+        self._lock = threading.Lock()
+
+    def observe(self, message, seconds: float):
+        """Fold one provider call (a Message with usage) into the averages."""
+        usage = getattr(message, "usage", None)
+        output_tokens = getattr(usage, "output_tokens", None)
+        with self._lock:
+            # The first observation replaces the seeded defaults
+            alpha = 1.0 if self.samples == 0 else self.alpha
+            if output_tokens:
+                self.output_tokens += alpha * (output_tokens - self.output_tokens)
+            self.seconds += alpha * (seconds - self.seconds)
+            self.samples += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "output_tokens_per_chunk": round(self.output_tokens),
+                "seconds_per_chunk": round(self.seconds, 3),
+                "samples": self.samples,
+            }
+
+
+def estimate_cost(input_tokens: int, output_tokens: int) -> float:
+    return round((input_tokens * INPUT_PRICE_PER_MTOK + output_tokens * OUTPUT_PRICE_PER_MTOK) / 1e6, 4)
+
+
+class RequestLimits:
+    """Per-request caps; 0 disables a cap."""
+
+    def __init__(self, max_sequences: int = 100, max_chunks: int = 0, max_tokens: int = 0,
+                 max_seconds: float = 0, max_cost_usd: float = 0):
+        self.max_sequences = max_sequences
+        self.max_chunks = max_chunks
+        self.max_tokens = max_tokens
+        self.max_seconds = max_seconds
+        self.max_cost_usd = max_cost_usd
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_sequences=int(os.getenv('MAX_SEQUENCES_PER_REQUEST', '100')),
+            max_chunks=int(os.getenv('MAX_CHUNKS_PER_REQUEST', '0')),
+            max_tokens=int(os.getenv('MAX_TOKENS_PER_REQUEST', '0')),
+            max_seconds=float(os.getenv('MAX_SECONDS_PER_REQUEST', '0')),
+            max_cost_usd=float(os.getenv('MAX_COST_PER_REQUEST_USD', '0')),
+        )
+
+    def check(self, estimate: Dict[str, Any]) -> List[str]:
+        """Violations of these limits by an estimate (empty when the request is allowed)."""
+        violations = []
+        if self.max_sequences and estimate["num_sequences"] > self.max_sequences:
+            violations.append(f"num_sequences {estimate['num_sequences']} exceeds {self.max_sequences}")
+        if self.max_chunks and estimate["chunks"] > self.max_chunks:
+            violations.append(f"{estimate['chunks']} chunks exceed {self.max_chunks}")
+        total_tokens = estimate["input_tokens"] + estimate["output_tokens"]
+        if self.max_tokens and total_tokens > self.max_tokens:
+            violations.append(f"estimated {total_tokens} tokens exceed {self.max_tokens}")
+        if self.max_seconds and estimate["expected_seconds"] > self.max_seconds:
+            violations.append(f"estimated {estimate['expected_seconds']}s exceeds {self.max_seconds}s")
+        if self.max_cost_usd and estimate["estimated_cost_usd"] > self.max_cost_usd:
+            violations.append(f"estimated ${estimate['estimated_cost_usd']} exceeds ${self.max_cost_usd}")
+        return violations
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "max_sequences": self.max_sequences,
+            "max_chunks": self.max_chunks,
+            "max_tokens": self.max_tokens,
+            "max_seconds": self.max_seconds,
+            "max_cost_usd": self.max_cost_usd,
+        }
@@ -0,0 +1,161 @@
+import json
+import sys
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+# Compact in-memory representation for stories that stay resident (in-flight
+# jobs and the result cache).
+#
+# Sequences are slotted records instead of dicts, and the long strings that
+# repeat across a story (environment, atmosphere, negative_prompt, type) are
+# interned so every sequence shares one copy. Character poses are stored
+# without their "[previous character traits]" prefix. JSON is only produced
+# when a story is served.
+
+POSE_PREFIX = "[previous character traits]"
+
+SEQUENCE_FIELDS = (
+    "sequence_number",
+    "clip_duration",
+    "clip_action",
+    "voice_narration",
+    "type",
+    "pose",
+    "environment",
+    "atmosphere",
+    "negative_prompt",
+)
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+class StorySequence:
+    """One sequence of a story."""
+
+    __slots__ = SEQUENCE_FIELDS + ("pose_has_prefix", "extra")
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "StorySequence":
+        seq = cls.__new__(cls)
+        seq.sequence_number = data.get("sequence_number")
+        seq.clip_duration = data.get("clip_duration")
+        seq.clip_action = data.get("clip_action")
+        seq.voice_narration = data.get("voice_narration")
+        seq.type = _intern(data.get("type"))
+        seq.environment = _intern(data.get("environment"))
+        seq.atmosphere = _intern(data.get("atmosphere"))
+        seq.negative_prompt = _intern(data.get("negative_prompt"))
+
+        pose = data.get("pose")
+        seq.pose_has_prefix = type(pose) is str and pose.startswith(POSE_PREFIX)
+        seq.pose = pose[len(POSE_PREFIX):] if seq.pose_has_prefix else pose
+
+        # Fields outside the schema are kept so nothing is lost on the round trip
+        extra = None
+        for key in data:
+            if key not in SEQUENCE_FIELDS:
+                if extra is None:
+                    extra = {}
+                extra[key] = data[key]
+        seq.extra = extra
+        return seq
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {
+            "sequence_number": self.sequence_number,
+            "clip_duration": self.clip_duration,
+            "clip_action": self.clip_action,
+            "voice_narration": self.voice_narration,
+            "type": self.type,
+        }
+        if self.pose is not None:
+            data["pose"] = POSE_PREFIX + self.pose if self.pose_has_prefix else self.pose
+        data["environment"] = self.environment
+        data["atmosphere"] = self.atmosphere
+        data["negative_prompt"] = self.negative_prompt
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+class Story:
+    """A complete story; sequences are StorySequence records."""
+
+    __slots__ = ("movie_info", "character", "music_score", "sequences", "extra")
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Story":
+        story = cls.__new__(cls)
+        story.movie_info = data.get("movie_info")
+        character = data.get("character")
+        if isinstance(character, dict):
+            character = {_intern(k): _intern(v) for k, v in character.items()}
+        story.character = character
+        story.music_score = data.get("music_score")
+        story.sequences = [StorySequence.from_dict(seq) for seq in data.get("sequence", [])]
+        extra = {k: v for k, v in data.items() if k not in ("movie_info", "character", "music_score", "sequence")}
+        story.extra = extra or None
+        return story
+
+    def __len__(self):
+        return len(self.sequences)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {}
+        if self.movie_info is not None:
+            data["movie_info"] = self.movie_info
+        data["character"] = self.character
+        if self.music_score is not None:
+            data["music_score"] = self.music_score
+        if self.extra:
+            data.update(self.extra)
+        data["sequence"] = [seq.to_dict() for seq in self.sequences]
+        return data
+
+    def to_json(self) -> bytes:
+        """Serialize the story (built on demand, never kept alongside the records)."""
+        return json.dumps(self.to_dict(), separators=(",", ":")).encode("utf-8")
+
+
+class StoryCache:
+    """Thread-safe LRU cache of Story objects keyed by request."""
+
+    def __init__(self, max_entries: int = 128):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(prompt: str, genre: Optional[str], num_sequences: int) -> str:
+        return json.dumps([prompt, (genre or "").lower(), num_sequences])
+
+    def get(self, key: str) -> Optional[Story]:
+        with self._lock:
+            story = self._entries.get(key)
+            if story is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return story
+
+    def put(self, key: str, story: Story):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = story
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "max_entries": self.max_entries,
+                "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,253 @@
+import logging
+import math
+from typing import Dict, Any, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Story schema shared by the story engines (StoryGenService, olama/llama3 checkpoints).
+#
+# The schema is compiled once at import time into lookup tables: every accepted
+# key (canonical names, aliases the models like to emit, and their lower-case
+# variants) maps straight to its canonical name and coercer. Normalizing a
+# sequence is then a single pass over its keys plus a fill of whatever is still
+# missing, and every problem is reported as a structured issue instead of a
+# KeyError deep inside the chunk loop.
+
+DEFAULT_CLIP_DURATION = 3.0625
+SEQUENCE_TYPES = ("b-roll", "character")
+
+# Canonical sequence fields in prompt order: (name, type, default)
+SEQUENCE_FIELDS = [
+    ("sequence_number", int, None),  # None: position in the chunk
+    ("clip_duration", float, DEFAULT_CLIP_DURATION),
+    ("clip_action", str, ""),
+    ("voice_narration", str, ""),
+    ("type", str, "b-roll"),
+    ("environment", str, ""),
+    ("atmosphere", str, ""),
+    ("negative_prompt", str, ""),
+]
+
+# Optional fields that are coerced when present but never filled in
+OPTIONAL_SEQUENCE_FIELDS = [
+    ("pose", str),
+]
+
+SEQUENCE_ALIASES = {
+    "voice_nadration": "voice_narration",
+    "shot": "clip_action",
+    "action": "clip_action",
+    "duration": "clip_duration",
+    "narration": "voice_narration",
+    "location": "environment",
+    "setting": "environment",
+    "mood": "atmosphere",
+    "tone": "atmosphere",
+    "negative": "negative_prompt",
+    "exclude": "negative_prompt",
+}
+
+CHARACTER_FIELDS = ["base_traits", "facial_features", "distinctive_features", "clothing"]
+
+TYPE_ALIASES = {
+    "b-roll": "b-roll",
+    "broll": "b-roll",
+    "b roll": "b-roll",
+    "b_roll": "b-roll",
+    "character": "character",
+    "char": "character",
+}
+
+
+def _to_int(value):
+    if isinstance(value, bool):
+        raise ValueError("boolean is not a number")
+    return int(_to_float(value))
+
+
+def _to_float(value):
+    if isinstance(value, bool):
+        raise ValueError("boolean is not a number")
+    value = float(value)
+    # JSON allows NaN and Infinity, and 1e400 parses as inf; none of them is a usable number
+    if not math.isfinite(value):
+        raise ValueError(f"{value} is not a finite number")
+    return value
+
+
+def _to_str(value):
+    if value is None:
+        raise ValueError("null is not a string")
+    if isinstance(value, (list, tuple)):
+        # Models sometimes return descriptor lists instead of comma-joined prompts
+        return ", ".join(str(item) for item in value)
+    if isinstance(value, dict):
+        raise ValueError("object is not a string")
+    return str(value)
+
+
+_COERCERS = {int: _to_int, float: _to_float, str: _to_str}
+# Coercion failures reported as invalid_type (float() overflows on huge integers)
+_COERCE_ERRORS = (TypeError, ValueError, OverflowError)
+
+
+def _compile_sequence_schema():
+    """Build key -> (canonical name, expected type, coercer) for every accepted spelling."""
+    specs = {name: (name, field_type, _COERCERS[field_type]) for name, field_type, _ in SEQUENCE_FIELDS}
+    for name, field_type in OPTIONAL_SEQUENCE_FIELDS:
+        specs[name] = (name, field_type, _COERCERS[field_type])
+    for alias, name in SEQUENCE_ALIASES.items():
+        specs[alias] = specs[name]
+    for key in list(specs):
+        for variant in (key.upper(), key.title(), key.replace("_", " "), key.replace("_", "-")):
+            specs.setdefault(variant, specs[key])
+    return specs
+
+
+_SEQUENCE_KEYS = _compile_sequence_schema()
+_SEQUENCE_DEFAULTS = {name: default for name, _, default in SEQUENCE_FIELDS}
+_REQUIRED_NAMES = frozenset(_SEQUENCE_DEFAULTS)
+# Float fields pass the type check as NaN or inf too, so they are also checked for finiteness
+_FLOAT_NAMES = tuple(name for name, field_type, _ in SEQUENCE_FIELDS if field_type is float)
+_CANONICAL_NAMES = _REQUIRED_NAMES | {name for name, _ in OPTIONAL_SEQUENCE_FIELDS}
+
+# Key order -> value types of sequences that were already valid. Well-formed model
+# output repeats a handful of shapes, so most sequences are checked with two
+# C-level tuple builds instead of the per-key loop.
+_SHAPE_CACHE = {}
+_SHAPE_CACHE_SIZE = 256
+
+
+def issue(path: str, code: str, message: str) -> Dict[str, str]:
+    """A structured validation issue (JSON-serializable)."""
+    return {"path": path, "code": code, "message": message}
+
+
+def normalize_sequence(sequence: Dict[str, Any], index: int = 0, path: str = "sequence") -> Tuple[Dict[str, Any], List[Dict[str, str]]]:
+    """Normalize one sequence: resolve aliases, coerce types and fill defaults in a single pass."""
+    shape = tuple(sequence)
+    expected_types = _SHAPE_CACHE.get(shape)
+    if expected_types is not None and tuple(map(type, sequence.values())) == expected_types \
+            and sequence["type"] in SEQUENCE_TYPES and all(math.isfinite(sequence[name]) for name in _FLOAT_NAMES):
+        return dict(sequence), []
+
+    issues = []
+    fixed = {}
+
+    for key, value in sequence.items():
+        spec = _SEQUENCE_KEYS.get(key)
+        if spec is None:
+            spec = _SEQUENCE_KEYS.get(key.strip().lower().replace(" ", "_")) if isinstance(key, str) else None
+            if spec is None:
+                # Unknown fields pass through untouched
+                fixed[key] = value
+                continue
+        name, field_type, coerce = spec
+        if name != key and name in sequence:
+            # The canonical field wins over an alias
+            continue
+        if type(value) is not field_type or (field_type is float and not math.isfinite(value)):
+            try:
+                value = coerce(value)
+            except _COERCE_ERRORS:
+                got = repr(value) if isinstance(value, float) else type(value).__name__
+                issues.append(issue(f"{path}[{index}].{name}", "invalid_type",
+                                    f"expected {field_type.__name__}, got {got}"))
+                if name not in _SEQUENCE_DEFAULTS:
+                    continue
+                default = _SEQUENCE_DEFAULTS[name]
+                value = index + 1 if default is None else default
+        fixed[name] = value
+
+    # Fill missing required fields (the subset check runs in C, so complete sequences cost nothing here)
+    if not fixed.keys() >= _REQUIRED_NAMES:
+        for name, default in _SEQUENCE_DEFAULTS.items():
+            if name not in fixed:
+                fixed[name] = index + 1 if default is None else default
+                issues.append(issue(f"{path}[{index}].{name}", "missing", f"defaulted to {fixed[name]!r}"))
+
+    seq_type = fixed["type"]
+    if seq_type not in SEQUENCE_TYPES:
+        normalized_type = TYPE_ALIASES.get(seq_type.strip().lower())
+        if normalized_type is None:
+            normalized_type = "character" if fixed.get("pose") else "b-roll"
+            issues.append(issue(f"{path}[{index}].type", "invalid_value",
+                                f"unknown type {seq_type!r}, using {normalized_type!r}"))
+        fixed["type"] = normalized_type
+
+    if not issues and len(_SHAPE_CACHE) < _SHAPE_CACHE_SIZE and tuple(fixed) == shape \
+            and _CANONICAL_NAMES.issuperset(shape) and fixed["type"] == sequence["type"]:
+        _SHAPE_CACHE[shape] = tuple(map(type, fixed.values()))
+
+    return fixed, issues
+
+
+def normalize_character(character: Any, path: str = "character") -> Tuple[Dict[str, Any], List[Dict[str, str]]]:
+    """Normalize the character block, filling any missing trait with an empty string."""
+    issues = []
+    if not isinstance(character, dict):
+        if character is not None:
+            issues.append(issue(path, "invalid_type", f"expected object, got {type(character).__name__}"))
+        character = {}
+    fixed = dict(character)
+    for name in CHARACTER_FIELDS:
+        value = fixed.get(name)
+        if value is None:
+            fixed[name] = ""
+            issues.append(issue(f"{path}.{name}", "missing", "defaulted to ''"))
+        elif type(value) is not str:
+            try:
+                fixed[name] = _to_str(value)
+            except ValueError:
+                fixed[name] = ""
+                issues.append(issue(f"{path}.{name}", "invalid_type",
+                                    f"expected str, got {type(value).__name__}"))
+    return fixed, issues
+
+
+def normalize_story(story: Any) -> Tuple[Dict[str, Any], List[Dict[str, str]]]:
+    """Normalize a story (or a chunk of one) and collect every issue found.
+
+    Always returns a dict with a `character` object and a `sequence` list, so
+    callers can index them without guarding against KeyError.
+    """
+    if not isinstance(story, dict):
+        return {"character": normalize_character(None)[0], "sequence": []}, [
+            issue("", "invalid_type", f"expected object, got {type(story).__name__}")
+        ]
+
+    fixed = dict(story)
+    if "character" not in story:
+        fixed["character"], issues = normalize_character(None)
+        issues.insert(0, issue("character", "missing", "no character block"))
+    else:
+        fixed["character"], issues = normalize_character(story["character"])
+
+    sequences = story.get("sequence")
+    if sequences is None:
+        sequences = story.get("sequences")
+    if not isinstance(sequences, list):
+        issues.append(issue("sequence", "missing" if sequences is None else "invalid_type",
+                            "expected a list of sequences"))
+        sequences = []
+
+    fixed.pop("sequences", None)
+    fixed_sequences = []
+    for i, sequence in enumerate(sequences):
+        if not isinstance(sequence, dict):
+            issues.append(issue(f"sequence[{i}]", "invalid_type",
+                                f"expected object, got {type(sequence).__name__}; dropped"))
+            continue
+        fixed_sequence, sequence_issues = normalize_sequence(sequence, i)
+        fixed_sequences.append(fixed_sequence)
+        if sequence_issues:
+            issues.extend(sequence_issues)
+    fixed["sequence"] = fixed_sequences
+
+    return fixed, issues
+
+
+def log_issues(issues: List[Dict[str, str]], context: str = "story"):
+    """Log a compact summary of validation issues."""
+    if issues:
+        logger.warning(f"{context}: {len(issues)} schema issue(s), first: {issues[0]}")
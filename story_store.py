@@ -0,0 +1,314 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Durable store for story generation jobs.
+#
+# Every parsed chunk is checkpointed in one transaction together with its
+# renumbered sequences and the job's progress, so a restarted process can
+# rebuild the running story and continue at the next unfinished chunk.
+# Sequences live in their own table, which keeps per-chunk writes small and
+# lets GET /stories/<id> page through long stories.
+#
+# Job status: [preview ->] running | batch -> completed | failed. Jobs still
+# marked running when a process starts were interrupted and are resumed
+# (single-process deployment). A preview job only holds movie_info and
+# character until a full generation request takes it over. Batch jobs are
+# generated through provider Message Batches; batch_requests maps each
+# submitted request to its job and chunk so results can be collected after a
+# restart. prompt_stats holds what the visual generator had to drop from each
+# sequence's prompt to fit the text encoder's token budget.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    genre TEXT,
+    num_sequences INTEGER NOT NULL,
+    total_chunks INTEGER NOT NULL,
+    chunks_completed INTEGER NOT NULL DEFAULT 0,
+    cache_key TEXT,
+    request_json TEXT NOT NULL,
+    story_meta_json TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status);
+CREATE INDEX IF NOT EXISTS jobs_cache_key ON jobs(cache_key, status);
+CREATE TABLE IF NOT EXISTS chunks (
+    job_id TEXT NOT NULL,
+    chunk_number INTEGER NOT NULL,
+    chunk_json TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (job_id, chunk_number)
+);
+CREATE TABLE IF NOT EXISTS sequences (
+    job_id TEXT NOT NULL,
+    sequence_number INTEGER NOT NULL,
+    sequence_json TEXT NOT NULL,
+    PRIMARY KEY (job_id, sequence_number)
+);
+CREATE TABLE IF NOT EXISTS batch_requests (
+    batch_id TEXT NOT NULL,
+    custom_id TEXT NOT NULL,
+    job_id TEXT NOT NULL,
+    chunk_number INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (batch_id, custom_id)
+);
+CREATE INDEX IF NOT EXISTS batch_requests_status ON batch_requests(status, batch_id);
+CREATE TABLE IF NOT EXISTS prompt_stats (
+    job_id TEXT NOT NULL,
+    sequence_number INTEGER NOT NULL,
+    budget INTEGER NOT NULL,
+    tokens INTEGER NOT NULL,
+    dropped_tokens INTEGER NOT NULL,
+    dropped_json TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (job_id, sequence_number)
+);
+"""
+
+JOB_COLUMNS = ("id", "status", "prompt", "genre", "num_sequences", "total_chunks", "chunks_completed",
+               "cache_key", "request_json", "story_meta_json", "error", "created_at", "updated_at")
+
+
+def _story_meta(story: Dict[str, Any]) -> Dict[str, Any]:
+    """Everything in a story except its sequences."""
+    return {k: v for k, v in story.items() if k != "sequence"}
+
+
+class StoryStore:
+    """SQLite-backed jobs, chunk checkpoints and sequences (one connection per thread)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def create_job(self, prompt: str, genre: Optional[str], num_sequences: int, total_chunks: int,
+                   request_data: Dict[str, Any], cache_key: Optional[str] = None,
+                   job_id: Optional[str] = None, status: str = "running",
+                   story_meta: Optional[Dict[str, Any]] = None) -> str:
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, prompt, genre, num_sequences, total_chunks, cache_key,"
+                " request_json, story_meta_json, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, status, prompt, genre, num_sequences, total_chunks, cache_key, json.dumps(request_data),
+                 json.dumps(_story_meta(story_meta)) if story_meta else None, now, now),
+            )
+        return job_id
+
+    def start_preview_job(self, job_id: str, num_sequences: int, total_chunks: int,
+                          request_data: Dict[str, Any], cache_key: Optional[str] = None):
+        """Turn a preview job into a running generation with the full request's settings."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'running', num_sequences = ?, total_chunks = ?, request_json = ?,"
+                " cache_key = ?, updated_at = ? WHERE id = ? AND status = 'preview'",
+                (num_sequences, total_chunks, json.dumps(request_data), cache_key, time.time(), job_id),
+            )
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return dict(zip(JOB_COLUMNS, row)) if row else None
+
+    def save_chunk(self, job_id: str, chunk_number: int, chunk: Dict[str, Any], story_meta: Dict[str, Any]):
+        """Checkpoint a merged chunk: raw chunk, its (renumbered) sequences and job progress."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO chunks (job_id, chunk_number, chunk_json, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, chunk_number, json.dumps(chunk), now),
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO sequences (job_id, sequence_number, sequence_json) VALUES (?, ?, ?)",
+                [(job_id, seq["sequence_number"], json.dumps(seq)) for seq in chunk.get("sequence", [])],
+            )
+            conn.execute(
+                "UPDATE jobs SET chunks_completed = ?, story_meta_json = ?, updated_at = ? WHERE id = ?",
+                (chunk_number, json.dumps(_story_meta(story_meta)), now, job_id),
+            )
+
+    def complete_job(self, job_id: str, num_sequences: int):
+        """Mark a job completed, dropping sequences beyond the requested count."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sequences WHERE job_id = ? AND sequence_number > ?", (job_id, num_sequences))
+            conn.execute("UPDATE jobs SET status = 'completed', error = NULL, updated_at = ? WHERE id = ?",
+                         (time.time(), job_id))
+
+    def fail_job(self, job_id: str, error: str):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?",
+                         (error, time.time(), job_id))
+
+    def mark_running(self, job_id: str, status: str = "running"):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = ?, error = NULL, updated_at = ? WHERE id = ?",
+                         (status, time.time(), job_id))
+
+    def running_jobs(self, status: str = "running") -> List[str]:
+        rows = self._connect().execute(
+            "SELECT id FROM jobs WHERE status = ? ORDER BY created_at", (status,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def find_completed(self, cache_key: str) -> Optional[str]:
+        """Most recent completed job for a cache key."""
+        row = self._connect().execute(
+            "SELECT id FROM jobs WHERE cache_key = ? AND status = 'completed' ORDER BY updated_at DESC LIMIT 1",
+            (cache_key,),
+        ).fetchone()
+        return row[0] if row else None
+
+    def count_sequences(self, job_id: str) -> int:
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM sequences WHERE job_id = ?", (job_id,)
+        ).fetchone()[0]
+
+    def load_sequences(self, job_id: str, offset: int = 0, limit: int = -1) -> List[Dict[str, Any]]:
+        rows = self._connect().execute(
+            "SELECT sequence_json FROM sequences WHERE job_id = ? ORDER BY sequence_number LIMIT ? OFFSET ?",
+            (job_id, limit, offset),
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def load_story(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Rebuild the running story from its checkpoints (None before the first chunk)."""
+        job = self.get_job(job_id)
+        if not job or not job["story_meta_json"]:
+            return None
+        story = json.loads(job["story_meta_json"])
+        story["sequence"] = self.load_sequences(job_id)
+        return story
+
+    def load_sequence_range(self, job_id: str, first: int, last: int) -> List[Dict[str, Any]]:
+        """Sequences numbered first..last (inclusive)."""
+        rows = self._connect().execute(
+            "SELECT sequence_json FROM sequences WHERE job_id = ? AND sequence_number BETWEEN ? AND ?"
+            " ORDER BY sequence_number",
+            (job_id, first, last),
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def chunk_ranges(self, job_id: str) -> List[Dict[str, int]]:
+        """First and last sequence number produced by each chunk, in chunk order."""
+        rows = self._connect().execute(
+            "SELECT chunk_number, chunk_json FROM chunks WHERE job_id = ? ORDER BY chunk_number", (job_id,)
+        ).fetchall()
+        ranges = []
+        for chunk_number, chunk_json in rows:
+            numbers = [seq["sequence_number"] for seq in json.loads(chunk_json).get("sequence", [])]
+            if numbers:
+                ranges.append({"chunk_number": chunk_number, "first": min(numbers), "last": max(numbers)})
+        return ranges
+
+    def replace_sequences(self, job_id: str, sequences: List[Dict[str, Any]]):
+        """Overwrite stored sequences in place by sequence_number."""
+        with self._connect() as conn:
+            conn.executemany(
+                "UPDATE sequences SET sequence_json = ? WHERE job_id = ? AND sequence_number = ?",
+                [(json.dumps(seq), job_id, seq["sequence_number"]) for seq in sequences],
+            )
+            conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def add_batch(self, batch_id: str, entries: List[tuple]):
+        """Record a submitted provider batch as (custom_id, job_id, chunk_number) entries."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO batch_requests (batch_id, custom_id, job_id, chunk_number, status, created_at)"
+                " VALUES (?, ?, ?, ?, 'pending', ?)",
+                [(batch_id, custom_id, job_id, chunk_number, now) for custom_id, job_id, chunk_number in entries],
+            )
+
+    def open_batches(self) -> List[str]:
+        """Provider batches with results still to collect, oldest first."""
+        rows = self._connect().execute(
+            "SELECT batch_id FROM batch_requests WHERE status = 'pending' GROUP BY batch_id ORDER BY MIN(created_at)"
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def batch_entries(self, batch_id: str) -> List[Dict[str, Any]]:
+        rows = self._connect().execute(
+            "SELECT custom_id, job_id, chunk_number FROM batch_requests WHERE batch_id = ? AND status = 'pending'",
+            (batch_id,),
+        ).fetchall()
+        return [{"custom_id": row[0], "job_id": row[1], "chunk_number": row[2]} for row in rows]
+
+    def finish_batch_entry(self, batch_id: str, custom_id: str, status: str):
+        with self._connect() as conn:
+            conn.execute("UPDATE batch_requests SET status = ? WHERE batch_id = ? AND custom_id = ?",
+                         (status, batch_id, custom_id))
+
+    def jobs_in_batches(self) -> set:
+        """Jobs with a chunk request in a provider batch that has not been collected."""
+        rows = self._connect().execute(
+            "SELECT DISTINCT job_id FROM batch_requests WHERE status = 'pending'"
+        ).fetchall()
+        return {row[0] for row in rows}
+
+    def batch_attempts(self, job_id: str, chunk_number: int) -> int:
+        """Batch requests made so far for one chunk of a job."""
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM batch_requests WHERE job_id = ? AND chunk_number = ?", (job_id, chunk_number)
+        ).fetchone()[0]
+
+    def batch_stats(self) -> Dict[str, int]:
+        rows = self._connect().execute(
+            "SELECT status, COUNT(*) FROM batch_requests GROUP BY status"
+        ).fetchall()
+        return dict(rows)
+
+    def save_prompt_stats(self, job_id: str, budget: int, scenes: List[Dict[str, Any]]):
+        """Record the visual generator's latest token-budget report per sequence."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO prompt_stats (job_id, sequence_number, budget, tokens, dropped_tokens,"
+                " dropped_json, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(job_id, scene["sequence_number"], budget, scene.get("tokens", 0), scene.get("dropped_tokens", 0),
+                  json.dumps(scene.get("dropped", [])), now) for scene in scenes],
+            )
+
+    def prompt_stats_summary(self, job_id: str, top: int = 10) -> Optional[Dict[str, Any]]:
+        """Truncated sequences and the most often dropped terms, or None before any report."""
+        rows = self._connect().execute(
+            "SELECT sequence_number, dropped_tokens, dropped_json FROM prompt_stats WHERE job_id = ?"
+            " ORDER BY sequence_number", (job_id,)
+        ).fetchall()
+        if not rows:
+            return None
+        dropped = {}
+        for _, _, dropped_json in rows:
+            for term in json.loads(dropped_json):
+                dropped[term] = dropped.get(term, 0) + 1
+        return {
+            "sequences": len(rows),
+            "truncated_sequences": [row[0] for row in rows if row[1]],
+            "dropped_tokens": sum(row[1] for row in rows),
+            "most_dropped": sorted(dropped.items(), key=lambda item: -item[1])[:top],
+        }
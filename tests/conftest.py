@@ -0,0 +1,16 @@
+import os
+import sys
+import tempfile
+
+# Unit tests for the story service and visual generator building blocks, run offline:
+# the story service talks to the in-process fake LLM with no latency, and its job
+# store lives in a throwaway directory. The visual generator modules import each
+# other by bare name, so their directory goes on the path like the service's own.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "services", "visual_generator")]
+
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ.setdefault("FAKE_LLM_LATENCY", "constant")
+os.environ.setdefault("FAKE_LLM_LATENCY_MEAN", "0")
+os.environ.setdefault("STORY_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="dreamreel-tests-"), "stories.db"))
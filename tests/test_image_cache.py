@@ -0,0 +1,86 @@
+import threading
+
+import pytest
+
+from image_cache import ImageCache, image_key, normalize_prompt
+from pipelines import GenerationParams
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ImageCache(str(tmp_path / "cache"), max_bytes=1024)
+
+
+def test_equivalent_prompts_share_a_key():
+    params = GenerationParams(512, 512, 30, 7.5, "Blurry ,  low quality")
+    assert normalize_prompt("  A  Forest ,at dawn, ") == "a forest, at dawn"
+    assert image_key("A forest,at dawn", 7, params) == image_key("a  forest , at dawn", 7,
+                                                                  params._replace(negative_prompt="blurry, low quality"))
+    assert image_key("a forest", 7, params) != image_key("a forest", 8, params)
+
+
+def test_concurrent_lookups_share_one_render(cache):
+    future, owner = cache.lookup("k1")
+    waiting, waiter_owns = cache.lookup("k1")
+    assert owner and not waiter_owns
+    assert waiting is future and not future.done()
+
+    cache.put("k1", b"png")
+    assert waiting.result(timeout=1) == b"png"
+    hit, owner = cache.lookup("k1")
+    assert not owner and hit.result() == b"png"
+    assert cache.stats()["coalesced"] == 1 and cache.stats()["hits"] == 1
+
+
+def test_waiters_are_released_by_a_put_from_another_thread(cache):
+    future, owner = cache.lookup("k1")
+    results = []
+    waiters = [threading.Thread(target=lambda: results.append(cache.lookup("k1")[0].result(timeout=5)))
+               for _ in range(4)]
+    for waiter in waiters:
+        waiter.start()
+    cache.put("k1", b"png")
+    for waiter in waiters:
+        waiter.join(5)
+    assert results == [b"png"] * 4
+
+
+def test_failed_render_reaches_waiters_and_frees_the_key(cache):
+    future, owner = cache.lookup("k1")
+    waiting, _ = cache.lookup("k1")
+    cache.fail("k1", RuntimeError("GPU out of memory"))
+    with pytest.raises(RuntimeError, match="out of memory"):
+        waiting.result(timeout=1)
+    # The next request renders it again
+    _, owner = cache.lookup("k1")
+    assert owner
+
+
+def test_unclaimed_lookup_never_takes_ownership(cache):
+    assert cache.lookup("k1", claim=False) == (None, False)
+    future, owner = cache.lookup("k1")
+    assert owner
+
+    waiting, waiter_owns = cache.lookup("k1", claim=False)
+    assert waiting is future and not waiter_owns
+    cache.put("k1", b"png")
+    assert cache.lookup("k1", claim=False)[0].result() == b"png"
+    assert cache.stats()["misses"] == 1
+
+
+def test_least_recently_used_images_are_evicted(cache):
+    for key in ("a", "b", "c"):
+        cache.lookup(key)
+        cache.put(key, b"x" * 400)
+    assert "a" not in cache and "b" in cache and "c" in cache
+    assert cache.stats()["evictions"] == 1
+    assert cache.total_bytes == 800
+
+
+def test_images_survive_a_restart(tmp_path):
+    first = ImageCache(str(tmp_path / "cache"), max_bytes=1024)
+    first.lookup("k1")
+    first.put("k1", b"png")
+    second = ImageCache(str(tmp_path / "cache"), max_bytes=1024)
+    future, owner = second.lookup("k1")
+    assert not owner and future.result() == b"png"
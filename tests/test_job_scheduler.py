@@ -0,0 +1,89 @@
+import pytest
+
+from deadlines import Deadline, DeadlineExceeded
+from job_scheduler import FairScheduler, parse_weights
+
+
+def start_order(scheduler, tickets):
+    """Finish running tickets one at a time and return the job ids in the order they started."""
+    order = []
+    pending = list(tickets)
+    while pending:
+        started = [t for t in pending if t.started]
+        assert len(started) == 1
+        order.append(started[0].job_id)
+        pending.remove(started[0])
+        scheduler.done(started[0])
+    return order
+
+
+def test_parse_weights():
+    assert parse_weights("tenant-a=3, tenant-b=1,") == {"tenant-a": 3.0, "tenant-b": 1.0}
+    assert parse_weights("") == {}
+
+
+def test_interactive_jobs_skip_queued_batch_jobs():
+    scheduler = FairScheduler(workers=2, interactive_reserved=1)
+    batch_running = scheduler.submit("batch-1", "t", "batch")
+    batch_queued = scheduler.submit("batch-2", "t", "batch")
+    # The reserved slot stays free for interactive work
+    assert batch_running.started and not batch_queued.started
+    interactive = scheduler.submit("interactive-1", "t", "interactive")
+    assert interactive.started
+
+    waiting = scheduler.submit("interactive-2", "t", "interactive")
+    scheduler.done(interactive)
+    assert waiting.started and not batch_queued.started
+    scheduler.done(batch_running)
+    assert batch_queued.started
+
+
+def test_tenants_share_slots_by_weight():
+    scheduler = FairScheduler(workers=1, interactive_reserved=0, tenant_weights={"heavy": 2.0})
+    blocker = scheduler.submit("blocker", "other")
+    tickets = [scheduler.submit(f"light-{i}", "light") for i in range(3)]
+    tickets += [scheduler.submit(f"heavy-{i}", "heavy") for i in range(3)]
+    scheduler.done(blocker)
+    order = start_order(scheduler, tickets)
+    assert order == ["light-0", "heavy-0", "heavy-1", "light-1", "heavy-2", "light-2"]
+
+
+def test_backlogged_tenant_does_not_starve_a_newcomer():
+    scheduler = FairScheduler(workers=1, interactive_reserved=0)
+    blocker = scheduler.submit("blocker", "other")
+    tickets = [scheduler.submit(f"bulk-{i}", "bulk") for i in range(5)]
+    tickets.append(scheduler.submit("late", "late"))
+    scheduler.done(blocker)
+    assert start_order(scheduler, tickets).index("late") == 1
+
+
+def test_queue_info_reports_position():
+    scheduler = FairScheduler(workers=1, interactive_reserved=0, seconds_per_chunk=10.0)
+    running = scheduler.submit("running", "t", cost=2)
+    first = scheduler.submit("first", "t")
+    second = scheduler.submit("second", "t")
+    assert scheduler.queue_info("running")["state"] == "running"
+    assert scheduler.queue_info("first")["position"] == 0
+    info = scheduler.queue_info("second")
+    assert info["state"] == "queued" and info["position"] == 1
+    assert info["estimated_start"] > scheduler.queue_info("first")["estimated_start"]
+    assert scheduler.queue_info("unknown") is None
+    for ticket in (running, first, second):
+        scheduler.done(ticket)
+
+
+def test_expired_wait_leaves_the_queue():
+    scheduler = FairScheduler(workers=1, interactive_reserved=0)
+    running = scheduler.submit("running", "t")
+    queued = scheduler.submit("queued", "t")
+    with pytest.raises(DeadlineExceeded):
+        scheduler.wait(queued, Deadline(0.01))
+    assert scheduler.queue_info("queued") is None
+    scheduler.done(running)
+    assert not queued.started
+    assert scheduler.stats()["running"] == {"interactive": 0, "batch": 0}
+
+
+def test_unknown_priority_is_rejected():
+    with pytest.raises(ValueError):
+        FairScheduler().submit("job", "t", "urgent")
@@ -0,0 +1,161 @@
+import threading
+
+import pytest
+
+from provider_limits import AdmissionTimeout, ProviderLimiter, TokenBucket, estimate_request_tokens
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class Usage:
+    input_tokens = 10
+    output_tokens = 5
+
+
+class Result:
+    usage = Usage()
+
+
+def flaky(*statuses):
+    """A messages.create stand-in that fails with each status in turn, then succeeds."""
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        if len(calls) <= len(statuses):
+            raise StatusError(statuses[len(calls) - 1])
+        return Result()
+
+    return create, calls
+
+
+def limiter(**kwargs):
+    kwargs.setdefault("base_backoff", 0.001)
+    kwargs.setdefault("max_backoff", 0.01)
+    return ProviderLimiter(**kwargs)
+
+
+def test_estimate_counts_prompt_and_max_tokens():
+    kwargs = {"system": "s" * 40, "messages": [{"role": "user", "content": "u" * 80}], "max_tokens": 100}
+    assert estimate_request_tokens(kwargs) == 130
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(60)
+    assert bucket.wait_time(60, bucket.updated) == 0.0
+    bucket.take(60)
+    assert bucket.wait_time(1, bucket.updated) == pytest.approx(1.0)
+    # Requests larger than the bucket wait for a full bucket rather than forever
+    assert bucket.wait_time(600, bucket.updated) == pytest.approx(60.0)
+
+
+def test_success_grows_the_limit_additively():
+    provider = limiter(initial_concurrency=4)
+    for _ in range(4):
+        provider.release(provider.acquire(0), 0)
+    assert 4.9 < provider.limit < 5.0
+    assert provider.in_flight == 0
+
+
+def test_throttling_halves_the_limit_once_per_event():
+    provider = limiter(initial_concurrency=8)
+    first, second = provider.acquire(0), provider.acquire(0)
+    provider.release(first, 0, outcome="throttled", status=429)
+    assert provider.limit == 4
+    # Admitted before the decrease: part of the same congestion event
+    provider.release(second, 0, outcome="throttled", status=429)
+    assert provider.limit == 4
+    provider.release(provider.acquire(0), 0, outcome="throttled", status=529)
+    assert provider.limit == 2
+    assert provider.counters["throttled"] == 3
+
+
+def test_limit_never_drops_below_the_minimum():
+    provider = limiter(initial_concurrency=1, min_concurrency=1)
+    provider.release(provider.acquire(0), 0, outcome="throttled", status=429)
+    assert provider.limit == 1
+
+
+def test_throttled_calls_are_retried():
+    provider = limiter(initial_concurrency=8)
+    create, calls = flaky(429, 503)
+    assert isinstance(provider.call(create, max_tokens=10, messages=[]), Result)
+    assert len(calls) == 3
+    assert provider.counters["retried"] == 2 and provider.counters["succeeded"] == 1
+    assert provider.limit < 8
+
+
+def test_client_errors_are_not_retried():
+    provider = limiter()
+    create, calls = flaky(400)
+    with pytest.raises(StatusError):
+        provider.call(create, messages=[])
+    assert len(calls) == 1
+    assert provider.counters["failed"] == 1 and provider.in_flight == 0
+
+
+def test_retries_stop_at_max_retries():
+    provider = limiter(max_retries=2)
+    create, calls = flaky(500, 502, 504, 500)
+    with pytest.raises(StatusError):
+        provider.call(create, messages=[])
+    assert len(calls) == 3
+
+
+def test_backoff_honours_retry_after():
+    provider = limiter()
+    assert provider._backoff(0, StatusError(429, retry_after="2.5")) == 2.5
+
+
+def test_admission_times_out_when_the_limit_is_full():
+    provider = limiter(initial_concurrency=1, max_queue_wait=0.05)
+    admitted = provider.acquire(0)
+    with pytest.raises(AdmissionTimeout):
+        provider.acquire(0)
+    provider.release(admitted, 0)
+    assert provider.counters["rejected"] == 1
+
+
+def test_unused_tokens_are_refunded():
+    provider = limiter(tpm=1000)
+    provider.call(lambda **kwargs: Result(), max_tokens=400, messages=[])
+    assert provider.tokens.tokens == pytest.approx(1000 - 15, abs=1)
+
+
+def test_counters_add_up_under_concurrency():
+    provider = limiter(initial_concurrency=64, max_retries=1)
+    state = {"calls": 0}
+    lock = threading.Lock()
+
+    def create(**kwargs):
+        with lock:
+            state["calls"] += 1
+            number = state["calls"]
+        # Every third call is throttled once and retried; every fifth call fails outright
+        if number % 5 == 0:
+            raise StatusError(400)
+        if number % 3 == 0:
+            raise StatusError(429)
+        return Result()
+
+    def worker():
+        for _ in range(200):
+            try:
+                provider.call(create, messages=[])
+            except StatusError:
+                pass
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    stats = provider.stats()
+    assert stats["succeeded"] + stats["failed"] == 8 * 200
+    assert stats["admitted"] == state["calls"] == 8 * 200 + stats["retried"]
+    assert stats["in_flight"] == 0
@@ -0,0 +1,126 @@
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from pipelines import MAX_SEED, GenerationParams, ScenePrompt, parse_seed
+from scene_batcher import SceneBatcher
+
+SMALL = GenerationParams(64, 64, 2, 7.5, "blurry")
+LARGE = GenerationParams(128, 128, 2, 7.5, "blurry")
+
+
+class RecordingPipeline:
+    """Returns one image per prompt, tagged with its prompt; can leave images off the end of a batch."""
+
+    max_batch_size = 4
+
+    def __init__(self, missing=0):
+        self.missing = missing
+        self.calls = []
+
+    def generate(self, prompts, params, seeds):
+        self.calls.append((params, [prompt.text for prompt in prompts], list(seeds)))
+        images = []
+        for prompt in prompts:
+            image = Image.new("RGB", (params.width, params.height))
+            image.info["prompt"] = prompt.text
+            images.append(image)
+        return images[:len(images) - self.missing]
+
+
+def submit_all(batcher, scenes):
+    return [batcher.submit(ScenePrompt(text), params, seed) for text, params, seed in scenes]
+
+
+def test_scenes_are_grouped_by_params():
+    pipeline = RecordingPipeline()
+    # Only full batches go out, so the grouping does not depend on timing
+    batcher = SceneBatcher(pipeline, max_batch_size=2, max_wait=10)
+    futures = submit_all(batcher, [("a", SMALL, 1), ("b", LARGE, 2), ("c", SMALL, 3), ("d", LARGE, 4)])
+    for future in futures:
+        future.result(timeout=5)
+    assert sorted((params, texts, seeds) for params, texts, seeds in pipeline.calls) == [
+        (SMALL, ["a", "c"], [1, 3]), (LARGE, ["b", "d"], [2, 4])]
+
+
+def test_partial_batch_is_dispatched_after_max_wait():
+    pipeline = RecordingPipeline()
+    batcher = SceneBatcher(pipeline, max_wait=0.05)
+    started = time.monotonic()
+    image = batcher.submit(ScenePrompt("alone"), SMALL, 1).result(timeout=5)
+    assert time.monotonic() - started >= 0.05
+    assert image.info["prompt"] == "alone"
+    assert [texts for _, texts, _ in pipeline.calls] == [["alone"]]
+
+
+def test_full_batch_does_not_wait():
+    pipeline = RecordingPipeline()
+    batcher = SceneBatcher(pipeline, max_batch_size=2, max_wait=10)
+    futures = submit_all(batcher, [("a", SMALL, 1), ("b", SMALL, 2)])
+    assert [future.result(timeout=5).info["prompt"] for future in futures] == ["a", "b"]
+
+
+def test_images_go_back_to_the_request_that_asked():
+    pipeline = RecordingPipeline()
+    batcher = SceneBatcher(pipeline, max_wait=0.05)
+    results = {}
+
+    def request(name):
+        scenes = [{"prompt": ScenePrompt(f"{name}-{i}"), "params": SMALL, "seed": i} for i in range(3)]
+        results[name] = [image.info["prompt"] for image in batcher.generate(scenes)]
+
+    threads = [threading.Thread(target=request, args=(name,)) for name in ("x", "y")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert results == {"x": ["x-0", "x-1", "x-2"], "y": ["y-0", "y-1", "y-2"]}
+    # Six scenes of equal params fill batches of four
+    assert len(pipeline.calls) < 6
+    assert batcher.stats()["images"] == 6
+
+
+def test_scenes_without_an_image_fail():
+    pipeline = RecordingPipeline(missing=1)
+    batcher = SceneBatcher(pipeline, max_batch_size=3, max_wait=10)
+    futures = submit_all(batcher, [("a", SMALL, 1), ("b", SMALL, 2), ("c", SMALL, 3)])
+    assert futures[0].result(timeout=5).info["prompt"] == "a"
+    assert futures[1].result(timeout=5).info["prompt"] == "b"
+    with pytest.raises(RuntimeError, match="2 images for a batch of 3"):
+        futures[2].result(timeout=5)
+    assert batcher.stats()["failed_batches"] == 1
+
+
+def test_pipeline_errors_reach_every_scene_in_the_batch():
+    class BrokenPipeline(RecordingPipeline):
+        def generate(self, prompts, params, seeds):
+            raise MemoryError("CUDA out of memory")
+
+    batcher = SceneBatcher(BrokenPipeline(), max_batch_size=2, max_wait=10)
+    for future in submit_all(batcher, [("a", SMALL, 1), ("b", SMALL, 2)]):
+        with pytest.raises(MemoryError):
+            future.result(timeout=5)
+
+
+def test_params_come_from_the_request_and_the_scene():
+    params = GenerationParams.from_request({"width": "768", "height": 512.0, "steps": 20, "negative_prompt": "text"},
+                                           {"negative_prompt": "blurry"})
+    assert params == GenerationParams(768, 512, 20, 7.5, "blurry")
+
+
+@pytest.mark.parametrize("field, value", [
+    ("width", "wide"), ("height", 12.5), ("steps", [2]), ("steps", -4), ("width", True),
+    ("guidance_scale", "nan"), ("guidance_scale", "inf"), ("negative_prompt", ["blurry"]),
+])
+def test_unusable_params_name_their_field(field, value):
+    with pytest.raises(ValueError, match=field):
+        GenerationParams.from_request({field: value})
+
+
+def test_seeds_must_be_32_bit_integers():
+    assert parse_seed(7) == 7 and parse_seed("42") == 42 and parse_seed(MAX_SEED) == MAX_SEED
+    for value in ("abc", 1.5, True, None, -1, MAX_SEED + 1):
+        with pytest.raises(ValueError, match="seed"):
+            parse_seed(value)
@@ -0,0 +1,54 @@
+from status_buffer import LocalStatusSink, StatusBuffer, merge_fields
+
+
+class FlakySink:
+    """Fails the first `failures` writes, then records what it is given."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.writes = []
+
+    def write(self, docs):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("Firestore unavailable")
+        self.writes.append(docs)
+        return 1
+
+
+def test_merge_fields_merges_nested_maps():
+    doc = {"visuals": {"status": "running", "scenes": {"1": {"status": "rendered"}}}}
+    merge_fields(doc, {"visuals": {"scenes": {"2": {"status": "rendered"}}, "status": "done"}})
+    assert doc == {"visuals": {"status": "done", "scenes": {"1": {"status": "rendered"}, "2": {"status": "rendered"}}}}
+
+
+def test_updates_to_a_document_cost_one_write():
+    sink = FlakySink()
+    buffer = StatusBuffer(sink, interval=3600)
+    for rendered in range(1, 6):
+        buffer.update("p1", {"rendered": rendered})
+    buffer.update("p2", {"rendered": 1})
+    assert buffer.flush()
+    assert sink.writes == [{"p1": {"rendered": 5}, "p2": {"rendered": 1}}]
+    assert buffer.stats()["updates_per_write"] == 3.0
+
+
+def test_failed_write_is_requeued_under_newer_updates():
+    sink = FlakySink(failures=1)
+    buffer = StatusBuffer(sink, interval=3600)
+    buffer.update("p1", {"stage": "visuals", "visuals": {"rendered": 1}})
+    assert not buffer.flush()
+    assert buffer.stats()["pending"] == 1 and buffer.counters["failed_commits"] == 1
+
+    buffer.update("p1", {"visuals": {"rendered": 2}})
+    assert buffer.flush()
+    assert sink.writes == [{"p1": {"stage": "visuals", "visuals": {"rendered": 2}}}]
+    assert buffer.stats()["pending"] == 0
+
+
+def test_local_sink_merges_into_existing_documents(tmp_path):
+    sink = LocalStatusSink(str(tmp_path))
+    sink.write({"p1": {"visuals": {"status": "running", "total": 3}}})
+    sink.write({"p1": {"visuals": {"status": "done"}}})
+    assert sink.read("p1") == {"visuals": {"status": "done", "total": 3}}
+    assert sink.read("missing") == {}
@@ -0,0 +1,54 @@
+import threading
+
+import StoryGenService as service
+
+
+def post_story(body):
+    return service.app.test_client().post('/generate-cinematic-story', json=body)
+
+
+def test_concurrent_requests_for_one_story_id_generate_it_once(monkeypatch):
+    generate = service.generate_story_chunk
+    first_chunk_started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def blocking(client, prompt, chunk_number, *args, **kwargs):
+        calls.append(chunk_number)
+        first_chunk_started.set()
+        release.wait(10)
+        return generate(client, prompt, chunk_number, *args, **kwargs)
+
+    monkeypatch.setattr(service, "generate_story_chunk", blocking)
+    body = {"prompt": "a lighthouse keeper's last winter", "num_sequences": 24, "story_id": "shared-story",
+            "use_cache": False}
+    responses = {}
+    first = threading.Thread(target=lambda: responses.setdefault("first", post_story(body)))
+    first.start()
+    assert first_chunk_started.wait(10)
+
+    second = post_story(body)
+    assert second.status_code == 409
+    assert second.get_json()["story_id"] == "shared-story"
+
+    release.set()
+    first.join(10)
+    assert responses["first"].status_code == 200
+    assert calls == [1, 2, 3]
+    # Once finished, the same story_id is served from the store
+    again = post_story(body)
+    assert again.status_code == 200 and again.headers["X-Story-Id"] == "shared-story"
+    assert calls == [1, 2, 3]
+    assert "shared-story" not in service.active_jobs
+
+
+def test_claims_are_released_when_a_request_fails_before_queueing(monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(service, "queue_story_job", broken)
+    body = {"prompt": "a lighthouse", "num_sequences": 8, "story_id": "retry-story", "use_cache": False}
+    assert post_story(body).status_code == 500
+    assert "retry-story" not in service.active_jobs
+    monkeypatch.undo()
+    assert post_story(body).status_code == 200
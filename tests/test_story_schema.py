@@ -0,0 +1,109 @@
+import json
+
+import pytest
+
+from story_schema import DEFAULT_CLIP_DURATION, normalize_character, normalize_sequence, normalize_story
+
+CHARACTER = {"base_traits": "tall", "facial_features": "scar", "distinctive_features": "cane", "clothing": "coat"}
+
+
+def sequence(number=1, **fields):
+    return dict({"sequence_number": number, "clip_duration": 3.0, "clip_action": "pan", "voice_narration": "",
+                 "type": "b-roll", "environment": "harbor", "atmosphere": "fog", "negative_prompt": ""}, **fields)
+
+
+def codes(issues):
+    return {(item["path"], item["code"]) for item in issues}
+
+
+def test_valid_story_has_no_issues():
+    story = {"title": "Beacon", "character": CHARACTER, "sequence": [sequence(1), sequence(2, type="character")]}
+    fixed, issues = normalize_story(story)
+    assert issues == []
+    assert fixed == story and fixed is not story
+
+
+def test_aliases_and_variants_map_to_canonical_fields():
+    fixed, issues = normalize_sequence({"Sequence Number": "2", "duration": "4.5", "shot": "dolly in",
+                                        "narration": "Night falls.", "type": "B Roll", "location": "pier",
+                                        "mood": ["cold", "blue"], "exclude": "text"})
+    assert issues == []
+    assert fixed == {"sequence_number": 2, "clip_duration": 4.5, "clip_action": "dolly in",
+                     "voice_narration": "Night falls.", "type": "b-roll", "environment": "pier",
+                     "atmosphere": "cold, blue", "negative_prompt": "text"}
+
+
+def test_canonical_field_wins_over_an_alias():
+    fixed, _ = normalize_sequence(sequence(environment="harbor", location="pier"))
+    assert fixed["environment"] == "harbor" and "location" not in fixed
+
+
+def test_missing_fields_are_defaulted_and_reported():
+    fixed, issues = normalize_sequence({"environment": "pier"}, index=4)
+    assert fixed["sequence_number"] == 5 and fixed["clip_duration"] == DEFAULT_CLIP_DURATION
+    assert ("sequence[4].clip_action", "missing") in codes(issues)
+    assert ("sequence[4].environment", "missing") not in codes(issues)
+
+
+def test_unknown_type_is_inferred_from_the_pose():
+    fixed, issues = normalize_sequence(sequence(type="montage", pose="kneeling"))
+    assert fixed["type"] == "character"
+    assert codes(issues) == {("sequence[0].type", "invalid_value")}
+
+
+@pytest.mark.parametrize("field, value", [
+    ("sequence_number", "seven"),
+    ("sequence_number", True),
+    ("sequence_number", 1e400),
+    ("sequence_number", float("inf")),
+    ("sequence_number", "Infinity"),
+    ("sequence_number", float("nan")),
+    ("clip_duration", float("nan")),
+    ("clip_duration", float("-inf")),
+    ("clip_duration", 10 ** 400),
+    ("clip_duration", {"seconds": 3}),
+    ("environment", None),
+])
+def test_bad_values_are_invalid_type_issues(field, value):
+    fixed, issues = normalize_story({"character": CHARACTER, "sequence": [sequence(3, **{field: value})]})
+    assert codes(issues) == {(f"sequence[0].{field}", "invalid_type")}
+    if field == "sequence_number":
+        assert fixed["sequence"][0][field] == 1
+    elif field == "clip_duration":
+        assert fixed["sequence"][0][field] == DEFAULT_CLIP_DURATION
+
+
+def test_non_finite_numbers_from_json_are_rejected():
+    text = '{"sequence": [{"sequence_number": Infinity, "clip_duration": NaN}]}'
+    fixed, issues = normalize_story(json.loads(text))
+    assert {("sequence[0].sequence_number", "invalid_type"), ("sequence[0].clip_duration", "invalid_type")} \
+        <= codes(issues)
+    assert fixed["sequence"][0]["clip_duration"] == DEFAULT_CLIP_DURATION
+
+
+def test_cached_shapes_still_reject_nan():
+    # A valid sequence teaches the shape cache its key order and types
+    assert normalize_sequence(sequence())[1] == []
+    fixed, issues = normalize_sequence(sequence(clip_duration=float("nan")))
+    assert codes(issues) == {("sequence[0].clip_duration", "invalid_type")}
+    assert fixed["clip_duration"] == DEFAULT_CLIP_DURATION
+
+
+def test_malformed_stories_still_return_a_usable_shape():
+    fixed, issues = normalize_story(["not", "a", "story"])
+    assert fixed["sequence"] == [] and set(fixed["character"]) == set(CHARACTER)
+    assert codes(issues) == {("", "invalid_type")}
+
+    fixed, issues = normalize_story({"character": "tall", "sequences": [sequence(), "scene two"]})
+    assert len(fixed["sequence"]) == 1 and "sequences" not in fixed
+    assert {("character", "invalid_type"), ("sequence[1]", "invalid_type")} <= codes(issues)
+
+    _, issues = normalize_story({"character": CHARACTER, "sequence": "none"})
+    assert codes(issues) == {("sequence", "invalid_type")}
+
+
+def test_character_traits_are_coerced_or_defaulted():
+    fixed, issues = normalize_character({"base_traits": ["tall", "thin"], "facial_features": {"eyes": "grey"}})
+    assert fixed["base_traits"] == "tall, thin" and fixed["facial_features"] == ""
+    assert codes(issues) == {("character.facial_features", "invalid_type"),
+                             ("character.distinctive_features", "missing"), ("character.clothing", "missing")}
@@ -0,0 +1,81 @@
+import pytest
+
+import StoryGenService as service
+from story_store import StoryStore
+
+
+def make_chunk(count, number=1, **meta):
+    return dict(meta, sequence=[{"sequence_number": number, "description": f"scene {i}"} for i in range(count)])
+
+
+@pytest.fixture
+def store(tmp_path):
+    return StoryStore(str(tmp_path / "stories.db"))
+
+
+def test_merge_chunk_renumbers_after_the_story():
+    story = {"sequence": [{"sequence_number": 1}, {"sequence_number": 2}]}
+    service.merge_chunk(story, make_chunk(3, number=1))
+    assert [seq["sequence_number"] for seq in story["sequence"]] == [1, 2, 3, 4, 5]
+
+
+def test_store_chunk_renumbers_the_first_chunk():
+    job_id = service.story_store.create_job("a lighthouse", None, 16, 2, {})
+    # The model numbered every sequence 1; stored as 1..n so none overwrite each other
+    story = service.store_chunk(job_id, 1, make_chunk(4, title="Beacon", character={"name": "Ada"}), None)
+    story = service.store_chunk(job_id, 2, make_chunk(3), story)
+    assert [seq["sequence_number"] for seq in story["sequence"]] == list(range(1, 8))
+    assert service.story_store.count_sequences(job_id) == 7
+    assert service.story_store.chunk_ranges(job_id) == [
+        {"chunk_number": 1, "first": 1, "last": 4}, {"chunk_number": 2, "first": 5, "last": 7}]
+    assert service.story_store.load_story(job_id)["title"] == "Beacon"
+
+
+def test_checkpoints_rebuild_the_story(store):
+    job_id = store.create_job("a lighthouse", "drama", 8, 2, {"prompt": "a lighthouse"})
+    assert store.load_story(job_id) is None
+    chunk = make_chunk(2, title="Beacon")
+    for number, seq in enumerate(chunk["sequence"], 1):
+        seq["sequence_number"] = number
+    store.save_chunk(job_id, 1, chunk, chunk)
+    story = store.load_story(job_id)
+    assert story["title"] == "Beacon"
+    assert [seq["sequence_number"] for seq in story["sequence"]] == [1, 2]
+    assert store.get_job(job_id)["chunks_completed"] == 1
+    assert store.running_jobs() == [job_id]
+
+    store.complete_job(job_id, 1)
+    assert store.running_jobs() == []
+    assert store.count_sequences(job_id) == 1
+
+
+def test_interrupted_job_resumes_after_its_last_checkpoint(monkeypatch):
+    job_id = service.story_store.create_job("a lighthouse keeper's last winter", "drama", 24, 3, {})
+    generate = service.generate_story_chunk
+    generated = []
+
+    def crash_after_first_chunk(client, prompt, chunk_number, *args, **kwargs):
+        if chunk_number > 1:
+            raise RuntimeError("process killed")
+        generated.append(chunk_number)
+        return generate(client, prompt, chunk_number, *args, **kwargs)
+
+    monkeypatch.setattr(service, "generate_story_chunk", crash_after_first_chunk)
+    with pytest.raises(RuntimeError):
+        service.run_story_job(job_id)
+    first_chunk = service.story_store.load_sequences(job_id)
+    assert service.story_store.get_job(job_id)["chunks_completed"] == 1
+
+    def counting(client, prompt, chunk_number, *args, **kwargs):
+        generated.append(chunk_number)
+        return generate(client, prompt, chunk_number, *args, **kwargs)
+
+    monkeypatch.setattr(service, "generate_story_chunk", counting)
+    assert job_id in service.story_store.running_jobs()
+    story = service.run_story_job(job_id)
+
+    assert generated == [1, 2, 3]
+    numbers = [seq["sequence_number"] for seq in story["sequence"]]
+    assert numbers == list(range(1, len(numbers) + 1))
+    assert story["sequence"][:len(first_chunk)] == first_chunk
+    assert service.story_store.get_job(job_id)["status"] == "completed"
@@ -0,0 +1,125 @@
+import os
+import threading
+
+import pytest
+
+from storage_backends import LocalStorage, TransientStorageError
+from upload_stage import UploadStage
+
+
+class CountingStorage(LocalStorage):
+    """LocalStorage that counts calls and can fail chosen calls."""
+
+    def __init__(self, root, upload_failures=0, fail_chunks=(), gate=None):
+        super().__init__(root)
+        self.gate = gate
+        self.upload_failures = upload_failures
+        self.fail_chunks = set(fail_chunks)
+        self.uploads = 0
+        self.chunk_offsets = []
+        self.sessions = 0
+
+    def upload(self, name, data, content_type):
+        if self.upload_failures:
+            self.upload_failures -= 1
+            raise TransientStorageError("503")
+        if self.gate is not None:
+            self.gate.wait(timeout=5)
+        self.uploads += 1
+        return super().upload(name, data, content_type)
+
+    def start_resumable(self, name, size, content_type):
+        self.sessions += 1
+        return super().start_resumable(name, size, content_type)
+
+    def put_chunk(self, session, offset, data, size):
+        if offset in self.fail_chunks:
+            self.fail_chunks.discard(offset)
+            raise TransientStorageError("connection reset")
+        self.chunk_offsets.append(offset)
+        return super().put_chunk(session, offset, data, size)
+
+
+def stage(storage, tmp_path, **kwargs):
+    kwargs.setdefault("base_backoff", 0.001)
+    return UploadStage(storage, workers=2, state_dir=str(tmp_path / "state"), **kwargs)
+
+
+def test_same_name_uploads_once(tmp_path):
+    gate = threading.Event()
+    storage = CountingStorage(str(tmp_path / "bucket"), gate=gate)
+    uploads = stage(storage, tmp_path)
+    first = uploads.submit("visuals/k1.png", b"png")
+    second = uploads.submit("visuals/k1.png", b"png")
+    assert second is first and uploads.stats()["in_progress"] == 1
+    gate.set()
+    assert first.result(timeout=5) == storage.public_url("visuals/k1.png")
+    assert storage.uploads == 1 and uploads.stats()["deduplicated"] == 1
+
+
+def test_finished_uploads_are_not_kept_in_memory(tmp_path):
+    storage = CountingStorage(str(tmp_path / "bucket"))
+    uploads = stage(storage, tmp_path)
+    uploads.submit("visuals/k1.png", b"png").result(timeout=5)
+    assert uploads.stats()["in_progress"] == 0 and not uploads._uploads
+
+    # The storage backend still knows the object, so it is not sent again
+    assert uploads.submit("visuals/k1.png", b"png").result(timeout=5)
+    assert storage.uploads == 1 and uploads.stats()["deduplicated"] == 1
+
+
+def test_objects_already_in_storage_are_not_sent_again(tmp_path):
+    storage = CountingStorage(str(tmp_path / "bucket"))
+    stage(storage, tmp_path).submit("visuals/k1.png", b"png").result(timeout=5)
+    restarted = stage(storage, tmp_path)
+    assert restarted.submit("visuals/k1.png", b"png").result(timeout=5) == storage.public_url("visuals/k1.png")
+    assert storage.uploads == 1 and restarted.stats()["deduplicated"] == 1
+
+
+def test_transient_failures_are_retried(tmp_path):
+    storage = CountingStorage(str(tmp_path / "bucket"), upload_failures=2)
+    uploads = stage(storage, tmp_path)
+    uploads.submit("visuals/k1.png", b"png").result(timeout=5)
+    assert uploads.stats()["retries"] == 2 and storage.uploads == 1
+
+
+def test_failed_upload_can_be_submitted_again(tmp_path):
+    storage = CountingStorage(str(tmp_path / "bucket"), upload_failures=1)
+    uploads = stage(storage, tmp_path, max_retries=0)
+    with pytest.raises(TransientStorageError):
+        uploads.submit("visuals/k1.png", b"png").result(timeout=5)
+    assert uploads.submit("visuals/k1.png", b"png").result(timeout=5)
+    assert uploads.stats()["failed"] == 1
+
+
+def test_large_file_resumes_from_the_committed_offset(tmp_path):
+    source = tmp_path / "clip.mp4"
+    data = os.urandom(10 * 1024)
+    source.write_bytes(data)
+    storage = CountingStorage(str(tmp_path / "bucket"), fail_chunks={4096})
+    first = stage(storage, tmp_path, max_retries=0, chunk_size=2048, resumable_threshold=1024)
+    with pytest.raises(TransientStorageError):
+        first.submit_file("videos/clip.mp4", str(source)).result(timeout=5)
+    assert storage.chunk_offsets == [0, 2048]
+
+    # A restarted process picks the session up where the server left it
+    restarted = stage(storage, tmp_path, chunk_size=2048, resumable_threshold=1024)
+    url = restarted.submit_file("videos/clip.mp4", str(source)).result(timeout=5)
+    assert url == storage.public_url("videos/clip.mp4")
+    assert storage.sessions == 1
+    assert storage.chunk_offsets == [0, 2048, 4096, 6144, 8192]
+    assert restarted.stats()["resumed"] == 1 and restarted.stats()["bytes"] == 6 * 1024
+    assert (tmp_path / "bucket" / "videos" / "clip.mp4").read_bytes() == data
+    assert os.listdir(tmp_path / "state") == []
+
+
+def test_failed_chunk_is_resent_within_one_upload(tmp_path):
+    source = tmp_path / "clip.mp4"
+    data = os.urandom(6 * 1024)
+    source.write_bytes(data)
+    storage = CountingStorage(str(tmp_path / "bucket"), fail_chunks={2048})
+    uploads = stage(storage, tmp_path, chunk_size=2048, resumable_threshold=1024)
+    uploads.submit_file("videos/clip.mp4", str(source)).result(timeout=5)
+    assert storage.chunk_offsets == [0, 2048, 4096]
+    assert uploads.stats()["retries"] == 1 and storage.sessions == 1
+    assert (tmp_path / "bucket" / "videos" / "clip.mp4").read_bytes() == data